@@ -46,6 +46,8 @@ CREATE TABLE users (
 CREATE INDEX idx_users_phone ON users(phone);
 CREATE INDEX idx_users_email ON users(email);
 CREATE INDEX idx_users_rating ON users(rating);
+-- Keyset-пагинация списка: ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_users_created_id ON users(created_at, id);
 
 -- ----------------------------------------------------------------------------
 -- Таблица: drivers
@@ -67,7 +69,8 @@ CREATE TABLE drivers (
     is_busy BOOLEAN DEFAULT FALSE,
     current_latitude DECIMAL(10,8),
     current_longitude DECIMAL(11,8),
-    created_at TIMESTAMP DEFAULT NOW()
+    created_at TIMESTAMP DEFAULT NOW(),
+    updated_at TIMESTAMP DEFAULT NOW()
 );
 
 -- Индексы
@@ -76,6 +79,21 @@ CREATE INDEX idx_drivers_license ON drivers(license_number);
 CREATE INDEX idx_drivers_status ON drivers(is_online, is_busy);
 CREATE INDEX idx_drivers_location ON drivers(current_latitude, current_longitude);
 CREATE INDEX idx_drivers_rating ON drivers(rating);
+CREATE INDEX idx_drivers_updated_at ON drivers(updated_at);
+-- Keyset-пагинация списка: ORDER BY created_at DESC, id DESC
+CREATE INDEX idx_drivers_created_id ON drivers(created_at, id);
+
+-- updated_at - watermark для дельта-синхронизации с Redis (scripts/sync_drivers_to_redis.py)
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_drivers_updated_at
+    BEFORE UPDATE ON drivers
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
 
 -- ----------------------------------------------------------------------------
 -- Таблица: tariffs
@@ -100,14 +118,30 @@ INSERT INTO tariffs (name, base_fare, per_km, per_minute, min_fare) VALUES
     ('UberBLACK', 7.00, 3.75, 0.65, 15.00),
     ('UberSUV', 14.00, 4.50, 0.80, 25.00);
 
+-- pricing-service держит тарифы в памяти и перечитывает их по этому уведомлению
+CREATE OR REPLACE FUNCTION notify_tariffs_changed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('tariffs_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+CREATE TRIGGER trg_tariffs_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tariffs
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_tariffs_changed();
+
 -- ----------------------------------------------------------------------------
 -- Таблица: rides
--- Поездки (основная таблица, данные из датасета)
+-- Поездки (основная таблица, данные из датасета).
+-- Секционирована по месяцам pickup_datetime: секция rides_YYYY_MM, строки вне
+-- созданных секций попадают в rides_default. Секции создаёт ensure_rides_partitions()
+-- (ниже); ride-service вызывает её при старте и раз в сутки на RIDES_PARTITIONS_AHEAD месяцев вперёд
 -- ----------------------------------------------------------------------------
 
 CREATE TABLE rides (
-    -- Идентификаторы
-    id VARCHAR(50) PRIMARY KEY,
+    -- Идентификаторы. Ключ секционирования обязан входить в первичный ключ,
+    -- поэтому уникальность - по (id, pickup_datetime)
+    id VARCHAR(50) NOT NULL,
     user_id UUID REFERENCES users(id),
     driver_id UUID REFERENCES drivers(id),
     vendor_id INTEGER NOT NULL REFERENCES vendors(id),
@@ -150,15 +184,23 @@ CREATE TABLE rides (
     season VARCHAR(20),
     
     -- Метаданные
-    created_at TIMESTAMP DEFAULT NOW()
-);
+    created_at TIMESTAMP DEFAULT NOW(),
+
+    PRIMARY KEY (id, pickup_datetime)
+) PARTITION BY RANGE (pickup_datetime);
 
--- Индексы для быстрого поиска
-CREATE INDEX idx_rides_user ON rides(user_id);
-CREATE INDEX idx_rides_driver ON rides(driver_id);
+CREATE TABLE rides_default PARTITION OF rides DEFAULT;
+
+-- Индексы для быстрого поиска (создаются на каждой секции)
+-- История поездок: ключ под keyset-пагинацию, INCLUDE - остальные колонки RideSummary (index-only scan).
+-- Покрывают и поиск по одному user_id / driver_id
+CREATE INDEX idx_rides_user_history ON rides(user_id, pickup_datetime DESC, id DESC)
+    INCLUDE (driver_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
+CREATE INDEX idx_rides_driver_history ON rides(driver_id, pickup_datetime DESC, id DESC)
+    INCLUDE (user_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
 CREATE INDEX idx_rides_vendor ON rides(vendor_id);
 CREATE INDEX idx_rides_status ON rides(status);
-CREATE INDEX idx_rides_pickup_datetime ON rides(pickup_datetime);
+CREATE INDEX idx_rides_pickup_datetime_id ON rides(pickup_datetime, id);
 CREATE INDEX idx_rides_pickup_location ON rides(pickup_latitude, pickup_longitude);
 CREATE INDEX idx_rides_dropoff_location ON rides(dropoff_latitude, dropoff_longitude);
 CREATE INDEX idx_rides_pickup_district ON rides(pickup_district);
@@ -170,6 +212,44 @@ CREATE INDEX idx_rides_day_name ON rides(day_name);
 CREATE INDEX idx_rides_month_year ON rides(year, month);
 CREATE INDEX idx_rides_season ON rides(season);
 
+-- Создать недостающие месячные секции с from_date по to_date включительно.
+-- Строки нужного месяца, уже лежащие в rides_default, переносятся в новую секцию.
+-- Идемпотентна; advisory lock не даёт двум репликам создавать секции одновременно
+CREATE OR REPLACE FUNCTION ensure_rides_partitions(from_date DATE, to_date DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_rides_partitions'));
+    WHILE month_start <= to_date LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'rides_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE rides INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM rides_default WHERE pickup_datetime >= %L AND pickup_datetime < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                month_start, month_end, partition_name
+            );
+            -- Индексы родителя создаются на секции при ATTACH
+            EXECUTE format(
+                'ALTER TABLE rides ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Текущий месяц и три вперёд; секции под исторические данные создаёт загрузчик (generate_data.py)
+SELECT ensure_rides_partitions(CURRENT_DATE, (CURRENT_DATE + INTERVAL '3 months')::date);
+
 -- ----------------------------------------------------------------------------
 -- Таблица: payments
 -- Платежи за поездки
@@ -177,7 +257,8 @@ CREATE INDEX idx_rides_season ON rides(season);
 
 CREATE TABLE payments (
     id UUID PRIMARY KEY DEFAULT uuid_generate_v4(),
-    ride_id VARCHAR(50) NOT NULL REFERENCES rides(id),
+    -- Без внешнего ключа: у секционированной rides уникален только (id, pickup_datetime)
+    ride_id VARCHAR(50) NOT NULL,
     user_id UUID NOT NULL REFERENCES users(id),
     amount DECIMAL(10,2) NOT NULL,
     method VARCHAR(20) DEFAULT 'card',
@@ -196,6 +277,20 @@ CREATE INDEX idx_payments_user ON payments(user_id);
 CREATE INDEX idx_payments_status ON payments(status);
 CREATE INDEX idx_payments_created ON payments(created_at);
 
+-- ----------------------------------------------------------------------------
+-- Таблица: ride_outbox
+-- События поездок для Kafka (transactional outbox): пишутся в одной транзакции
+-- с изменением rides, ride-service переносит их в Kafka и удаляет
+-- ----------------------------------------------------------------------------
+
+CREATE TABLE ride_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    topic VARCHAR(100) NOT NULL,
+    ride_id VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
+
 -- ----------------------------------------------------------------------------
 -- Готово!
 -- ----------------------------------------------------------------------------
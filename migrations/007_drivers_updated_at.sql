@@ -0,0 +1,20 @@
+-- ============================================================================
+-- 007: drivers.updated_at - watermark для дельта-синхронизации с Redis
+-- ============================================================================
+-- Для баз, созданных до появления колонки в infrastructure/postgres/init.sql
+
+ALTER TABLE drivers ADD COLUMN IF NOT EXISTS updated_at TIMESTAMP DEFAULT NOW();
+
+CREATE INDEX IF NOT EXISTS idx_drivers_updated_at ON drivers(updated_at);
+
+CREATE OR REPLACE FUNCTION set_updated_at() RETURNS TRIGGER AS $$
+BEGIN
+    NEW.updated_at = NOW();
+    RETURN NEW;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_drivers_updated_at ON drivers;
+CREATE TRIGGER trg_drivers_updated_at
+    BEFORE UPDATE ON drivers
+    FOR EACH ROW EXECUTE FUNCTION set_updated_at();
@@ -0,0 +1,10 @@
+-- ============================================================================
+-- 008: индексы для keyset-пагинации списков (курсор по (created_at, id) / (pickup_datetime, id))
+-- ============================================================================
+
+CREATE INDEX IF NOT EXISTS idx_users_created_id ON users(created_at, id);
+CREATE INDEX IF NOT EXISTS idx_drivers_created_id ON drivers(created_at, id);
+
+-- (pickup_datetime, id) покрывает и все запросы по одному pickup_datetime
+CREATE INDEX IF NOT EXISTS idx_rides_pickup_datetime_id ON rides(pickup_datetime, id);
+DROP INDEX IF EXISTS idx_rides_pickup_datetime;
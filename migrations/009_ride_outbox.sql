@@ -0,0 +1,12 @@
+-- ============================================================================
+-- 009: transactional outbox для событий поездок (rides.created, rides.<status>)
+-- ============================================================================
+
+-- Без внешнего ключа на rides: событие должно пережить удаление поездки
+CREATE TABLE IF NOT EXISTS ride_outbox (
+    id BIGSERIAL PRIMARY KEY,
+    topic VARCHAR(100) NOT NULL,
+    ride_id VARCHAR(50) NOT NULL,
+    payload JSONB NOT NULL,
+    created_at TIMESTAMP DEFAULT NOW()
+);
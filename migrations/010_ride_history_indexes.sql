@@ -0,0 +1,14 @@
+-- ============================================================================
+-- 010: покрывающие индексы для истории поездок (/users/{id}/rides, /drivers/{id}/rides)
+-- ============================================================================
+
+-- id DESC, а не id: ORDER BY pickup_datetime DESC, id DESC и условие
+-- (pickup_datetime, id) < курсор идут по индексу только при одинаковом направлении
+CREATE INDEX IF NOT EXISTS idx_rides_user_history ON rides(user_id, pickup_datetime DESC, id DESC)
+    INCLUDE (driver_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
+CREATE INDEX IF NOT EXISTS idx_rides_driver_history ON rides(driver_id, pickup_datetime DESC, id DESC)
+    INCLUDE (user_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
+
+-- Префикс новых индексов покрывает и поиск по одному user_id / driver_id
+DROP INDEX IF EXISTS idx_rides_user;
+DROP INDEX IF EXISTS idx_rides_driver;
@@ -0,0 +1,166 @@
+-- ============================================================================
+-- 011: секционирование rides по месяцам pickup_datetime
+--
+-- Данные переносятся в новую секционированную таблицу одной транзакцией; на время
+-- переноса rides заблокирована (ACCESS EXCLUSIVE), поэтому запускать в окно
+-- обслуживания. Первичный ключ становится (id, pickup_datetime), внешний ключ
+-- payments.ride_id -> rides.id удаляется (ссылаться можно только на весь ключ).
+-- ============================================================================
+
+BEGIN;
+
+ALTER TABLE payments DROP CONSTRAINT IF EXISTS payments_ride_id_fkey;
+
+ALTER TABLE rides RENAME TO rides_legacy;
+-- Имена индексов общие на схему - освобождаем их для новой таблицы
+ALTER TABLE rides_legacy RENAME CONSTRAINT rides_pkey TO rides_legacy_pkey;
+DO $$
+DECLARE
+    r RECORD;
+BEGIN
+    FOR r IN SELECT indexrelid::regclass AS name FROM pg_index
+             WHERE indrelid = 'rides_legacy'::regclass AND NOT indisprimary LOOP
+        EXECUTE format('DROP INDEX %s', r.name);
+    END LOOP;
+END $$;
+
+CREATE TABLE rides (
+    -- Идентификаторы. Ключ секционирования обязан входить в первичный ключ,
+    -- поэтому уникальность - по (id, pickup_datetime)
+    id VARCHAR(50) NOT NULL,
+    user_id UUID REFERENCES users(id),
+    driver_id UUID REFERENCES drivers(id),
+    vendor_id INTEGER NOT NULL REFERENCES vendors(id),
+    
+    -- Время
+    pickup_datetime TIMESTAMP NOT NULL,
+    dropoff_datetime TIMESTAMP NOT NULL,
+    
+    -- Пассажиры
+    passenger_count INTEGER NOT NULL CHECK (passenger_count >= 1 AND passenger_count <= 9),
+    
+    -- Координаты подачи
+    pickup_latitude DECIMAL(10,8) NOT NULL,
+    pickup_longitude DECIMAL(11,8) NOT NULL,
+    pickup_district VARCHAR(100),
+    pickup_neighbourhood VARCHAR(100),
+    
+    -- Координаты назначения
+    dropoff_latitude DECIMAL(10,8) NOT NULL,
+    dropoff_longitude DECIMAL(11,8) NOT NULL,
+    dropoff_district VARCHAR(100),
+    dropoff_neighbourhood VARCHAR(100),
+    
+    -- Поездка
+    trip_duration INTEGER NOT NULL,
+    distance_km DECIMAL(10,2),
+    total_fare DECIMAL(10,2),
+    
+    -- Статус
+    status VARCHAR(20) DEFAULT 'completed',
+    
+    -- Аналитические поля (из датасета)
+    pickup_hour INTEGER CHECK (pickup_hour >= 0 AND pickup_hour <= 23),
+    day_period VARCHAR(20),
+    day_name VARCHAR(20),
+    weekday_or_weekend VARCHAR(10),
+    regular_day_or_holiday VARCHAR(10),
+    month INTEGER CHECK (month >= 1 AND month <= 12),
+    year INTEGER,
+    season VARCHAR(20),
+    
+    -- Метаданные
+    created_at TIMESTAMP DEFAULT NOW(),
+
+    PRIMARY KEY (id, pickup_datetime)
+) PARTITION BY RANGE (pickup_datetime);
+
+CREATE TABLE rides_default PARTITION OF rides DEFAULT;
+
+CREATE OR REPLACE FUNCTION ensure_rides_partitions(from_date DATE, to_date DATE)
+RETURNS INTEGER AS $$
+DECLARE
+    month_start DATE := date_trunc('month', from_date)::date;
+    month_end DATE;
+    partition_name TEXT;
+    created INTEGER := 0;
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('ensure_rides_partitions'));
+    WHILE month_start <= to_date LOOP
+        month_end := (month_start + INTERVAL '1 month')::date;
+        partition_name := 'rides_' || to_char(month_start, 'YYYY_MM');
+        IF to_regclass(partition_name) IS NULL THEN
+            EXECUTE format('CREATE TABLE %I (LIKE rides INCLUDING DEFAULTS INCLUDING CONSTRAINTS)', partition_name);
+            EXECUTE format(
+                'WITH moved AS (DELETE FROM rides_default WHERE pickup_datetime >= %L AND pickup_datetime < %L RETURNING *) '
+                'INSERT INTO %I SELECT * FROM moved',
+                month_start, month_end, partition_name
+            );
+            -- Индексы родителя создаются на секции при ATTACH
+            EXECUTE format(
+                'ALTER TABLE rides ATTACH PARTITION %I FOR VALUES FROM (%L) TO (%L)',
+                partition_name, month_start, month_end
+            );
+            created := created + 1;
+        END IF;
+        month_start := month_end;
+    END LOOP;
+    RETURN created;
+END;
+$$ LANGUAGE plpgsql;
+
+
+-- Секции под все имеющиеся данные и три месяца вперёд, затем перенос
+SELECT ensure_rides_partitions(
+    COALESCE((SELECT min(pickup_datetime)::date FROM rides_legacy), CURRENT_DATE),
+    GREATEST(
+        COALESCE((SELECT max(pickup_datetime)::date FROM rides_legacy), CURRENT_DATE),
+        (CURRENT_DATE + INTERVAL '3 months')::date
+    )
+);
+
+INSERT INTO rides (
+    id, user_id, driver_id, vendor_id,
+    pickup_datetime, dropoff_datetime, passenger_count,
+    pickup_latitude, pickup_longitude, pickup_district, pickup_neighbourhood,
+    dropoff_latitude, dropoff_longitude, dropoff_district, dropoff_neighbourhood,
+    trip_duration, distance_km, total_fare, status,
+    pickup_hour, day_period, day_name, weekday_or_weekend, regular_day_or_holiday,
+    month, year, season, created_at
+)
+SELECT
+    id, user_id, driver_id, vendor_id,
+    pickup_datetime, dropoff_datetime, passenger_count,
+    pickup_latitude, pickup_longitude, pickup_district, pickup_neighbourhood,
+    dropoff_latitude, dropoff_longitude, dropoff_district, dropoff_neighbourhood,
+    trip_duration, distance_km, total_fare, status,
+    pickup_hour, day_period, day_name, weekday_or_weekend, regular_day_or_holiday,
+    month, year, season, created_at
+FROM rides_legacy;
+
+DROP TABLE rides_legacy;
+
+-- Индексы строятся после загрузки - так быстрее, чем поддерживать их при вставке
+-- История поездок: ключ под keyset-пагинацию, INCLUDE - остальные колонки RideSummary (index-only scan).
+-- Покрывают и поиск по одному user_id / driver_id
+CREATE INDEX idx_rides_user_history ON rides(user_id, pickup_datetime DESC, id DESC)
+    INCLUDE (driver_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
+CREATE INDEX idx_rides_driver_history ON rides(driver_id, pickup_datetime DESC, id DESC)
+    INCLUDE (user_id, dropoff_datetime, pickup_district, dropoff_district, distance_km, total_fare, status);
+CREATE INDEX idx_rides_vendor ON rides(vendor_id);
+CREATE INDEX idx_rides_status ON rides(status);
+CREATE INDEX idx_rides_pickup_datetime_id ON rides(pickup_datetime, id);
+CREATE INDEX idx_rides_pickup_location ON rides(pickup_latitude, pickup_longitude);
+CREATE INDEX idx_rides_dropoff_location ON rides(dropoff_latitude, dropoff_longitude);
+CREATE INDEX idx_rides_pickup_district ON rides(pickup_district);
+CREATE INDEX idx_rides_dropoff_district ON rides(dropoff_district);
+
+-- Индексы для аналитики
+CREATE INDEX idx_rides_pickup_hour ON rides(pickup_hour);
+CREATE INDEX idx_rides_day_name ON rides(day_name);
+CREATE INDEX idx_rides_month_year ON rides(year, month);
+CREATE INDEX idx_rides_season ON rides(season);
+
+COMMIT;
+
+ANALYZE rides;
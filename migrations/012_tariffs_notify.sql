@@ -0,0 +1,18 @@
+-- ============================================================================
+-- 012: уведомление pricing-service об изменении тарифов
+-- ============================================================================
+-- pricing-service держит снимок активных тарифов в памяти и слушает канал
+-- tariffs_changed (LISTEN), чтобы перечитать его сразу после изменения, не
+-- дожидаясь очередного опроса (TARIFF_REFRESH_INTERVAL).
+
+CREATE OR REPLACE FUNCTION notify_tariffs_changed() RETURNS TRIGGER AS $$
+BEGIN
+    PERFORM pg_notify('tariffs_changed', '');
+    RETURN NULL;
+END;
+$$ LANGUAGE plpgsql;
+
+DROP TRIGGER IF EXISTS trg_tariffs_changed ON tariffs;
+CREATE TRIGGER trg_tariffs_changed
+    AFTER INSERT OR UPDATE OR DELETE OR TRUNCATE ON tariffs
+    FOR EACH STATEMENT EXECUTE FUNCTION notify_tariffs_changed();
@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+Матрица поправок к расстоянию и скорости для pricing-service
+
+Использование:
+    python scripts/build_road_matrix.py                          # все завершённые поездки → data/road_matrix
+    python scripts/build_road_matrix.py --since 2016-03-01       # только поездки с этой даты
+    python scripts/build_road_matrix.py --cell-size 0.01 --min-samples 10 --output /tmp/road_matrix
+
+Что делает:
+    1. Читает из rides координаты, pickup_datetime, distance_km и trip_duration
+       серверным курсором (без fetchall всей таблицы)
+    2. Делит город на клетки --cell-size градусов и для каждой пары клеток
+       (подача → назначение) считает медиану отношения дорожного расстояния к прямому
+       (haversine) и медианную скорость по часам недели (168 часов, пн 00:00 = 0)
+    3. Сохраняет результат каталогом .npy-файлов, которые pricing-service открывает
+       через np.load(mmap_mode="r") - поиск поправки для поездки O(1), без копии в памяти
+
+Файлы в каталоге:
+    meta.json          - сетка (bbox, размер клетки), глобальные медианы, статистика
+    pair_index.npy     - int32 [клетки × клетки]: строка пары в ratio/speed или -1
+    ratio.npy          - float32 [пары]: медиана дорога / прямая
+    speed.npy          - float32 [пары × 168]: медианная скорость, км/ч (NaN - мало данных)
+    global_speed.npy   - float32 [168]: медианная скорость по всему городу, км/ч
+
+Пара или час недели, для которых поездок меньше --min-samples, в pricing-service
+заменяются глобальными медианами. Каталог пишется рядом и подменяется целиком,
+поэтому pricing-service не увидит наполовину записанную матрицу.
+"""
+
+import argparse
+import json
+import os
+import shutil
+import sys
+from datetime import datetime, timezone
+
+import numpy as np
+import psycopg2
+from dotenv import load_dotenv
+
+# Загружаем переменные окружения
+load_dotenv()
+
+CHUNK_SIZE = 50000
+HOURS_PER_WEEK = 168
+# Радиус Земли как в PricingCalculator (3958.8 миль), в км
+EARTH_RADIUS_KM = 3958.8 * 1.609344
+# Нью-Йорк с запасом: lat_min, lat_max, lon_min, lon_max
+BBOX = (40.49, 40.92, -74.27, -73.68)
+# Фильтры шума: короткие поездки дают огромные отношения, а явные ошибки датасета -
+# отношения меньше 1 и нереальные скорости
+MIN_STRAIGHT_KM = 0.3
+MIN_RATIO, MAX_RATIO = 0.9, 5.0
+MIN_SPEED_KMH, MAX_SPEED_KMH = 2.0, 120.0
+
+
+def get_pg_connection():
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=os.getenv("POSTGRES_PORT", 5432),
+        database=os.getenv("POSTGRES_DB", "uber"),
+        user=os.getenv("POSTGRES_USER", "uber"),
+        password=os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
+    )
+
+
+def stream_rides(pg_conn, since, chunk_size: int):
+    """Отдавать поездки пачками массивов через серверный курсор"""
+    where = "status = 'completed' AND distance_km > 0 AND trip_duration > 0 AND dropoff_latitude IS NOT NULL"
+    params = ()
+    if since:
+        where += " AND pickup_datetime >= %s"
+        params = (since,)
+    with pg_conn.cursor(name="build_road_matrix") as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(f"""
+            SELECT pickup_latitude::float8, pickup_longitude::float8,
+                   dropoff_latitude::float8, dropoff_longitude::float8,
+                   distance_km::float8, trip_duration,
+                   (EXTRACT(ISODOW FROM pickup_datetime)::int - 1) * 24 + EXTRACT(HOUR FROM pickup_datetime)::int
+            FROM rides
+            WHERE {where}
+        """, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield np.array(rows, dtype=np.float64)
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1 - a))
+
+
+class Grid:
+    def __init__(self, bbox, cell_size: float):
+        self.lat_min, lat_max, self.lon_min, lon_max = bbox
+        self.cell_size = cell_size
+        self.n_lat = int(np.ceil((lat_max - self.lat_min) / cell_size))
+        self.n_lon = int(np.ceil((lon_max - self.lon_min) / cell_size))
+        self.n_cells = self.n_lat * self.n_lon
+
+    def cells(self, lat, lon):
+        """Номер клетки или -1 за пределами сетки (та же формула, что в pricing-service)"""
+        i = np.floor((lat - self.lat_min) / self.cell_size).astype(np.int64)
+        j = np.floor((lon - self.lon_min) / self.cell_size).astype(np.int64)
+        inside = (i >= 0) & (i < self.n_lat) & (j >= 0) & (j < self.n_lon)
+        return np.where(inside, i * self.n_lon + j, -1)
+
+    def meta(self) -> dict:
+        return {
+            "lat_min": self.lat_min, "lon_min": self.lon_min, "cell_size": self.cell_size,
+            "n_lat": self.n_lat, "n_lon": self.n_lon,
+        }
+
+
+def prepare_chunk(grid: Grid, chunk):
+    """(пара клеток, час недели, отношение, скорость км/ч) для годных поездок пачки"""
+    plat, plon, dlat, dlon, distance_km, duration, hour_of_week = chunk.T
+    straight = haversine_km(plat, plon, dlat, dlon)
+    ratio = distance_km / np.maximum(straight, 1e-9)
+    speed = distance_km / (duration / 3600)
+    origin, destination = grid.cells(plat, plon), grid.cells(dlat, dlon)
+    ok = (
+        (straight >= MIN_STRAIGHT_KM)
+        & (ratio >= MIN_RATIO) & (ratio <= MAX_RATIO)
+        & (speed >= MIN_SPEED_KMH) & (speed <= MAX_SPEED_KMH)
+        & (origin >= 0) & (destination >= 0)
+    )
+    pair = origin[ok] * grid.n_cells + destination[ok]
+    return pair, hour_of_week[ok].astype(np.int64), ratio[ok], speed[ok]
+
+
+def group_medians(keys, values):
+    """(уникальные ключи, медианы, число значений) - сортировкой, без цикла по группам"""
+    order = np.lexsort((values, keys))
+    keys, values = keys[order], values[order]
+    unique, starts, counts = np.unique(keys, return_index=True, return_counts=True)
+    low = values[starts + (counts - 1) // 2]
+    high = values[starts + counts // 2]
+    return unique, (low + high) / 2, counts
+
+
+def build(grid: Grid, pair, hour_of_week, ratio, speed, min_samples: int) -> dict:
+    """Массивы матрицы из подготовленных поездок"""
+    if len(pair) == 0:
+        raise ValueError("no usable rides: nothing to build the matrix from")
+
+    pairs, pair_ratio, pair_counts = group_medians(pair, ratio)
+    keep = pair_counts >= min_samples
+    pairs, pair_ratio = pairs[keep], pair_ratio[keep]
+
+    pair_index = np.full(grid.n_cells * grid.n_cells, -1, dtype=np.int32)
+    pair_index[pairs] = np.arange(len(pairs), dtype=np.int32)
+
+    speed_matrix = np.full((len(pairs), HOURS_PER_WEEK), np.nan, dtype=np.float32)
+    rows = pair_index[pair]
+    known = rows >= 0
+    slots, slot_speed, slot_counts = group_medians(rows[known] * HOURS_PER_WEEK + hour_of_week[known], speed[known])
+    enough = slot_counts >= min_samples
+    speed_matrix.reshape(-1)[slots[enough]] = slot_speed[enough]
+
+    hours, hour_speed, hour_counts = group_medians(hour_of_week, speed)
+    overall_speed = float(np.median(speed))
+    global_speed = np.full(HOURS_PER_WEEK, overall_speed, dtype=np.float32)
+    global_speed[hours[hour_counts >= min_samples]] = hour_speed[hour_counts >= min_samples]
+
+    return {
+        "pair_index": pair_index.reshape(grid.n_cells, grid.n_cells),
+        "ratio": pair_ratio.astype(np.float32),
+        "speed": speed_matrix,
+        "global_speed": global_speed,
+        "meta": {
+            **grid.meta(),
+            "ratio": float(np.median(ratio)),
+            "speed": overall_speed,
+            "min_samples": min_samples,
+            "rides": int(len(pair)),
+            "pairs": int(len(pairs)),
+            "speed_slots": int(enough.sum()),
+            "built_at": datetime.now(timezone.utc).isoformat(),
+        },
+    }
+
+
+def save(matrix: dict, output: str):
+    """Записать во временный каталог и подменить им output целиком"""
+    tmp = output.rstrip("/") + ".tmp"
+    shutil.rmtree(tmp, ignore_errors=True)
+    os.makedirs(tmp)
+    for name in ("pair_index", "ratio", "speed", "global_speed"):
+        np.save(os.path.join(tmp, f"{name}.npy"), matrix[name])
+    with open(os.path.join(tmp, "meta.json"), "w") as f:
+        json.dump(matrix["meta"], f, indent=2)
+
+    old = output.rstrip("/") + ".old"
+    shutil.rmtree(old, ignore_errors=True)
+    if os.path.exists(output):
+        os.rename(output, old)
+    os.rename(tmp, output)
+    shutil.rmtree(old, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Матрица поправок расстояния и скорости из истории поездок")
+    parser.add_argument("--output", default="data/road_matrix",
+                        help="каталог матрицы (ROAD_MATRIX_PATH pricing-service)")
+    parser.add_argument("--cell-size", type=float, default=0.02, help="размер клетки в градусах (0.02 ≈ 2 км)")
+    parser.add_argument("--min-samples", type=int, default=5, help="минимум поездок на пару клеток и на час недели")
+    parser.add_argument("--since", type=lambda s: datetime.fromisoformat(s), help="только поездки с этой даты")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="строк на одну выборку курсора")
+    args = parser.parse_args()
+
+    grid = Grid(BBOX, args.cell_size)
+    print(f"🗺️  Сетка {grid.n_lat}×{grid.n_lon} клеток по {args.cell_size}°")
+
+    try:
+        pg_conn = get_pg_connection()
+        print("✅ Подключено к PostgreSQL")
+    except Exception as e:
+        print(f"❌ Ошибка подключения к PostgreSQL: {e}")
+        return 1
+
+    parts = []
+    total = 0
+    try:
+        for chunk in stream_rides(pg_conn, args.since, args.chunk_size):
+            total += len(chunk)
+            parts.append(prepare_chunk(grid, chunk))
+            print(f"   Прочитано поездок: {total}", end="\r")
+    finally:
+        pg_conn.close()
+    print()
+
+    if not parts:
+        print("❌ Нет завершённых поездок с distance_km и trip_duration")
+        return 1
+    pair, hour_of_week, ratio, speed = (np.concatenate(column) for column in zip(*parts))
+    try:
+        matrix = build(grid, pair, hour_of_week, ratio, speed, args.min_samples)
+    except ValueError as e:
+        print(f"❌ {e}")
+        return 1
+    save(matrix, args.output)
+
+    meta = matrix["meta"]
+    size_mb = sum(os.path.getsize(os.path.join(args.output, f)) for f in os.listdir(args.output)) / 2 ** 20
+    print(f"📊 Годных поездок: {meta['rides']} из {total}")
+    print(f"   Пар клеток с поправкой: {meta['pairs']}, часов недели со скоростью: {meta['speed_slots']}")
+    print(f"   Медиана дорога/прямая: {meta['ratio']:.3f}, медианная скорость: {meta['speed']:.1f} км/ч")
+    print(f"✅ Матрица записана в {args.output} ({size_mb:.1f} МБ)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -248,6 +248,17 @@ def load_rides(conn, user_ids, driver_ids):
     cursor = conn.cursor()
     rides_inserted = 0
     
+    # rides секционирована по месяцам: создаём секции под весь период датасета,
+    # иначе поездки лягут в rides_default
+    pickup_dates = pd.to_datetime(df['pickup_datetime'], errors='coerce').dropna()
+    if not pickup_dates.empty:
+        cursor.execute(
+            "SELECT ensure_rides_partitions(%s, %s)",
+            (pickup_dates.min().date(), pickup_dates.max().date())
+        )
+        print(f"   Секций rides создано: {cursor.fetchone()[0]}")
+        conn.commit()
+    
     print("\n   Обработка и вставка поездок...")
     
     for i in tqdm(range(0, len(df), BATCH_SIZE)):
@@ -431,7 +442,7 @@ def load_rides(conn, user_ids, driver_ids):
                         month, year, season, created_at
                     )
                     VALUES %s
-                    ON CONFLICT (id) DO NOTHING
+                    ON CONFLICT (id, pickup_datetime) DO NOTHING
                     """,
                     rides
                 )
@@ -1,89 +1,280 @@
 #!/usr/bin/env python3
 """
 Синхронизация онлайн водителей из PostgreSQL в Redis
+
+Использование:
+    python scripts/sync_drivers_to_redis.py            # дельта по drivers.updated_at (полная при первом запуске)
+    python scripts/sync_drivers_to_redis.py --full     # полная синхронизация с удалением лишних из drivers:online
+    python scripts/sync_drivers_to_redis.py --verify   # только сравнить Redis с PostgreSQL и показать расхождения
+
+Что делает:
+    1. Читает водителей серверным курсором (без fetchall всей таблицы)
+    2. Пишет в Redis пачками через pipeline: один GEOADD на пачку + HSET на водителя
+    3. Убирает из drivers:online тех, кто ушёл с линии
+    4. Запоминает watermark (время запуска), следующий запуск берёт только изменения
+
+drivers:last_seen получает drivers.updated_at: водителя, который давно не присылал
+пингов, свипер driver-service уберёт при следующем проходе.
 """
 
+import argparse
+import math
+import os
+import sys
+from datetime import datetime, timedelta, timezone
+
 import psycopg2
 import redis
-import os
 from dotenv import load_dotenv
-from decimal import Decimal  # ← добавим для явного преобразования
 
 # Загружаем переменные окружения
 load_dotenv()
 
+GEO_KEY = "drivers:online"
+LAST_SEEN_KEY = "drivers:last_seen"
+LOCATION_KEY = "driver:location:{}"
+WATERMARK_KEY = "drivers:sync:watermark"
+
+CHUNK_SIZE = 1000
+# Транзакция, начатая до запуска, может закоммитить строку со "старым" updated_at уже
+# после чтения - поэтому каждая дельта перечитывает небольшое окно до watermark
+WATERMARK_OVERLAP = timedelta(seconds=30)
+# Расхождение позиции в Redis и PostgreSQL, которое --verify считает дрейфом.
+# PostgreSQL отстаёт от Redis на LOCATION_FLUSH_INTERVAL driver-service, поэтому с запасом
+DRIFT_THRESHOLD_METERS = 200
+
+
+def get_pg_connection():
+    return psycopg2.connect(
+        host=os.getenv("POSTGRES_HOST", "localhost"),
+        port=os.getenv("POSTGRES_PORT", 5432),
+        database=os.getenv("POSTGRES_DB", "uber"),
+        user=os.getenv("POSTGRES_USER", "uber"),
+        password=os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
+    )
+
+
+def get_redis_client():
+    return redis.Redis(
+        host=os.getenv("REDIS_HOST", "localhost"),
+        port=int(os.getenv("REDIS_PORT", 6379)),
+        db=0,
+        decode_responses=True
+    )
+
+
+def stream_drivers(pg_conn, where: str, params: tuple, chunk_size: int):
+    """Отдавать водителей пачками через серверный курсор"""
+    with pg_conn.cursor(name="sync_drivers_to_redis") as cursor:
+        cursor.itersize = chunk_size
+        cursor.execute(f"""
+            SELECT id, is_online, current_latitude, current_longitude, updated_at
+            FROM drivers
+            WHERE {where}
+        """, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
+
+
+def is_on_map(is_online, lat, lon) -> bool:
+    return bool(is_online) and lat is not None and lon is not None
+
+
+def write_chunk(r, rows) -> tuple:
+    """Записать пачку одним pipeline. Возвращает (добавлено, удалено)"""
+    pipe = r.pipeline(transaction=False)
+    geo_values = []
+    last_seen = {}
+    offline_ids = []
+
+    for driver_id, is_online, lat, lon, updated_at in rows:
+        driver_id = str(driver_id)
+        if not is_on_map(is_online, lat, lon):
+            offline_ids.append(driver_id)
+            continue
+
+        # Decimal → float
+        lat_float, lon_float = float(lat), float(lon)
+        geo_values.extend([lon_float, lat_float, driver_id])
+        # updated_at в PostgreSQL - TIMESTAMP без зоны, пишется в UTC
+        seen_at = updated_at.replace(tzinfo=timezone.utc) if updated_at else datetime.now(timezone.utc)
+        last_seen[driver_id] = seen_at.timestamp()
+        pipe.hset(LOCATION_KEY.format(driver_id), mapping={
+            "latitude": str(lat_float),
+            "longitude": str(lon_float),
+            "updated_at": seen_at.isoformat()
+        })
+
+    if geo_values:
+        pipe.geoadd(GEO_KEY, geo_values)
+        # GT - не откатываем отметку, которую driver-service уже обновил по свежему пингу
+        pipe.zadd(LAST_SEEN_KEY, last_seen, gt=True)
+    if offline_ids:
+        pipe.zrem(GEO_KEY, *offline_ids)
+        pipe.zrem(LAST_SEEN_KEY, *offline_ids)
+        pipe.delete(*[LOCATION_KEY.format(i) for i in offline_ids])
+
+    pipe.execute()
+    return len(geo_values) // 3, len(offline_ids)
+
+
+def remove_stale(pg_conn, r, online_ids: set, chunk_size: int) -> int:
+    """Убрать из drivers:online тех, кого нет среди онлайн водителей в PostgreSQL"""
+    stale = [m for m in r.zrange(GEO_KEY, 0, -1) if m not in online_ids]
+    if not stale:
+        return 0
+
+    # Пока шла синхронизация, кто-то мог выйти на линию через driver-service - перепроверяем
+    with pg_conn.cursor() as cursor:
+        cursor.execute(
+            "SELECT id::text FROM drivers WHERE id = ANY(%s::uuid[]) AND is_online = true",
+            (stale,)
+        )
+        came_online = {row[0] for row in cursor.fetchall()}
+    stale = [m for m in stale if m not in came_online]
+
+    for i in range(0, len(stale), chunk_size):
+        chunk = stale[i:i + chunk_size]
+        pipe = r.pipeline(transaction=False)
+        pipe.zrem(GEO_KEY, *chunk)
+        pipe.zrem(LAST_SEEN_KEY, *chunk)
+        pipe.delete(*[LOCATION_KEY.format(m) for m in chunk])
+        pipe.execute()
+    return len(stale)
+
+
+def db_now(pg_conn) -> datetime:
+    with pg_conn.cursor() as cursor:
+        cursor.execute("SELECT NOW()::timestamp")
+        return cursor.fetchone()[0]
+
+
+def sync(pg_conn, r, full: bool, chunk_size: int):
+    watermark = None if full else r.get(WATERMARK_KEY)
+    # Фиксируем время до чтения: всё, что изменится позже, попадёт в следующую дельту
+    started_at = db_now(pg_conn)
+
+    if watermark:
+        since = datetime.fromisoformat(watermark) - WATERMARK_OVERLAP
+        print(f"🔄 Дельта-синхронизация: изменения с {since.isoformat()}")
+        # Берём и ушедших с линии - их нужно убрать из GEOSET
+        where, params = "updated_at > %s", (since,)
+    else:
+        print("🔄 Полная синхронизация")
+        where, params = (
+            "is_online = true AND current_latitude IS NOT NULL AND current_longitude IS NOT NULL",
+            ()
+        )
+
+    added = removed = 0
+    online_ids = set()
+    for rows in stream_drivers(pg_conn, where, params, chunk_size):
+        chunk_added, chunk_removed = write_chunk(r, rows)
+        added += chunk_added
+        removed += chunk_removed
+        if not watermark:
+            online_ids.update(str(row[0]) for row in rows)
+    pg_conn.commit()
+
+    if not watermark:
+        # Удалённые из таблицы водители в дельту не попадают - их чистит полная синхронизация
+        removed += remove_stale(pg_conn, r, online_ids, chunk_size)
+
+    r.set(WATERMARK_KEY, started_at.isoformat())
+    print(f"✅ Синхронизировано {added} водителей, удалено из {GEO_KEY}: {removed}")
+
+
+def haversine_meters(lat1, lon1, lat2, lon2) -> float:
+    R = 6371000
+    d_lat = math.radians(lat2 - lat1)
+    d_lon = math.radians(lon2 - lon1)
+    a = math.sin(d_lat / 2) ** 2 + \
+        math.cos(math.radians(lat1)) * math.cos(math.radians(lat2)) * math.sin(d_lon / 2) ** 2
+    return R * 2 * math.atan2(math.sqrt(a), math.sqrt(1 - a))
+
+
+def verify(pg_conn, r, chunk_size: int) -> int:
+    """Сравнить drivers:online с PostgreSQL. Возвращает число расхождений"""
+    redis_members = set(r.zrange(GEO_KEY, 0, -1))
+    missing, drifted = [], []
+    online_ids = set()
+
+    where = "is_online = true AND current_latitude IS NOT NULL AND current_longitude IS NOT NULL"
+    for rows in stream_drivers(pg_conn, where, (), chunk_size):
+        ids = [str(row[0]) for row in rows]
+        online_ids.update(ids)
+        positions = r.geopos(GEO_KEY, *ids)
+        for (driver_id, _, lat, lon, _), pos in zip(rows, positions):
+            driver_id = str(driver_id)
+            if pos is None:
+                missing.append(driver_id)
+                continue
+            distance = haversine_meters(float(lat), float(lon), pos[1], pos[0])
+            if distance > DRIFT_THRESHOLD_METERS:
+                drifted.append((driver_id, distance))
+    pg_conn.commit()
+
+    stale = sorted(redis_members - online_ids)
+
+    print(f"📊 PostgreSQL онлайн: {len(online_ids)}, Redis {GEO_KEY}: {len(redis_members)}")
+    print(f"   Нет в Redis:              {len(missing)}")
+    print(f"   Лишние в Redis:           {len(stale)}")
+    print(f"   Позиция отличается > {DRIFT_THRESHOLD_METERS} м: {len(drifted)}")
+    for driver_id in missing[:10]:
+        print(f"   - нет в Redis: {driver_id}")
+    for driver_id in stale[:10]:
+        print(f"   - лишний в Redis: {driver_id}")
+    for driver_id, distance in sorted(drifted, key=lambda d: -d[1])[:10]:
+        print(f"   - дрейф {distance:.0f} м: {driver_id}")
+
+    total = len(missing) + len(stale) + len(drifted)
+    if total:
+        print(f"❌ Найдено расхождений: {total}")
+    else:
+        print("✅ Redis совпадает с PostgreSQL")
+    return total
+
+
 def main():
+    parser = argparse.ArgumentParser(description="Синхронизация онлайн водителей PostgreSQL → Redis")
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument("--full", action="store_true", help="полная синхронизация вместо дельты")
+    mode.add_argument("--verify", action="store_true", help="только сравнить Redis с PostgreSQL")
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE, help="размер пачки для курсора и pipeline")
+    args = parser.parse_args()
+
     # Подключение к PostgreSQL
     try:
-        pg_conn = psycopg2.connect(
-            host=os.getenv("POSTGRES_HOST", "localhost"),
-            port=os.getenv("POSTGRES_PORT", 5432),
-            database=os.getenv("POSTGRES_DB", "uber"),
-            user=os.getenv("POSTGRES_USER", "uber"),
-            password=os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
-        )
+        pg_conn = get_pg_connection()
         print("✅ Подключено к PostgreSQL")
     except Exception as e:
         print(f"❌ Ошибка подключения к PostgreSQL: {e}")
-        return
+        return 1
 
     # Подключение к Redis
     try:
-        r = redis.Redis(
-            host=os.getenv("REDIS_HOST", "localhost"),
-            port=int(os.getenv("REDIS_PORT", 6379)),
-            db=0,
-            decode_responses=True
-        )
+        r = get_redis_client()
         r.ping()
         print("✅ Подключено к Redis")
     except Exception as e:
         print(f"❌ Ошибка подключения к Redis: {e}")
-        return
+        pg_conn.close()
+        return 1
 
     try:
-        cursor = pg_conn.cursor()
-        
-        # Получаем онлайн водителей с координатами
-        cursor.execute("""
-            SELECT id, current_latitude, current_longitude 
-            FROM drivers 
-            WHERE is_online = true 
-              AND current_latitude IS NOT NULL 
-              AND current_longitude IS NOT NULL
-        """)
-        
-        drivers = cursor.fetchall()
-        print(f"✅ Найдено онлайн водителей с координатами: {len(drivers)}")
-        
-        added = 0
-        for driver_id, lat, lon in drivers:
-            try:
-                # 🔧 Преобразуем Decimal → float
-                lat_float = float(lat) if isinstance(lat, Decimal) else lat
-                lon_float = float(lon) if isinstance(lon, Decimal) else lon
-
-                # Добавляем в GEOSET
-                r.geoadd("drivers:online", [lon_float, lat_float, driver_id])
-                
-                # Сохраняем детали
-                r.hset(f"driver:location:{driver_id}", mapping={
-                    "latitude": str(lat_float),
-                    "longitude": str(lon_float),
-                    "updated_at": "2024-01-15T12:00:00Z"
-                })
-                added += 1
-            except Exception as e:
-                print(f"❌ Ошибка при добавлении {driver_id}: {e}")
-        
-        print(f"✅ Синхронизировано {added} водителей в Redis")
-        
+        if args.verify:
+            return 1 if verify(pg_conn, r, args.chunk_size) else 0
+        sync(pg_conn, r, args.full, args.chunk_size)
+        return 0
     except Exception as e:
         print(f"❌ Ошибка выполнения: {e}")
         raise
     finally:
-        cursor.close()
         pg_conn.close()
 
+
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк поиска водителей рядом: in-memory индекс (geo_index.py) против Redis GEOSEARCH.
+
+Использование (из services/driver-service):
+    python benchmarks/bench_nearby.py                      # только in-memory индекс
+    python benchmarks/bench_nearby.py --redis-host localhost
+    python benchmarks/bench_nearby.py --drivers 50000 --queries 2000 --k 10 --radius 3000
+
+Водители раскидываются по bbox Москвы, в Redis пишутся во временный ключ
+bench:drivers:online (после прогона удаляется). Результаты индекса
+сверяются с полным перебором.
+"""
+import argparse
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from geo_index import DriverGeoIndex, haversine_m  # noqa: E402
+
+BBOX = (55.55, 55.95, 37.35, 37.85)  # lat_min, lat_max, lon_min, lon_max
+BENCH_KEY = "bench:drivers:online"
+
+
+def percentiles(samples):
+    arr = np.array(samples) * 1000
+    return f"p50={np.percentile(arr, 50):.3f} ms  p99={np.percentile(arr, 99):.3f} ms  " \
+           f"qps={len(arr) / (arr.sum() / 1000):.0f}"
+
+
+def timed(fn, points):
+    samples = []
+    results = []
+    for lat, lon in points:
+        started = time.perf_counter()
+        results.append(fn(lat, lon))
+        samples.append(time.perf_counter() - started)
+    return samples, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="In-memory geo index vs Redis GEOSEARCH")
+    parser.add_argument("--drivers", type=int, default=50000)
+    parser.add_argument("--queries", type=int, default=2000)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--radius", type=float, default=3000, help="радиус в метрах")
+    parser.add_argument("--cell-size", type=float, default=0.01)
+    parser.add_argument("--redis-host", default=None)
+    parser.add_argument("--redis-port", type=int, default=6379)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(42)
+    lat_min, lat_max, lon_min, lon_max = BBOX
+    lats = rng.uniform(lat_min, lat_max, args.drivers)
+    lons = rng.uniform(lon_min, lon_max, args.drivers)
+    ids = [f"driver-{i}" for i in range(args.drivers)]
+    points = list(zip(rng.uniform(lat_min, lat_max, args.queries), rng.uniform(lon_min, lon_max, args.queries)))
+
+    index = DriverGeoIndex(args.cell_size, refresh_interval=0)
+    started = time.perf_counter()
+    index.rebuild(zip(ids, lats, lons))
+    print(f"📦 Индекс на {args.drivers} водителей собран за {(time.perf_counter() - started) * 1000:.0f} мс")
+
+    knn_samples, knn_results = timed(lambda lat, lon: index.nearest(lat, lon, args.k, 50000), points)
+    radius_samples, radius_results = timed(lambda lat, lon: index.within_radius(lat, lon, args.radius), points)
+    print(f"🧭 index k-NN (k={args.k}):        {percentiles(knn_samples)}")
+    print(f"🧭 index radius ({args.radius:.0f} м):   {percentiles(radius_samples)}")
+
+    # Сверка с полным перебором на части запросов
+    for (lat, lon), knn, in_radius in list(zip(points, knn_results, radius_results))[:200]:
+        distances = haversine_m(lat, lon, lats, lons)
+        expected_knn = np.sort(distances)[:args.k]
+        assert np.allclose([d["distance_m"] for d in knn], expected_knn), "k-NN расходится с перебором"
+        assert len(in_radius) == int((distances <= args.radius).sum()), "radius расходится с перебором"
+    print("✅ Результаты совпадают с полным перебором")
+
+    if not args.redis_host:
+        print("ℹ️  --redis-host не задан, сравнение с GEOSEARCH пропущено")
+        return 0
+
+    import redis
+    r = redis.Redis(host=args.redis_host, port=args.redis_port, decode_responses=True)
+    r.delete(BENCH_KEY)
+    values = []
+    for driver_id, lat, lon in zip(ids, lats, lons):
+        values.extend([float(lon), float(lat), driver_id])
+    for i in range(0, len(values), 30000):
+        r.geoadd(BENCH_KEY, values[i:i + 30000])
+    try:
+        redis_knn, _ = timed(lambda lat, lon: r.geosearch(
+            BENCH_KEY, longitude=lon, latitude=lat, radius=50, unit="km",
+            sort="ASC", count=args.k, withdist=True
+        ), points)
+        redis_radius, _ = timed(lambda lat, lon: r.geosearch(
+            BENCH_KEY, longitude=lon, latitude=lat, radius=args.radius, unit="m",
+            sort="ASC", withdist=True
+        ), points)
+        print(f"🔴 GEOSEARCH k-NN (k={args.k}):     {percentiles(redis_knn)}")
+        print(f"🔴 GEOSEARCH radius ({args.radius:.0f} м): {percentiles(redis_radius)}")
+    finally:
+        r.delete(BENCH_KEY)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
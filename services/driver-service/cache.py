@@ -0,0 +1,208 @@
+# services/driver-service/cache.py
+"""
+Read-through кэш профилей: локальный LRU с TTL + общий уровень в Redis.
+
+Чтение: локальный LRU -> Redis -> PostgreSQL (и заполнение обоих уровней).
+Запись (update/delete): ключи удаляются из Redis, а в канал cache:invalidate:<ns>
+уходит сообщение, по которому каждая реплика чистит свой локальный LRU.
+Ошибки Redis не ломают запрос - просто идём в базу.
+"""
+import json
+import logging
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Type
+
+import redis
+from fastapi.concurrency import run_in_threadpool
+from pydantic import BaseModel
+
+from config import settings
+from db import db
+from models.driver import Driver
+
+logger = logging.getLogger(__name__)
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "local_hits": 0,
+            "redis_hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "redis_errors": 0,
+        }
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = dict(self.counters)
+        lookups = result["local_hits"] + result["redis_hits"] + result["misses"]
+        result["hit_rate"] = round((lookups - result["misses"]) / lookups, 4) if lookups else 0.0
+        return result
+
+
+class ProfileCache:
+    def __init__(self, namespace: str, model: Type[BaseModel], lookup_fields: List[str]):
+        self.namespace = namespace
+        self.model = model
+        self.lookup_fields = lookup_fields
+        self.channel = f"cache:invalidate:{namespace}"
+        self.stats = CacheStats()
+
+        self._local: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        # Растёт при каждой инвалидации; значение, прочитанное из базы до неё, в кэш не кладём
+        self._generation = 0
+
+        self._stop = threading.Event()
+        self._listener = None
+
+    def key(self, field: str, value) -> str:
+        return f"cache:{self.namespace}:{field}:{value}"
+
+    def keys_for(self, obj: BaseModel) -> List[str]:
+        return [self.key(field, getattr(obj, field)) for field in self.lookup_fields]
+
+    @property
+    def generation(self) -> int:
+        return self._generation
+
+    # --- локальный LRU ---
+
+    def _local_get(self, key: str) -> Optional[BaseModel]:
+        with self._lock:
+            entry = self._local.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.monotonic():
+                del self._local[key]
+                return None
+            self._local.move_to_end(key)
+            return value
+
+    def _local_set(self, keys: Iterable[str], value: BaseModel):
+        expires_at = time.monotonic() + settings.CACHE_LOCAL_TTL
+        with self._lock:
+            for key in keys:
+                self._local[key] = (value, expires_at)
+                self._local.move_to_end(key)
+            while len(self._local) > settings.CACHE_LOCAL_MAX_SIZE:
+                self._local.popitem(last=False)
+
+    def evict_local(self, keys: Iterable[str]):
+        with self._lock:
+            self._generation += 1
+            for key in keys:
+                self._local.pop(key, None)
+
+    # --- Redis ---
+
+    async def _redis(self, method: str, *args, **kwargs):
+        client = db.redis
+        if settings.DB_BACKEND == "async":
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_in_threadpool(getattr(client, method), *args, **kwargs)
+
+    # --- API для сервисов ---
+
+    async def get(self, field: str, value) -> Optional[BaseModel]:
+        key = self.key(field, value)
+        cached = self._local_get(key)
+        if cached is not None:
+            self.stats.incr("local_hits")
+            return cached
+
+        try:
+            raw = await self._redis("get", key)
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache read failed for {key}: {e}")
+            raw = None
+        if raw is not None:
+            obj = self.model.model_validate_json(raw)
+            self._local_set(self.keys_for(obj), obj)
+            self.stats.incr("redis_hits")
+            return obj
+
+        self.stats.incr("misses")
+        return None
+
+    async def set(self, obj: BaseModel, generation: int):
+        if generation != self._generation:
+            # Пока читали из базы, запись была изменена - не кэшируем устаревшее значение
+            return
+        keys = self.keys_for(obj)
+        self._local_set(keys, obj)
+        raw = obj.model_dump_json()
+        try:
+            for key in keys:
+                await self._redis("set", key, raw, ex=settings.CACHE_REDIS_TTL)
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache write failed for {keys[0]}: {e}")
+
+    async def invalidate(self, obj: BaseModel):
+        await self.invalidate_keys(self.keys_for(obj))
+
+    async def invalidate_keys(self, keys: List[str]):
+        if not keys:
+            return
+        self.evict_local(keys)
+        self.stats.incr("invalidations")
+        try:
+            await self._redis("delete", *keys)
+            await self._redis("publish", self.channel, json.dumps(keys))
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache invalidation failed for {keys[0]}: {e}")
+
+    # --- инвалидация с других реплик ---
+
+    def _listen(self):
+        while not self._stop.is_set():
+            client = redis.Redis(
+                host=settings.REDIS_HOST,
+                port=settings.REDIS_PORT,
+                db=0,
+                decode_responses=True,
+            )
+            pubsub = client.pubsub(ignore_subscribe_messages=True)
+            try:
+                pubsub.subscribe(self.channel)
+                while not self._stop.is_set():
+                    message = pubsub.get_message(timeout=1.0)
+                    if message and message["type"] == "message":
+                        self.evict_local(json.loads(message["data"]))
+            except Exception as e:
+                logger.error(f"Cache invalidation listener error: {e}")
+                # Пока не слышим соседей, локальные записи могли устареть
+                with self._lock:
+                    self._generation += 1
+                    self._local.clear()
+                self._stop.wait(1.0)
+            finally:
+                pubsub.close()
+                client.close()
+
+    def start_listener(self):
+        self._stop.clear()
+        self._listener = threading.Thread(target=self._listen, daemon=True)
+        self._listener.start()
+
+    def stop_listener(self):
+        self._stop.set()
+        if self._listener is not None:
+            self._listener.join(timeout=5)
+            self._listener = None
+
+
+# Профили ищутся и по id, и по телефону (/drivers/me?phone=...)
+driver_cache = ProfileCache("driver", Driver, ["id", "phone"])
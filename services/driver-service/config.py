@@ -10,6 +10,49 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "uber")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
     
+    # Пул соединений PostgreSQL
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_CONNECT_TIMEOUT: int = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+    # sync - psycopg2 в threadpool, async - asyncpg в event loop
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "sync")
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # Реплики для чтения: DSN через запятую, пусто - все запросы на primary
+    POSTGRES_REPLICA_DSNS: str = os.getenv("POSTGRES_REPLICA_DSNS", "")
+    # Реплика, отставшая больше чем на столько секунд, пропускается
+    DB_REPLICA_MAX_LAG: float = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 2))
+    # Столько секунд после записи клиент читает с primary (read-your-writes)
+    DB_READ_YOUR_WRITES_TTL: float = float(os.getenv("DB_READ_YOUR_WRITES_TTL", 5))
+    
+    # Redis
+    REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
+    REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    REDIS_POOL_MAX_SIZE: int = int(os.getenv("REDIS_POOL_MAX_SIZE", 50))
+    
+    # Кэш профилей (локальный LRU + Redis). Координаты из пингов кэш не сбрасывают,
+    # поэтому current_latitude/current_longitude в профиле могут отставать на TTL
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_LOCAL_MAX_SIZE: int = int(os.getenv("CACHE_LOCAL_MAX_SIZE", 10000))
+    CACHE_LOCAL_TTL: float = float(os.getenv("CACHE_LOCAL_TTL", 10))
+    CACHE_REDIS_TTL: int = int(os.getenv("CACHE_REDIS_TTL", 60))
+    
+    # Приём GPS-пингов: сброс координат в PostgreSQL раз в N секунд
+    LOCATION_FLUSH_INTERVAL: float = float(os.getenv("LOCATION_FLUSH_INTERVAL", 5))
+    LOCATION_BATCH_MAX_SIZE: int = int(os.getenv("LOCATION_BATCH_MAX_SIZE", 5000))
+    STATUS_BATCH_MAX_SIZE: int = int(os.getenv("STATUS_BATCH_MAX_SIZE", 5000))
+    
+    # In-memory индекс свободных водителей для /nearby (ячейка в градусах, ~1.1 км по широте)
+    SPATIAL_INDEX_CELL_SIZE: float = float(os.getenv("SPATIAL_INDEX_CELL_SIZE", 0.01))
+    SPATIAL_INDEX_REFRESH_INTERVAL: float = float(os.getenv("SPATIAL_INDEX_REFRESH_INTERVAL", 60))
+    SPATIAL_INDEX_MAX_RADIUS: float = float(os.getenv("SPATIAL_INDEX_MAX_RADIUS", 10000))
+    
+    # Очистка drivers:online от водителей без пингов дольше DRIVER_STALE_AFTER секунд
+    DRIVER_STALE_AFTER: float = float(os.getenv("DRIVER_STALE_AFTER", 120))
+    DRIVER_SWEEP_INTERVAL: float = float(os.getenv("DRIVER_SWEEP_INTERVAL", 30))
+    DRIVER_SWEEP_BATCH_SIZE: int = int(os.getenv("DRIVER_SWEEP_BATCH_SIZE", 500))
+    
     # Сервис
     DRIVER_SERVICE_PORT: int = int(os.getenv("DRIVER_SERVICE_PORT", 8002))
     
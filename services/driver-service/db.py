@@ -0,0 +1,623 @@
+# services/driver-service/db.py
+"""
+Пул соединений PostgreSQL и Redis на весь процесс.
+
+Пулы открываются в lifespan приложения (main.py) и закрываются при остановке.
+Роутеры получают соединение на время запроса через Depends(get_connection):
+соединение берётся из пула перед обработчиком и возвращается после ответа.
+
+DB_BACKEND выбирает драйвер: "sync" - psycopg2 + redis-py (репозитории работают
+в threadpool), "async" - asyncpg + redis.asyncio (репозитории работают в event loop).
+
+Чтения (GET) могут идти на реплики из POSTGRES_REPLICA_DSNS через
+Depends(get_read_connection): реплики по кругу, отстающие больше DB_REPLICA_MAX_LAG
+пропускаются, если годных нет - читаем с primary. После успешной записи клиент
+DB_READ_YOUR_WRITES_TTL секунд читает с primary (middleware read_your_writes).
+"""
+import asyncio
+import itertools
+import logging
+import math
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+
+import asyncpg
+import redis
+import redis.asyncio as aioredis
+from fastapi import Request
+from fastapi.concurrency import run_in_threadpool
+from psycopg2 import extensions
+from psycopg2.pool import ThreadedConnectionPool
+
+from config import settings
+
+logger = logging.getLogger(__name__)
+
+# Отставание реплики в секундах. Реплика, проигравшая весь полученный WAL, не отстаёт,
+# даже если записей давно не было; сервер не в recovery (локальная подмена реплики) - тоже.
+# NULL - реплика ещё ничего не проиграла, читать с неё нельзя
+REPLICA_LAG_SQL = """
+    SELECT CASE
+        WHEN NOT pg_is_in_recovery() THEN 0
+        WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+        ELSE EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp())
+    END::float8
+"""
+
+# Заголовок "читать с primary": 1/true - всегда; X-Read-Primary-Until (заголовок или
+# cookie с тем же значением, выдаются после записи) - до указанного unix time
+READ_PRIMARY_HEADER = "X-Read-Primary"
+READ_PRIMARY_UNTIL_HEADER = "X-Read-Primary-Until"
+READ_PRIMARY_UNTIL_COOKIE = "read_primary_until"
+SAFE_METHODS = {"GET", "HEAD", "OPTIONS"}
+
+
+class PoolExhaustedError(Exception):
+    """Не удалось получить соединение из пула за DB_POOL_TIMEOUT секунд"""
+
+
+class PoolMetrics:
+    """Счётчики выдачи соединений и времени ожидания свободного слота"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.checkouts = 0
+        self.timeouts = 0
+        self.in_use = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+    def record_checkout(self, wait: float):
+        with self._lock:
+            self.checkouts += 1
+            self.in_use += 1
+            self.wait_total += wait
+            self.wait_max = max(self.wait_max, wait)
+
+    def record_return(self):
+        with self._lock:
+            self.in_use -= 1
+
+    def record_timeout(self):
+        with self._lock:
+            self.timeouts += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            avg_wait = self.wait_total / self.checkouts if self.checkouts else 0.0
+            return {
+                "checkouts": self.checkouts,
+                "timeouts": self.timeouts,
+                "in_use": self.in_use,
+                "wait_avg_ms": round(avg_wait * 1000, 3),
+                "wait_max_ms": round(self.wait_max * 1000, 3),
+            }
+
+
+class ReadRoutingMetrics:
+    """Куда ушли чтения: на реплику, на primary по read-your-writes, на primary за неимением реплики"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters = {"replica": 0, "primary_pinned": 0, "primary_fallback": 0}
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+class Replica:
+    """Пул соединений одной реплики и её последнее измеренное отставание"""
+
+    def __init__(self, dsn: str):
+        self.dsn = dsn
+        params = extensions.parse_dsn(dsn)
+        # В health без пароля
+        self.name = f"{params.get('host', 'localhost')}:{params.get('port', 5432)}/{params.get('dbname', '')}"
+        self.pool = None
+        self.slots = None
+        self.lag = None
+        self.checked_at = None
+        self.error = None
+        self.reads = 0
+
+    def record_lag(self, lag):
+        self.lag = lag
+        self.checked_at = time.monotonic()
+        self.error = None
+
+    def mark_down(self, exc: Exception):
+        # До следующей удачной проверки реплика не используется
+        self.lag = None
+        self.checked_at = time.monotonic()
+        self.error = str(exc)
+
+    def usable(self, max_lag: float, stale_after: float) -> bool:
+        # Замер, которому больше stale_after, не доказывает, что реплика всё ещё догоняет
+        return (
+            self.lag is not None
+            and self.lag <= max_lag
+            and time.monotonic() - self.checked_at <= stale_after
+        )
+
+    def snapshot(self) -> dict:
+        return {
+            "replica": self.name,
+            "lag_seconds": round(self.lag, 3) if self.lag is not None else None,
+            "checked_ago_seconds": (
+                round(time.monotonic() - self.checked_at, 1) if self.checked_at is not None else None
+            ),
+            "error": self.error,
+            "reads": self.reads,
+        }
+
+
+class ConnectionManager:
+    def __init__(self, settings):
+        self.settings = settings
+        self.metrics = PoolMetrics()
+        self.routing = ReadRoutingMetrics()
+        self._pg_pool = None
+        self._pg_async_pool = None
+        self._slots = None
+        self._redis_pool = None
+        self._redis = None
+        self.replicas = [
+            Replica(dsn.strip()) for dsn in settings.POSTGRES_REPLICA_DSNS.split(",") if dsn.strip()
+        ]
+        self._next_replica = itertools.count()
+        self._lag_stop = threading.Event()
+        self._lag_thread = None
+        self._lag_task = None
+
+    def open(self):
+        s = self.settings
+        self._pg_pool = ThreadedConnectionPool(
+            s.DB_POOL_MIN_SIZE,
+            s.DB_POOL_MAX_SIZE,
+            host=s.POSTGRES_HOST,
+            port=s.POSTGRES_PORT,
+            database=s.POSTGRES_DB,
+            user=s.POSTGRES_USER,
+            password=s.POSTGRES_PASSWORD,
+            connect_timeout=s.DB_CONNECT_TIMEOUT,
+        )
+        # ThreadedConnectionPool не ждёт свободное соединение, а сразу падает с PoolError,
+        # поэтому очередь на соединение держим семафором
+        self._slots = threading.BoundedSemaphore(s.DB_POOL_MAX_SIZE)
+
+        for replica in self.replicas:
+            # Без минимума соединений: недоступная реплика не мешает сервису подняться
+            replica.pool = ThreadedConnectionPool(
+                0, s.DB_POOL_MAX_SIZE, dsn=replica.dsn, connect_timeout=s.DB_CONNECT_TIMEOUT
+            )
+            replica.slots = threading.BoundedSemaphore(s.DB_POOL_MAX_SIZE)
+        if self.replicas:
+            self._lag_stop.clear()
+            self._lag_thread = threading.Thread(target=self._watch_lag, daemon=True)
+            self._lag_thread.start()
+
+        self._open_redis(redis)
+        logger.info(
+            "Connection pools opened (sync): postgres %s..%s, replicas %s, redis %s",
+            s.DB_POOL_MIN_SIZE, s.DB_POOL_MAX_SIZE, len(self.replicas), s.REDIS_POOL_MAX_SIZE,
+        )
+
+    async def open_async(self):
+        s = self.settings
+        self._pg_async_pool = await asyncpg.create_pool(
+            host=s.POSTGRES_HOST,
+            port=s.POSTGRES_PORT,
+            database=s.POSTGRES_DB,
+            user=s.POSTGRES_USER,
+            password=s.POSTGRES_PASSWORD,
+            min_size=s.DB_POOL_MIN_SIZE,
+            max_size=s.DB_POOL_MAX_SIZE,
+            timeout=s.DB_CONNECT_TIMEOUT,
+            # asyncpg готовит каждый запрос один раз на соединение и переиспользует
+            # prepared statement из этого кэша при повторных вызовах
+            statement_cache_size=s.DB_STATEMENT_CACHE_SIZE,
+            init=_init_async_connection,
+        )
+        for replica in self.replicas:
+            replica.pool = await asyncpg.create_pool(
+                dsn=replica.dsn,
+                min_size=0,
+                max_size=s.DB_POOL_MAX_SIZE,
+                timeout=s.DB_CONNECT_TIMEOUT,
+                statement_cache_size=s.DB_STATEMENT_CACHE_SIZE,
+                init=_init_async_connection,
+            )
+        if self.replicas:
+            self._lag_task = asyncio.create_task(self._watch_lag_async())
+
+        self._open_redis(aioredis)
+        logger.info(
+            "Connection pools opened (async): postgres %s..%s, replicas %s, redis %s",
+            s.DB_POOL_MIN_SIZE, s.DB_POOL_MAX_SIZE, len(self.replicas), s.REDIS_POOL_MAX_SIZE,
+        )
+
+    def _open_redis(self, client_module):
+        s = self.settings
+        self._redis_pool = client_module.BlockingConnectionPool(
+            host=s.REDIS_HOST,
+            port=s.REDIS_PORT,
+            db=0,
+            max_connections=s.REDIS_POOL_MAX_SIZE,
+            timeout=s.DB_POOL_TIMEOUT,
+            health_check_interval=30,
+            decode_responses=True,
+        )
+        self._redis = client_module.Redis(connection_pool=self._redis_pool)
+
+    def close(self):
+        if self._lag_thread is not None:
+            self._lag_stop.set()
+            self._lag_thread.join(timeout=5)
+            self._lag_thread = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                replica.pool.closeall()
+                replica.pool = None
+        if self._pg_pool is not None:
+            self._pg_pool.closeall()
+            self._pg_pool = None
+        if self._redis_pool is not None:
+            self._redis_pool.disconnect()
+            self._redis_pool = None
+            self._redis = None
+        logger.info("Connection pools closed (sync)")
+
+    async def close_async(self):
+        if self._lag_task is not None:
+            self._lag_task.cancel()
+            try:
+                await self._lag_task
+            except asyncio.CancelledError:
+                pass
+            self._lag_task = None
+        for replica in self.replicas:
+            if replica.pool is not None:
+                await replica.pool.close()
+                replica.pool = None
+        if self._pg_async_pool is not None:
+            await self._pg_async_pool.close()
+            self._pg_async_pool = None
+        if self._redis_pool is not None:
+            await self._redis_pool.disconnect()
+            self._redis_pool = None
+            self._redis = None
+        logger.info("Connection pools closed (async)")
+
+    @contextmanager
+    def connection(self):
+        """Взять соединение PostgreSQL из пула и вернуть его после выхода из блока"""
+        if self._pg_pool is None:
+            raise RuntimeError("Connection pool is not open")
+
+        started = time.perf_counter()
+        if not self._slots.acquire(timeout=self.settings.DB_POOL_TIMEOUT):
+            self.metrics.record_timeout()
+            raise PoolExhaustedError(
+                f"No free PostgreSQL connection within {self.settings.DB_POOL_TIMEOUT}s"
+            )
+        self.metrics.record_checkout(time.perf_counter() - started)
+
+        conn = None
+        try:
+            conn = self._pg_pool.getconn()
+            if conn.closed:
+                # Соединение умерло, пока лежало в пуле - меняем на новое
+                self._pg_pool.putconn(conn, close=True)
+                conn = self._pg_pool.getconn()
+            yield conn
+        finally:
+            if conn is not None:
+                self._release(self._pg_pool, conn)
+            self._slots.release()
+            self.metrics.record_return()
+
+    @asynccontextmanager
+    async def async_connection(self):
+        """Асинхронный вариант connection() для DB_BACKEND=async"""
+        if self._pg_async_pool is None:
+            raise RuntimeError("Connection pool is not open")
+
+        started = time.perf_counter()
+        try:
+            conn = await self._pg_async_pool.acquire(timeout=self.settings.DB_POOL_TIMEOUT)
+        except asyncio.TimeoutError:
+            self.metrics.record_timeout()
+            raise PoolExhaustedError(
+                f"No free PostgreSQL connection within {self.settings.DB_POOL_TIMEOUT}s"
+            )
+        self.metrics.record_checkout(time.perf_counter() - started)
+        try:
+            yield conn
+        finally:
+            # release() сам откатывает незавершённую транзакцию
+            await self._pg_async_pool.release(conn)
+            self.metrics.record_return()
+
+    # --- чтение с реплик ---
+
+    def _replica_order(self):
+        """Годные реплики, начиная со следующей по кругу"""
+        s = self.settings
+        stale_after = 3 * s.DB_REPLICA_LAG_CHECK_INTERVAL
+        start = next(self._next_replica)
+        count = len(self.replicas)
+        for i in range(count):
+            replica = self.replicas[(start + i) % count]
+            if replica.usable(s.DB_REPLICA_MAX_LAG, stale_after):
+                yield replica
+
+    def _checkout_replica(self, replica):
+        # Реплика занята или недоступна - читаем с другой или с primary, а не ждём
+        if not replica.slots.acquire(blocking=False):
+            return None
+        try:
+            conn = replica.pool.getconn()
+            if conn.closed:
+                replica.pool.putconn(conn, close=True)
+                conn = replica.pool.getconn()
+            return conn
+        except Exception as e:
+            replica.slots.release()
+            replica.mark_down(e)
+            logger.warning(f"Replica {replica.name} is unavailable: {e}")
+            return None
+
+    def _record_primary_read(self, primary: bool):
+        if self.replicas:
+            self.routing.incr("primary_pinned" if primary else "primary_fallback")
+
+    @contextmanager
+    def read_connection(self, primary: bool = False):
+        """Соединение для запросов только на чтение: реплика, а если годной нет - primary.
+
+        primary=True - клиент недавно писал и должен увидеть свою запись.
+        """
+        replica = conn = None
+        if not primary:
+            for replica in self._replica_order():
+                conn = self._checkout_replica(replica)
+                if conn is not None:
+                    break
+        if conn is None:
+            self._record_primary_read(primary)
+            with self.connection() as conn:
+                yield conn
+            return
+
+        self.routing.incr("replica")
+        replica.reads += 1
+        try:
+            yield conn
+        finally:
+            self._release(replica.pool, conn)
+            replica.slots.release()
+
+    async def _acquire_replica(self, replica):
+        pool = replica.pool
+        if pool.get_size() >= pool.get_max_size() and pool.get_idle_size() == 0:
+            return None
+        try:
+            return await pool.acquire(timeout=self.settings.DB_CONNECT_TIMEOUT)
+        except Exception as e:
+            replica.mark_down(e)
+            logger.warning(f"Replica {replica.name} is unavailable: {e}")
+            return None
+
+    @asynccontextmanager
+    async def async_read_connection(self, primary: bool = False):
+        """Асинхронный вариант read_connection() для DB_BACKEND=async"""
+        replica = conn = None
+        if not primary:
+            for replica in self._replica_order():
+                conn = await self._acquire_replica(replica)
+                if conn is not None:
+                    break
+        if conn is None:
+            self._record_primary_read(primary)
+            async with self.async_connection() as conn:
+                yield conn
+            return
+
+        self.routing.incr("replica")
+        replica.reads += 1
+        try:
+            yield conn
+        finally:
+            await replica.pool.release(conn)
+
+    def _check_lag(self, replica):
+        if not replica.slots.acquire(timeout=self.settings.DB_POOL_TIMEOUT):
+            # Все соединения заняты чтениями - реплика жива, оставляем прошлый замер
+            return
+        conn = None
+        try:
+            conn = replica.pool.getconn()
+            with conn.cursor() as cur:
+                cur.execute(REPLICA_LAG_SQL)
+                replica.record_lag(cur.fetchone()[0])
+        except Exception as e:
+            replica.mark_down(e)
+            logger.warning(f"Replica {replica.name} lag check failed: {e}")
+        finally:
+            if conn is not None:
+                self._release(replica.pool, conn)
+            replica.slots.release()
+
+    def _watch_lag(self):
+        while True:
+            for replica in self.replicas:
+                self._check_lag(replica)
+            if self._lag_stop.wait(self.settings.DB_REPLICA_LAG_CHECK_INTERVAL):
+                return
+
+    async def _check_lag_async(self, replica):
+        try:
+            async with replica.pool.acquire(timeout=self.settings.DB_POOL_TIMEOUT) as conn:
+                replica.record_lag(await conn.fetchval(REPLICA_LAG_SQL))
+        except asyncio.TimeoutError:
+            pass
+        except Exception as e:
+            replica.mark_down(e)
+            logger.warning(f"Replica {replica.name} lag check failed: {e}")
+
+    async def _watch_lag_async(self):
+        while True:
+            for replica in self.replicas:
+                await self._check_lag_async(replica)
+            await asyncio.sleep(self.settings.DB_REPLICA_LAG_CHECK_INTERVAL)
+
+    def _release(self, pool, conn):
+        broken = bool(conn.closed)
+        if not broken:
+            status = conn.info.transaction_status
+            if status == extensions.TRANSACTION_STATUS_UNKNOWN:
+                broken = True
+            elif status != extensions.TRANSACTION_STATUS_IDLE:
+                # Не оставляем в пуле открытые транзакции (после SELECT или ошибки)
+                try:
+                    conn.rollback()
+                except Exception:
+                    broken = True
+        pool.putconn(conn, close=broken)
+
+    @property
+    def redis(self):
+        """redis.Redis для sync-бэкенда, redis.asyncio.Redis для async"""
+        if self._redis is None:
+            raise RuntimeError("Connection pool is not open")
+        return self._redis
+
+    def health(self) -> dict:
+        result = {"backend": "sync", "postgres": "ok", "redis": "ok", "pool": self.metrics.snapshot()}
+        try:
+            with self.connection() as conn:
+                with conn.cursor() as cur:
+                    cur.execute("SELECT 1")
+        except Exception as e:
+            result["postgres"] = f"error: {e}"
+        try:
+            self.redis.ping()
+        except Exception as e:
+            result["redis"] = f"error: {e}"
+        self._replicas_health(result)
+        return result
+
+    def _replicas_health(self, result: dict):
+        if self.replicas:
+            result["replicas"] = [replica.snapshot() for replica in self.replicas]
+            result["reads"] = self.routing.snapshot()
+
+    async def health_async(self) -> dict:
+        result = {"backend": "async", "postgres": "ok", "redis": "ok", "pool": self.metrics.snapshot()}
+        try:
+            async with self.async_connection() as conn:
+                await conn.fetchval("SELECT 1")
+        except Exception as e:
+            result["postgres"] = f"error: {e}"
+        try:
+            await self.redis.ping()
+        except Exception as e:
+            result["redis"] = f"error: {e}"
+        self._replicas_health(result)
+        return result
+
+
+async def _init_async_connection(conn):
+    # psycopg2 отдаёт UUID строкой, модели ждут str - делаем так же в asyncpg
+    await conn.set_type_codec(
+        "uuid", encoder=str, decoder=str, schema="pg_catalog", format="text"
+    )
+
+
+db = ConnectionManager(settings)
+
+
+def get_db_connection():
+    with db.connection() as conn:
+        yield conn
+
+
+async def get_async_db_connection():
+    async with db.async_connection() as conn:
+        yield conn
+
+
+get_connection = get_async_db_connection if settings.DB_BACKEND == "async" else get_db_connection
+
+
+def reads_from_primary(request: Request) -> bool:
+    """Клиент попросил primary или недавно писал (read-your-writes)"""
+    if request.headers.get(READ_PRIMARY_HEADER, "").lower() in ("1", "true"):
+        return True
+    until = request.headers.get(READ_PRIMARY_UNTIL_HEADER) or request.cookies.get(READ_PRIMARY_UNTIL_COOKIE)
+    try:
+        return until is not None and float(until) > time.time()
+    except ValueError:
+        return False
+
+
+def get_db_read_connection(request: Request):
+    with db.read_connection(primary=reads_from_primary(request)) as conn:
+        yield conn
+
+
+async def get_async_db_read_connection(request: Request):
+    async with db.async_read_connection(primary=reads_from_primary(request)) as conn:
+        yield conn
+
+
+get_read_connection = get_async_db_read_connection if settings.DB_BACKEND == "async" else get_db_read_connection
+
+
+async def read_your_writes(request: Request, call_next):
+    """HTTP middleware: после успешной записи клиент DB_READ_YOUR_WRITES_TTL секунд читает с primary.
+
+    Отметка уходит и cookie (браузеры вернут её сами), и заголовком - сервисы
+    присылают его обратно в X-Read-Primary-Until.
+    """
+    response = await call_next(request)
+    if db.replicas and request.method not in SAFE_METHODS and response.status_code < 400:
+        ttl = settings.DB_READ_YOUR_WRITES_TTL
+        until = f"{time.time() + ttl:.3f}"
+        response.headers[READ_PRIMARY_UNTIL_HEADER] = until
+        response.set_cookie(
+            READ_PRIMARY_UNTIL_COOKIE, until, max_age=math.ceil(ttl), httponly=True, samesite="lax"
+        )
+    return response
+
+
+async def get_redis():
+    return db.redis
+
+
+async def open_pools():
+    if settings.DB_BACKEND == "async":
+        await db.open_async()
+    else:
+        db.open()
+
+
+async def close_pools():
+    if settings.DB_BACKEND == "async":
+        await db.close_async()
+    else:
+        db.close()
+
+
+async def pools_health() -> dict:
+    if settings.DB_BACKEND == "async":
+        return await db.health_async()
+    # db.health() ждёт свободное соединение до DB_POOL_TIMEOUT и делает SELECT 1 -
+    # в event loop это остановило бы все запросы сервиса
+    return await run_in_threadpool(db.health)
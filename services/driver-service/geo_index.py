@@ -0,0 +1,325 @@
+# services/driver-service/geo_index.py
+"""
+In-memory индекс свободных водителей (is_online и не is_busy) для поиска рядом.
+
+Карта разбита на ячейки SPATIAL_INDEX_CELL_SIZE x SPATIAL_INDEX_CELL_SIZE градусов,
+координаты лежат в NumPy-массивах, расстояния до кандидатов из соседних ячеек
+считаются одним векторным haversine. Индекс обновляется теми же записями, что
+идут в drivers:online (add/remove_driver_from_redis, пинги), а раз в
+SPATIAL_INDEX_REFRESH_INTERVAL секунд пересобирается из PostgreSQL + Redis -
+так подтягиваются изменения, прошедшие через другие реплики.
+"""
+import asyncio
+import logging
+import math
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+import numpy as np
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_M = 6371000.0
+METERS_PER_DEGREE = 111320.0
+GEOPOS_CHUNK_SIZE = 1000
+
+LOAD_SQL = """
+    SELECT id::text AS id, current_latitude, current_longitude
+    FROM drivers
+    WHERE is_online = true AND is_busy = false
+      AND current_latitude IS NOT NULL AND current_longitude IS NOT NULL
+"""
+
+
+def haversine_m(lat: float, lon: float, lats: np.ndarray, lons: np.ndarray) -> np.ndarray:
+    """Расстояние в метрах от точки до массива точек"""
+    lat1 = math.radians(lat)
+    lat2 = np.radians(lats)
+    d_lat = lat2 - lat1
+    d_lon = np.radians(lons) - math.radians(lon)
+    a = np.sin(d_lat / 2) ** 2 + math.cos(lat1) * np.cos(lat2) * np.sin(d_lon / 2) ** 2
+    return 2 * EARTH_RADIUS_M * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+
+class _Grid:
+    """Хранилище без блокировок; доступ к нему сериализует DriverGeoIndex"""
+
+    def __init__(self, cell_size: float, capacity: int = 1024):
+        self.cell_size = cell_size
+        self.lats = np.zeros(capacity)
+        self.lons = np.zeros(capacity)
+        self.ids: List[Optional[str]] = [None] * capacity
+        self.slots: Dict[str, int] = {}
+        self.cells: Dict[Tuple[int, int], Set[int]] = {}
+        self.free: List[int] = list(range(capacity - 1, -1, -1))
+
+    def __len__(self):
+        return len(self.slots)
+
+    def cell_of(self, lat: float, lon: float) -> Tuple[int, int]:
+        return math.floor(lat / self.cell_size), math.floor(lon / self.cell_size)
+
+    def _grow(self):
+        old = len(self.ids)
+        self.lats = np.concatenate([self.lats, np.zeros(old)])
+        self.lons = np.concatenate([self.lons, np.zeros(old)])
+        self.ids.extend([None] * old)
+        self.free.extend(range(2 * old - 1, old - 1, -1))
+
+    def upsert(self, driver_id: str, lat: float, lon: float):
+        slot = self.slots.get(driver_id)
+        if slot is None:
+            if not self.free:
+                self._grow()
+            slot = self.free.pop()
+            self.slots[driver_id] = slot
+            self.ids[slot] = driver_id
+        else:
+            old_cell = self.cell_of(self.lats[slot], self.lons[slot])
+            self._discard(old_cell, slot)
+        self.lats[slot] = lat
+        self.lons[slot] = lon
+        self.cells.setdefault(self.cell_of(lat, lon), set()).add(slot)
+
+    def move(self, driver_id: str, lat: float, lon: float):
+        # Пинг не добавляет водителя: занятые и offline в индекс не попадают
+        if driver_id in self.slots:
+            self.upsert(driver_id, lat, lon)
+
+    def remove(self, driver_id: str):
+        slot = self.slots.pop(driver_id, None)
+        if slot is None:
+            return
+        self._discard(self.cell_of(self.lats[slot], self.lons[slot]), slot)
+        self.ids[slot] = None
+        self.free.append(slot)
+
+    def _discard(self, cell: Tuple[int, int], slot: int):
+        members = self.cells.get(cell)
+        if members is not None:
+            members.discard(slot)
+            if not members:
+                del self.cells[cell]
+
+    def slots_in(self, rows: range, cols: range) -> List[int]:
+        result = []
+        for i in rows:
+            for j in cols:
+                members = self.cells.get((i, j))
+                if members:
+                    result.extend(members)
+        return result
+
+    def ring_slots(self, center: Tuple[int, int], ring: int) -> List[int]:
+        """Кандидаты из ячеек на расстоянии ровно ring от центральной"""
+        ci, cj = center
+        if ring == 0:
+            return self.slots_in(range(ci, ci + 1), range(cj, cj + 1))
+        result = self.slots_in(range(ci - ring, ci + ring + 1), range(cj - ring, cj - ring + 1))
+        result += self.slots_in(range(ci - ring, ci + ring + 1), range(cj + ring, cj + ring + 1))
+        result += self.slots_in(range(ci - ring, ci - ring + 1), range(cj - ring + 1, cj + ring))
+        result += self.slots_in(range(ci + ring, ci + ring + 1), range(cj - ring + 1, cj + ring))
+        return result
+
+
+class DriverGeoIndex:
+    def __init__(self, cell_size: float, refresh_interval: float):
+        self.cell_size = cell_size
+        self.refresh_interval = refresh_interval
+        self._grid = _Grid(cell_size)
+        # Вызовы идут и из event loop, и из threadpool (sync-репозиторий)
+        self._lock = threading.Lock()
+        # Пока идёт пересборка, локальные изменения копятся здесь и накатываются на новый индекс
+        self._journal: Optional[list] = None
+        self._last_refresh: Optional[float] = None
+        self._task = None
+
+    def __len__(self):
+        return len(self._grid)
+
+    # --- запись ---
+
+    def _apply(self, op: str, *args):
+        with self._lock:
+            getattr(self._grid, op)(*args)
+            if self._journal is not None:
+                self._journal.append((op, args))
+
+    def upsert(self, driver_id: str, lat: float, lon: float):
+        self._apply("upsert", driver_id, float(lat), float(lon))
+
+    def move(self, driver_id: str, lat: float, lon: float):
+        self._apply("move", driver_id, float(lat), float(lon))
+
+    def remove(self, driver_id: str):
+        self._apply("remove", driver_id)
+
+    # --- поиск ---
+
+    def _result(self, grid: _Grid, slots: np.ndarray, distances: np.ndarray) -> List[dict]:
+        return [
+            {
+                "driver_id": grid.ids[slot],
+                "latitude": float(grid.lats[slot]),
+                "longitude": float(grid.lons[slot]),
+                "distance_m": float(distance),
+            }
+            for slot, distance in zip(slots, distances)
+        ]
+
+    def within_radius(self, lat: float, lon: float, radius_m: float, limit: Optional[int] = None) -> List[dict]:
+        """Все водители в радиусе radius_m, от ближнего к дальнему"""
+        lat_span = radius_m / METERS_PER_DEGREE
+        lon_span = radius_m / (METERS_PER_DEGREE * max(math.cos(math.radians(lat)), 0.01))
+        with self._lock:
+            grid = self._grid
+            i0, j0 = grid.cell_of(lat - lat_span, lon - lon_span)
+            i1, j1 = grid.cell_of(lat + lat_span, lon + lon_span)
+            slots = np.array(grid.slots_in(range(i0, i1 + 1), range(j0, j1 + 1)), dtype=np.int64)
+            if slots.size == 0:
+                return []
+            distances = haversine_m(lat, lon, grid.lats[slots], grid.lons[slots])
+            mask = distances <= radius_m
+            slots, distances = slots[mask], distances[mask]
+            if limit is not None and limit < slots.size:
+                top = np.argpartition(distances, limit - 1)[:limit]
+                slots, distances = slots[top], distances[top]
+            order = np.argsort(distances, kind="stable")
+            return self._result(grid, slots[order], distances[order])
+
+    def nearest(self, lat: float, lon: float, k: int, max_radius_m: float) -> List[dict]:
+        """k ближайших водителей не дальше max_radius_m.
+
+        Кольца ячеек вокруг точки добавляются, пока k-й кандидат не окажется ближе
+        любой ещё не просмотренной ячейки.
+        """
+        with self._lock:
+            grid = self._grid
+            center = grid.cell_of(lat, lon)
+            cell_m = self.cell_size * METERS_PER_DEGREE
+            candidates: List[int] = []
+            slots = np.empty(0, dtype=np.int64)
+            distances = np.empty(0)
+            ring = 0
+            while True:
+                candidates += grid.ring_slots(center, ring)
+                # Ближе этого расстояния непросмотренных водителей нет
+                edge_lat = min(abs(lat) + (ring + 1) * self.cell_size, 89.9)
+                covered_m = ring * cell_m * math.cos(math.radians(edge_lat))
+                if len(candidates) >= k or covered_m >= max_radius_m or len(candidates) == len(grid):
+                    slots = np.array(candidates, dtype=np.int64)
+                    distances = haversine_m(lat, lon, grid.lats[slots], grid.lons[slots])
+                    if len(candidates) == len(grid) or covered_m >= max_radius_m:
+                        break
+                    kth = np.partition(distances, k - 1)[k - 1]
+                    if kth <= covered_m:
+                        break
+                ring += 1
+
+            mask = distances <= max_radius_m
+            slots, distances = slots[mask], distances[mask]
+            if k < slots.size:
+                top = np.argpartition(distances, k - 1)[:k]
+                slots, distances = slots[top], distances[top]
+            order = np.argsort(distances, kind="stable")
+            return self._result(grid, slots[order], distances[order])
+
+    # --- пересборка ---
+
+    def rebuild(self, drivers: Iterable[Tuple[str, float, float]]) -> int:
+        grid = _Grid(self.cell_size)
+        for driver_id, lat, lon in drivers:
+            grid.upsert(driver_id, float(lat), float(lon))
+        with self._lock:
+            # Изменения, пришедшие во время загрузки, свежее снимка
+            for op, args in self._journal or []:
+                getattr(grid, op)(*args)
+            self._grid = grid
+            self._journal = None
+            self._last_refresh = time.time()
+        return len(grid)
+
+    def _begin_rebuild(self):
+        with self._lock:
+            self._journal = []
+
+    def _load_sync(self) -> List[Tuple[str, float, float]]:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(LOAD_SQL)
+                rows = cur.fetchall()
+            conn.commit()
+        positions = {}
+        for i in range(0, len(rows), GEOPOS_CHUNK_SIZE):
+            ids = [row[0] for row in rows[i:i + GEOPOS_CHUNK_SIZE]]
+            positions.update(zip(ids, db.redis.geopos("drivers:online", *ids)))
+        return self._merge_positions(rows, positions)
+
+    async def _load_async(self) -> List[Tuple[str, float, float]]:
+        async with db.async_connection() as conn:
+            rows = [tuple(row) for row in await conn.fetch(LOAD_SQL)]
+        positions = {}
+        for i in range(0, len(rows), GEOPOS_CHUNK_SIZE):
+            ids = [row[0] for row in rows[i:i + GEOPOS_CHUNK_SIZE]]
+            positions.update(zip(ids, await db.redis.geopos("drivers:online", *ids)))
+        return self._merge_positions(rows, positions)
+
+    @staticmethod
+    def _merge_positions(rows, positions) -> List[Tuple[str, float, float]]:
+        # В PostgreSQL координаты отстают на интервал write-behind - свежая точка в Redis
+        result = []
+        for driver_id, lat, lon in rows:
+            pos = positions.get(driver_id)
+            if pos is not None:
+                lon, lat = pos
+            result.append((driver_id, lat, lon))
+        return result
+
+    async def refresh(self) -> int:
+        self._begin_rebuild()
+        try:
+            if settings.DB_BACKEND == "async":
+                drivers = await self._load_async()
+            else:
+                drivers = await run_in_threadpool(self._load_sync)
+        except Exception as e:
+            with self._lock:
+                self._journal = None
+            logger.error(f"Geo index refresh failed: {e}")
+            return len(self)
+        return self.rebuild(drivers)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "drivers": len(self._grid),
+                "cells": len(self._grid.cells),
+                "cell_size_deg": self.cell_size,
+                "last_refresh": self._last_refresh,
+            }
+
+    async def _run(self):
+        while True:
+            size = await self.refresh()
+            logger.info(f"Geo index rebuilt: {size} drivers")
+            await asyncio.sleep(self.refresh_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+driver_index = DriverGeoIndex(settings.SPATIAL_INDEX_CELL_SIZE, settings.SPATIAL_INDEX_REFRESH_INTERVAL)
@@ -1,20 +1,68 @@
 # services/driver-service/main.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from routers import drivers
 from config import settings
+from db import PoolExhaustedError, open_pools, close_pools, pools_health, read_your_writes
+from services.location_writer import location_writer
+from cache import driver_cache
+from geo_index import driver_index
+from services.driver_sweeper import driver_sweeper
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пулы соединений открываются один раз на процесс
+    await open_pools()
+    location_writer.start()
+    driver_index.start()
+    driver_sweeper.start()
+    if settings.CACHE_ENABLED:
+        driver_cache.start_listener()
+    yield
+    driver_cache.stop_listener()
+    await driver_sweeper.stop()
+    await driver_index.stop()
+    await location_writer.stop()
+    await close_pools()
 
 app = FastAPI(
     title="Driver Service",
     description="Микросервис управления водителями",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Read-your-writes: после записи клиент какое-то время читает с primary, а не с реплики
+app.middleware("http")(read_your_writes)
+
 app.include_router(drivers.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "driver-service"}
 
+@app.get("/health/db")
+async def db_health_check():
+    return await pools_health()
+
+@app.get("/health/cache")
+async def cache_health_check():
+    return {"enabled": settings.CACHE_ENABLED, "drivers": driver_cache.stats.snapshot()}
+
+@app.get("/health/geo-index")
+async def geo_index_health_check():
+    return driver_index.stats()
+
+@app.get("/health/online-drivers")
+async def online_drivers_health_check():
+    return await driver_sweeper.stats()
+
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_handler(request: Request, exc: PoolExhaustedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 @app.get("/")
 async def root():
     return {"message": "Driver Service - Uber Clone", "version": "1.0.0"}
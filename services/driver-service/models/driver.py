@@ -1,7 +1,8 @@
 # services/driver-service/models/driver.py
-from pydantic import BaseModel
+import uuid
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
 
 class DriverBase(BaseModel):
     phone: str
@@ -30,3 +31,54 @@ class Driver(DriverBase):
     
     class Config:
         from_attributes = True
+
+class LocationUpdate(BaseModel):
+    latitude: float = Field(..., ge=-90, le=90)
+    longitude: float = Field(..., ge=-180, le=180)
+    recorded_at: Optional[datetime] = None  # время фиксации на устройстве
+
+class DriverLocationPing(LocationUpdate):
+    driver_id: str
+
+    @field_validator("driver_id")
+    @classmethod
+    def canonical_driver_id(cls, value: str) -> str:
+        # Проверяем при приёме: один кривой id в пачке write-behind сорвал бы
+        # UPDATE ... unnest(::uuid[]) для всех водителей сразу
+        try:
+            return str(uuid.UUID(value))
+        except ValueError:
+            raise ValueError("driver_id must be a UUID")
+
+class LocationBatch(BaseModel):
+    pings: List[DriverLocationPing]
+
+class LocationAck(BaseModel):
+    accepted: int
+
+class NearbyDriver(BaseModel):
+    driver_id: str
+    latitude: float
+    longitude: float
+    distance_m: float
+
+class DriverStatusUpdate(BaseModel):
+    driver_id: str
+    is_online: bool
+    is_busy: Optional[bool] = None  # None - не менять
+    latitude: Optional[float] = Field(None, ge=-90, le=90)  # None - оставить текущие координаты
+    longitude: Optional[float] = Field(None, ge=-180, le=180)
+
+class DriverStatusBatch(BaseModel):
+    updates: List[DriverStatusUpdate]
+
+class DriverStatusResult(BaseModel):
+    driver_id: str
+    status: Literal["updated", "not_found", "invalid_id"]
+    is_online: Optional[bool] = None
+    is_busy: Optional[bool] = None
+
+class DriverStatusBatchResult(BaseModel):
+    updated: int
+    not_found: int
+    results: List[DriverStatusResult]
@@ -0,0 +1,232 @@
+# services/driver-service/repositories/async_driver_repository.py
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+from models.driver import Driver, DriverCreate, DriverUpdate, DriverLocationPing, DriverStatusUpdate
+from serialization import from_row, from_rows
+from geo_index import driver_index
+
+# KEYS[1] - drivers:online, KEYS[2] - drivers:last_seen; ARGV[1] - last seen, ARGV[2] - префикс HASH,
+# дальше по четыре на пинг: id, longitude, latitude, updated_at.
+# Обновляем только тех, кто ещё в drivers:online: запоздавший пинг не вернёт на линию
+# водителя, который ушёл offline, и не оставит за ним driver:location:{id}
+MOVE_SCRIPT = """
+local moved = {}
+for i = 3, #ARGV, 4 do
+    local id = ARGV[i]
+    if redis.call('ZSCORE', KEYS[1], id) then
+        redis.call('GEOADD', KEYS[1], ARGV[i + 1], ARGV[i + 2], id)
+        redis.call('ZADD', KEYS[2], 'XX', ARGV[1], id)
+        redis.call('HSET', ARGV[2] .. id, 'latitude', ARGV[i + 2], 'longitude', ARGV[i + 1], 'updated_at', ARGV[i + 3])
+        moved[#moved + 1] = id
+    end
+end
+return moved
+"""
+
+
+class AsyncDriverRepository:
+    """Те же запросы, что в DriverRepository, но через asyncpg и redis.asyncio (DB_BACKEND=async)"""
+
+    def __init__(self, connection, redis_client):
+        self.conn = connection
+        self.redis_client = redis_client
+
+    async def get_driver(self, driver_id: str) -> Optional[Driver]:
+        row = await self.conn.fetchrow("SELECT * FROM drivers WHERE id = $1", driver_id)
+        return from_row(Driver, row)
+
+    async def get_driver_by_phone(self, phone: str) -> Optional[Driver]:
+        row = await self.conn.fetchrow("SELECT * FROM drivers WHERE phone = $1", phone)
+        return from_row(Driver, row)
+
+    async def get_drivers(self, skip: int = 0, limit: int = 100,
+                          after: Optional[Tuple[datetime, str]] = None) -> List[Driver]:
+        if after is not None:
+            rows = await self.conn.fetch(
+                """
+                SELECT * FROM drivers
+                WHERE (created_at, id) < ($1::timestamp, $2::uuid)
+                ORDER BY created_at DESC, id DESC
+                LIMIT $3
+                """,
+                after[0], after[1], limit
+            )
+        else:
+            rows = await self.conn.fetch(
+                "SELECT * FROM drivers ORDER BY created_at DESC, id DESC LIMIT $1 OFFSET $2",
+                limit, skip
+            )
+        return from_rows(Driver, rows)
+
+    async def create_driver(self, driver: DriverCreate) -> Driver:
+        driver_id = str(uuid.uuid4())
+        row = await self.conn.fetchrow(
+            """
+            INSERT INTO drivers (
+                id, phone, name, email, license_number, car_model, car_plate,
+                car_color, rating, total_rides, is_online, is_busy,
+                current_latitude, current_longitude, created_at
+            )
+            VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14, NOW())
+            RETURNING *
+            """,
+            driver_id, driver.phone, driver.name, driver.email,
+            driver.license_number, driver.car_model, driver.car_plate,
+            driver.car_color, driver.rating, driver.total_rides,
+            driver.is_online, driver.is_busy, driver.current_latitude,
+            driver.current_longitude
+        )
+
+        # 🔁 Синхронизация с Redis
+        if driver.is_online and driver.current_latitude and driver.current_longitude:
+            await self.add_driver_to_redis(driver_id, driver.current_latitude, driver.current_longitude, driver.is_busy)
+
+        return from_row(Driver, row)
+
+    async def update_driver(self, driver_id: str, driver: DriverUpdate) -> Optional[Driver]:
+        row = await self.conn.fetchrow(
+            """
+            UPDATE drivers
+            SET name = $1, email = $2, car_model = $3, car_plate = $4,
+                car_color = $5, rating = $6, is_online = $7, is_busy = $8,
+                current_latitude = $9, current_longitude = $10
+            WHERE id = $11
+            RETURNING *
+            """,
+            driver.name, driver.email, driver.car_model, driver.car_plate,
+            driver.car_color, driver.rating, driver.is_online, driver.is_busy,
+            driver.current_latitude, driver.current_longitude, driver_id
+        )
+        if not row:
+            return None
+
+        # 🔁 Синхронизация с Redis
+        if driver.is_online and driver.current_latitude and driver.current_longitude:
+            await self.add_driver_to_redis(driver_id, driver.current_latitude, driver.current_longitude, driver.is_busy)
+        else:
+            await self.remove_driver_from_redis(driver_id)
+
+        return from_row(Driver, row)
+
+    async def delete_driver(self, driver_id: str) -> bool:
+        status = await self.conn.execute("DELETE FROM drivers WHERE id = $1", driver_id)
+        # asyncpg возвращает тег команды, например "DELETE 1"
+        deleted = status.split()[-1] != "0"
+        if deleted:
+            await self.remove_driver_from_redis(driver_id)
+        return deleted
+
+    async def update_statuses(self, updates: List[DriverStatusUpdate]) -> List[dict]:
+        """Статус и координаты пачки водителей одним UPDATE (unnest вместо execute_values)"""
+        rows = await self.conn.fetch(
+            """
+            UPDATE drivers AS d
+            SET is_online = v.is_online,
+                is_busy = COALESCE(v.is_busy, d.is_busy),
+                current_latitude = COALESCE(v.lat, d.current_latitude),
+                current_longitude = COALESCE(v.lon, d.current_longitude)
+            FROM unnest($1::uuid[], $2::bool[], $3::bool[], $4::float8[], $5::float8[])
+                AS v(id, is_online, is_busy, lat, lon)
+            WHERE d.id = v.id
+            RETURNING d.id::text AS id, d.phone, d.is_online, d.is_busy,
+                      d.current_latitude, d.current_longitude
+            """,
+            [u.driver_id for u in updates],
+            [u.is_online for u in updates],
+            [u.is_busy for u in updates],
+            [u.latitude for u in updates],
+            [u.longitude for u in updates]
+        )
+        rows = [dict(row) for row in rows]
+        await self.sync_statuses_to_redis(rows)
+        return rows
+
+    async def sync_statuses_to_redis(self, rows: List[dict]):
+        """Отразить новые статусы в drivers:online одним pipeline"""
+        now = datetime.now(timezone.utc)
+        pipe = self.redis_client.pipeline(transaction=False)
+        geo_values, last_seen, offline_ids = [], {}, []
+        for row in rows:
+            driver_id = row["id"]
+            lat, lon = row["current_latitude"], row["current_longitude"]
+            if row["is_online"] and lat is not None and lon is not None:
+                geo_values.extend([float(lon), float(lat), driver_id])
+                last_seen[driver_id] = now.timestamp()
+                pipe.hset(f"driver:location:{driver_id}", mapping={
+                    "latitude": str(float(lat)),
+                    "longitude": str(float(lon)),
+                    "updated_at": now.isoformat()
+                })
+            else:
+                offline_ids.append(driver_id)
+        if geo_values:
+            pipe.geoadd("drivers:online", geo_values)
+            pipe.zadd("drivers:last_seen", last_seen)
+        if offline_ids:
+            pipe.zrem("drivers:online", *offline_ids)
+            pipe.zrem("drivers:last_seen", *offline_ids)
+            pipe.delete(*[f"driver:location:{i}" for i in offline_ids])
+        try:
+            await pipe.execute()
+        except Exception as e:
+            print(f"❌ Redis error (batch status): {e}")
+
+        for row in rows:
+            if row["is_online"] and not row["is_busy"] and row["current_latitude"] is not None \
+                    and row["current_longitude"] is not None:
+                driver_index.upsert(row["id"], row["current_latitude"], row["current_longitude"])
+            else:
+                driver_index.remove(row["id"])
+
+    async def add_driver_to_redis(self, driver_id: str, lat: float, lon: float, is_busy: bool = False):
+        """Добавить водителя в Redis при is_online = true"""
+        try:
+            now = datetime.now(timezone.utc)
+            await self.redis_client.geoadd("drivers:online", [lon, lat, driver_id])
+            # По drivers:last_seen свипер убирает водителей, от которых давно нет пингов
+            await self.redis_client.zadd("drivers:last_seen", {driver_id: now.timestamp()})
+            await self.redis_client.hset(f"driver:location:{driver_id}", mapping={
+                "latitude": str(lat),
+                "longitude": str(lon),
+                "updated_at": now.isoformat()
+            })
+            print(f"✅ Driver {driver_id} added to Redis")
+        except Exception as e:
+            print(f"❌ Redis error (add): {e}")
+
+        # В индекс для /nearby попадают только свободные
+        if is_busy:
+            driver_index.remove(driver_id)
+        else:
+            driver_index.upsert(driver_id, lat, lon)
+
+    async def remove_driver_from_redis(self, driver_id: str):
+        """Удалить водителя из Redis при is_online = false"""
+        try:
+            await self.redis_client.zrem("drivers:online", driver_id)
+            await self.redis_client.zrem("drivers:last_seen", driver_id)
+            await self.redis_client.delete(f"driver:location:{driver_id}")
+            print(f"✅ Driver {driver_id} removed from Redis")
+        except Exception as e:
+            print(f"❌ Redis error (remove): {e}")
+        driver_index.remove(driver_id)
+
+    async def update_locations_in_redis(self, pings: List[DriverLocationPing]) -> Set[str]:
+        """Обновить координаты онлайн-водителей одним скриптом (без обращения к PostgreSQL).
+
+        Возвращает id водителей, чьи координаты обновлены.
+        """
+        args = [
+            # Last seen - время получения пинга сервером: часам устройства не доверяем
+            datetime.now(timezone.utc).timestamp(),
+            "driver:location:",
+        ]
+        for ping in pings:
+            args.extend([ping.driver_id, ping.longitude, ping.latitude, ping.recorded_at.isoformat()])
+        script = self.redis_client.register_script(MOVE_SCRIPT)
+        moved = set(await script(keys=["drivers:online", "drivers:last_seen"], args=args))
+        for ping in pings:
+            if ping.driver_id in moved:
+                driver_index.move(ping.driver_id, ping.latitude, ping.longitude)
+        return moved
@@ -1,23 +1,37 @@
 # services/driver-service/repositories/driver_repository.py
 import uuid
 import psycopg2
-from psycopg2.extras import RealDictCursor
-from typing import List, Optional
-from models.driver import Driver, DriverCreate, DriverUpdate
-import redis
-import os
+from psycopg2.extras import RealDictCursor, execute_values
+from datetime import datetime, timezone
+from typing import List, Optional, Set, Tuple
+from models.driver import Driver, DriverCreate, DriverUpdate, DriverLocationPing, DriverStatusUpdate
+from serialization import from_row, from_rows
+from geo_index import driver_index
+
+# KEYS[1] - drivers:online, KEYS[2] - drivers:last_seen; ARGV[1] - last seen, ARGV[2] - префикс HASH,
+# дальше по четыре на пинг: id, longitude, latitude, updated_at.
+# Обновляем только тех, кто ещё в drivers:online: запоздавший пинг не вернёт на линию
+# водителя, который ушёл offline, и не оставит за ним driver:location:{id}
+MOVE_SCRIPT = """
+local moved = {}
+for i = 3, #ARGV, 4 do
+    local id = ARGV[i]
+    if redis.call('ZSCORE', KEYS[1], id) then
+        redis.call('GEOADD', KEYS[1], ARGV[i + 1], ARGV[i + 2], id)
+        redis.call('ZADD', KEYS[2], 'XX', ARGV[1], id)
+        redis.call('HSET', ARGV[2] .. id, 'latitude', ARGV[i + 2], 'longitude', ARGV[i + 1], 'updated_at', ARGV[i + 3])
+        moved[#moved + 1] = id
+    end
+end
+return moved
+"""
 
 
 class DriverRepository:
-    def __init__(self, connection):
+    def __init__(self, connection, redis_client):
         self.conn = connection
-        # Подключение к Redis
-        self.redis_client = redis.Redis(
-            host=os.getenv("REDIS_HOST", "redis"),
-            port=int(os.getenv("REDIS_PORT", 6379)),
-            db=0,
-            decode_responses=True
-        )
+        # Клиент Redis из общего пула (db.py)
+        self.redis_client = redis_client
     
     def get_driver(self, driver_id: str) -> Optional[Driver]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -27,7 +41,7 @@ class DriverRepository:
             )
             row = cur.fetchone()
             if row:
-                return Driver(**row)
+                return from_row(Driver, row)
         return None
     
     def get_driver_by_phone(self, phone: str) -> Optional[Driver]:
@@ -38,80 +52,95 @@ class DriverRepository:
             )
             row = cur.fetchone()
             if row:
-                return Driver(**row)
+                return from_row(Driver, row)
         return None
     
-    def get_drivers(self, skip: int = 0, limit: int = 100) -> List[Driver]:
+    def get_drivers(self, skip: int = 0, limit: int = 100,
+                    after: Optional[Tuple[datetime, str]] = None) -> List[Driver]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM drivers ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (limit, skip)
-            )
-            rows = cur.fetchall()
-            return [Driver(**row) for row in rows]
-    
-        def create_driver(self, driver: DriverCreate) -> Driver:
-            driver_id = str(uuid.uuid4())
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if after is not None:
+                # Keyset: продолжаем после последней строки прошлой страницы, без OFFSET
                 cur.execute(
                     """
-                    INSERT INTO drivers (
-                        id, phone, name, email, license_number, car_model, car_plate,
-                        car_color, rating, total_rides, is_online, is_busy,
-                        current_latitude, current_longitude, created_at
-                    )
-                    VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
-                    RETURNING *
+                    SELECT * FROM drivers
+                    WHERE (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
                     """,
-                    (
-                        driver_id, driver.phone, driver.name, driver.email,
-                        driver.license_number, driver.car_model, driver.car_plate,
-                        driver.car_color, driver.rating, driver.total_rides,
-                        driver.is_online, driver.is_busy, driver.current_latitude,
-                        driver.current_longitude
-                    )
+                    (after[0], after[1], limit)
+                )
+            else:
+                cur.execute(
+                    "SELECT * FROM drivers ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s",
+                    (limit, skip)
+                )
+            rows = cur.fetchall()
+            return from_rows(Driver, rows)
+    
+    def create_driver(self, driver: DriverCreate) -> Driver:
+        driver_id = str(uuid.uuid4())
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                INSERT INTO drivers (
+                    id, phone, name, email, license_number, car_model, car_plate,
+                    car_color, rating, total_rides, is_online, is_busy,
+                    current_latitude, current_longitude, created_at
+                )
+                VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, NOW())
+                RETURNING *
+                """,
+                (
+                    driver_id, driver.phone, driver.name, driver.email,
+                    driver.license_number, driver.car_model, driver.car_plate,
+                    driver.car_color, driver.rating, driver.total_rides,
+                    driver.is_online, driver.is_busy, driver.current_latitude,
+                    driver.current_longitude
+                )
+            )
+            row = cur.fetchone()
+            self.conn.commit()
+            
+            # 🔁 Синхронизация с Redis
+            if driver.is_online and driver.current_latitude and driver.current_longitude:
+                self.add_driver_to_redis(driver_id, driver.current_latitude, driver.current_longitude, driver.is_busy)
+            
+            return from_row(Driver, row)
+
+
+    def update_driver(self, driver_id: str, driver: DriverUpdate) -> Optional[Driver]:
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(
+                """
+                UPDATE drivers 
+                SET name = %s, email = %s, car_model = %s, car_plate = %s,
+                    car_color = %s, rating = %s, is_online = %s, is_busy = %s,
+                    current_latitude = %s, current_longitude = %s
+                WHERE id = %s
+                RETURNING *
+                """,
+                (
+                    driver.name, driver.email, driver.car_model, driver.car_plate,
+                    driver.car_color, driver.rating, driver.is_online, driver.is_busy,
+                    driver.current_latitude, driver.current_longitude, driver_id
                 )
-                row = cur.fetchone()
+            )
+            row = cur.fetchone()
+            if row:
                 self.conn.commit()
                 
                 # 🔁 Синхронизация с Redis
                 if driver.is_online and driver.current_latitude and driver.current_longitude:
-                    self.add_driver_to_redis(driver_id, driver.current_latitude, driver.current_longitude)
+                    self.add_driver_to_redis(
+                        driver_id, driver.current_latitude, driver.current_longitude, driver.is_busy
+                    )
+                else:
+                    self.remove_driver_from_redis(driver_id)
                 
-                return Driver(**row)
+                return from_row(Driver, row)
+            return None
 
-    
-        def update_driver(self, driver_id: str, driver: DriverUpdate) -> Optional[Driver]:
-            with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-                cur.execute(
-                    """
-                    UPDATE drivers 
-                    SET name = %s, email = %s, car_model = %s, car_plate = %s,
-                        car_color = %s, rating = %s, is_online = %s, is_busy = %s,
-                        current_latitude = %s, current_longitude = %s
-                    WHERE id = %s
-                    RETURNING *
-                    """,
-                    (
-                        driver.name, driver.email, driver.car_model, driver.car_plate,
-                        driver.car_color, driver.rating, driver.is_online, driver.is_busy,
-                        driver.current_latitude, driver.current_longitude, driver_id
-                    )
-                )
-                row = cur.fetchone()
-                if row:
-                    self.conn.commit()
-                    
-                    # 🔁 Синхронизация с Redis
-                    if driver.is_online and driver.current_latitude and driver.current_longitude:
-                        self.add_driver_to_redis(driver_id, driver.current_latitude, driver.current_longitude)
-                    else:
-                        self.remove_driver_from_redis(driver_id)
-                    
-                    return Driver(**row)
-                return None
 
-    
     def delete_driver(self, driver_id: str) -> bool:
         with self.conn.cursor() as cur:
             cur.execute(
@@ -119,31 +148,128 @@ class DriverRepository:
                 (driver_id,)
             )
             self.conn.commit()
-            return cur.rowcount > 0
-    def add_driver_to_redis(self, driver_id: str, lat: float, lon: float):
-            """Добавить водителя в Redis при is_online = true"""
-            try:
-                # Добавляем в GEOSET
-                self.redis_client.geoadd("drivers:online", [lon, lat, driver_id])
-                
-                # Сохраняем детали
-                self.redis_client.hset(f"driver:location:{driver_id}", mapping={
-                    "latitude": str(lat),
-                    "longitude": str(lon),
-                    "updated_at": "2024-01-15T12:00:00Z"
+            deleted = cur.rowcount > 0
+        if deleted:
+            self.remove_driver_from_redis(driver_id)
+        return deleted
+
+    def update_statuses(self, updates: List[DriverStatusUpdate]) -> List[dict]:
+        """Статус и координаты пачки водителей одним UPDATE в одной транзакции"""
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            rows = execute_values(
+                cur,
+                """
+                UPDATE drivers AS d
+                SET is_online = v.is_online,
+                    is_busy = COALESCE(v.is_busy, d.is_busy),
+                    current_latitude = COALESCE(v.lat, d.current_latitude),
+                    current_longitude = COALESCE(v.lon, d.current_longitude)
+                FROM (VALUES %s) AS v(id, is_online, is_busy, lat, lon)
+                WHERE d.id = v.id
+                RETURNING d.id::text AS id, d.phone, d.is_online, d.is_busy,
+                          d.current_latitude, d.current_longitude
+                """,
+                [(u.driver_id, u.is_online, u.is_busy, u.latitude, u.longitude) for u in updates],
+                template="(%s::uuid, %s::boolean, %s::boolean, %s::float8, %s::float8)",
+                # Вся пачка - один statement
+                page_size=max(len(updates), 1),
+                fetch=True
+            )
+        self.conn.commit()
+        self.sync_statuses_to_redis(rows)
+        return rows
+
+    def sync_statuses_to_redis(self, rows: List[dict]):
+        """Отразить новые статусы в drivers:online одним pipeline"""
+        now = datetime.now(timezone.utc)
+        pipe = self.redis_client.pipeline(transaction=False)
+        geo_values, last_seen, offline_ids = [], {}, []
+        for row in rows:
+            driver_id = row["id"]
+            lat, lon = row["current_latitude"], row["current_longitude"]
+            if row["is_online"] and lat is not None and lon is not None:
+                geo_values.extend([float(lon), float(lat), driver_id])
+                last_seen[driver_id] = now.timestamp()
+                pipe.hset(f"driver:location:{driver_id}", mapping={
+                    "latitude": str(float(lat)),
+                    "longitude": str(float(lon)),
+                    "updated_at": now.isoformat()
                 })
-                print(f"✅ Driver {driver_id} added to Redis")
-            except Exception as e:
-                print(f"❌ Redis error (add): {e}")
+            else:
+                offline_ids.append(driver_id)
+        if geo_values:
+            pipe.geoadd("drivers:online", geo_values)
+            pipe.zadd("drivers:last_seen", last_seen)
+        if offline_ids:
+            pipe.zrem("drivers:online", *offline_ids)
+            pipe.zrem("drivers:last_seen", *offline_ids)
+            pipe.delete(*[f"driver:location:{i}" for i in offline_ids])
+        try:
+            pipe.execute()
+        except Exception as e:
+            print(f"❌ Redis error (batch status): {e}")
+
+        for row in rows:
+            if row["is_online"] and not row["is_busy"] and row["current_latitude"] is not None \
+                    and row["current_longitude"] is not None:
+                driver_index.upsert(row["id"], row["current_latitude"], row["current_longitude"])
+            else:
+                driver_index.remove(row["id"])
+
+    def add_driver_to_redis(self, driver_id: str, lat: float, lon: float, is_busy: bool = False):
+        """Добавить водителя в Redis при is_online = true"""
+        try:
+            now = datetime.now(timezone.utc)
+            # Добавляем в GEOSET
+            self.redis_client.geoadd("drivers:online", [lon, lat, driver_id])
+            # По drivers:last_seen свипер убирает водителей, от которых давно нет пингов
+            self.redis_client.zadd("drivers:last_seen", {driver_id: now.timestamp()})
+            
+            # Сохраняем детали
+            self.redis_client.hset(f"driver:location:{driver_id}", mapping={
+                "latitude": str(lat),
+                "longitude": str(lon),
+                "updated_at": now.isoformat()
+            })
+            print(f"✅ Driver {driver_id} added to Redis")
+        except Exception as e:
+            print(f"❌ Redis error (add): {e}")
+        
+        # В индекс для /nearby попадают только свободные
+        if is_busy:
+            driver_index.remove(driver_id)
+        else:
+            driver_index.upsert(driver_id, lat, lon)
 
     def remove_driver_from_redis(self, driver_id: str):
         """Удалить водителя из Redis при is_online = false"""
         try:
             # Удаляем из GEOSET
             self.redis_client.zrem("drivers:online", driver_id)
+            self.redis_client.zrem("drivers:last_seen", driver_id)
             
             # Удаляем HASH
             self.redis_client.delete(f"driver:location:{driver_id}")
             print(f"✅ Driver {driver_id} removed from Redis")
         except Exception as e:
             print(f"❌ Redis error (remove): {e}")
+        driver_index.remove(driver_id)
+
+    def update_locations_in_redis(self, pings: List[DriverLocationPing]) -> Set[str]:
+        """Обновить координаты онлайн-водителей одним скриптом (без обращения к PostgreSQL).
+
+        Возвращает id водителей, чьи координаты обновлены.
+        """
+        args = [
+            # Last seen - время получения пинга сервером: часам устройства не доверяем
+            datetime.now(timezone.utc).timestamp(),
+            "driver:location:",
+        ]
+        for ping in pings:
+            args.extend([ping.driver_id, ping.longitude, ping.latitude, ping.recorded_at.isoformat()])
+        script = self.redis_client.register_script(MOVE_SCRIPT)
+        moved = set(script(keys=["drivers:online", "drivers:last_seen"], args=args))
+        for ping in pings:
+            if ping.driver_id in moved:
+                driver_index.move(ping.driver_id, ping.latitude, ping.longitude)
+        return moved
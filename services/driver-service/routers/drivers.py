@@ -1,65 +1,139 @@
 # services/driver-service/routers/drivers.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from models.driver import Driver, DriverCreate, DriverUpdate
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from uuid import UUID
+from models.driver import (
+    Driver, DriverCreate, DriverUpdate, DriverLocationPing, LocationAck, LocationBatch, LocationUpdate,
+    NearbyDriver, DriverStatusBatch, DriverStatusBatchResult,
+)
 from services.driver_service import DriverService
+from services.location_writer import location_writer
 from config import settings
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from db import get_connection, get_read_connection, get_redis
+from cache import driver_cache
 from repositories.driver_repository import DriverRepository
+from repositories.pagination import decode_cursor, encode_cursor
+from serialization import ORJSONListResponse
+from repositories.async_driver_repository import AsyncDriverRepository
 
 router = APIRouter(prefix="/api/v1/drivers", tags=["drivers"])
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=settings.POSTGRES_HOST,
-        port=settings.POSTGRES_PORT,
-        database=settings.POSTGRES_DB,
-        user=settings.POSTGRES_USER,
-        password=settings.POSTGRES_PASSWORD
-    )
+async def get_driver_service(conn=Depends(get_connection), redis_client=Depends(get_redis)):
+    cache = driver_cache if settings.CACHE_ENABLED else None
+    if settings.DB_BACKEND == "async":
+        return DriverService(AsyncDriverRepository(conn, redis_client), location_writer, cache)
+    driver_repo = DriverRepository(conn, redis_client)
+    return DriverService(driver_repo, location_writer, cache)
 
-def get_driver_service():
-    conn = get_db_connection()
-    driver_repo = DriverRepository(conn)
-    return DriverService(driver_repo)
+async def get_driver_read_service(conn=Depends(get_read_connection), redis_client=Depends(get_redis)):
+    # Соединение с реплики (или с primary, если годной нет) - только для GET
+    if settings.DB_BACKEND == "async":
+        return DriverService(AsyncDriverRepository(conn, redis_client), location_writer)
+    return DriverService(DriverRepository(conn, redis_client), location_writer)
+
+async def get_driver_location_service(redis_client=Depends(get_redis)):
+    # Пинги идут только в Redis и write-behind: соединение из пула PostgreSQL не берём
+    if settings.DB_BACKEND == "async":
+        return DriverService(AsyncDriverRepository(None, redis_client), location_writer)
+    return DriverService(DriverRepository(None, redis_client), location_writer)
+
+# Поиск по id и телефону заполняет кэш профилей: отстающая реплика положила бы туда
+# старую версию уже после инвалидации, поэтому при включённом кэше он читает с primary
+get_driver_lookup_service = get_driver_service if settings.CACHE_ENABLED else get_driver_read_service
 
 @router.get("/", response_model=List[Driver])
-def read_drivers(skip: int = 0, limit: int = 100, service: DriverService = Depends(get_driver_service)):
-    drivers = service.get_drivers(skip=skip, limit=limit)
-    return drivers
+async def read_drivers(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    service: DriverService = Depends(get_driver_read_service)
+):
+    # cursor из заголовка X-Next-Cursor прошлой страницы; skip оставлен для старых клиентов
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    drivers = await service.get_drivers(skip=skip, limit=limit, after=after)
+    headers = {}
+    if len(drivers) == limit:
+        last = drivers[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    # Строки уже собраны из базы - сериализуем без повторной валидации response_model
+    return ORJSONListResponse(drivers, headers=headers)
 
 @router.get("/me", response_model=Driver)
-def read_current_driver(phone: str, service: DriverService = Depends(get_driver_service)):
-    driver = service.get_driver_by_phone(phone)
+async def read_current_driver(phone: str, service: DriverService = Depends(get_driver_lookup_service)):
+    driver = await service.get_driver_by_phone(phone)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     return driver
 
+@router.get("/nearby", response_model=List[NearbyDriver])
+async def read_nearby_drivers(
+    latitude: float = Query(..., ge=-90, le=90),
+    longitude: float = Query(..., ge=-180, le=180),
+    limit: int = Query(10, ge=1, le=100),
+    radius: Optional[float] = Query(None, gt=0, le=50000)
+):
+    # Без radius - limit ближайших (k-NN) в пределах SPATIAL_INDEX_MAX_RADIUS.
+    # Соединение из пула не берём: ответ целиком из памяти процесса
+    return DriverService.find_nearby(latitude, longitude, limit, radius)
+
 @router.get("/{driver_id}", response_model=Driver)
-def read_driver(driver_id: str, service: DriverService = Depends(get_driver_service)):
-    driver = service.get_driver(driver_id)
+async def read_driver(driver_id: str, service: DriverService = Depends(get_driver_lookup_service)):
+    driver = await service.get_driver(driver_id)
     if not driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     return driver
 
 @router.post("/", response_model=Driver, status_code=201)
-def create_driver(driver: DriverCreate, service: DriverService = Depends(get_driver_service)):
+async def create_driver(driver: DriverCreate, service: DriverService = Depends(get_driver_service)):
     try:
-        return service.create_driver(driver)
+        return await service.create_driver(driver)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/{driver_id}", response_model=Driver)
-def update_driver(driver_id: str, driver: DriverUpdate, service: DriverService = Depends(get_driver_service)):
-    updated_driver = service.update_driver(driver_id, driver)
+async def update_driver(driver_id: str, driver: DriverUpdate, service: DriverService = Depends(get_driver_service)):
+    updated_driver = await service.update_driver(driver_id, driver)
     if not updated_driver:
         raise HTTPException(status_code=404, detail="Driver not found")
     return updated_driver
 
 @router.delete("/{driver_id}")
-def delete_driver(driver_id: str, service: DriverService = Depends(get_driver_service)):
-    success = service.delete_driver(driver_id)
+async def delete_driver(driver_id: str, service: DriverService = Depends(get_driver_service)):
+    success = await service.delete_driver(driver_id)
     if not success:
         raise HTTPException(status_code=404, detail="Driver not found")
     return {"message": "Driver deleted successfully"}
+
+@router.post("/locations", response_model=LocationAck, status_code=202)
+async def ingest_locations(batch: LocationBatch, service: DriverService = Depends(get_driver_location_service)):
+    if len(batch.pings) > settings.LOCATION_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many pings in one batch (max {settings.LOCATION_BATCH_MAX_SIZE})"
+        )
+    accepted = await service.ingest_locations(batch.pings)
+    return LocationAck(accepted=accepted)
+
+@router.post("/status", response_model=DriverStatusBatchResult)
+async def update_driver_statuses(batch: DriverStatusBatch, service: DriverService = Depends(get_driver_service)):
+    # Массовый выход на линию / с линии в пересменку: один UPDATE и один pipeline Redis
+    if len(batch.updates) > settings.STATUS_BATCH_MAX_SIZE:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Too many updates in one batch (max {settings.STATUS_BATCH_MAX_SIZE})"
+        )
+    return await service.update_statuses(batch.updates)
+
+@router.post("/{driver_id}/location", response_model=LocationAck, status_code=202)
+async def ingest_location(
+    driver_id: UUID,
+    location: LocationUpdate,
+    service: DriverService = Depends(get_driver_location_service)
+):
+    # UUID в пути: некорректный id - 422 до записи в Redis и write-behind
+    ping = DriverLocationPing(driver_id=str(driver_id), **location.model_dump())
+    accepted = await service.ingest_locations([ping])
+    return LocationAck(accepted=accepted)
@@ -0,0 +1,93 @@
+# services/driver-service/serialization.py
+"""
+Быстрый путь от строки PostgreSQL до JSON-ответа.
+
+Строки из базы уже проверены схемой таблицы, поэтому модели из них собираются
+без валидации, как model_construct (from_row / from_rows). DECIMAL приводится к
+float, как это сделала бы валидация, лишние колонки отбрасываются.
+
+Списки отдаются ORJSONListResponse: orjson пишет модели сразу в байты, а FastAPI
+не прогоняет готовый Response через response_model (повторная валидация и
+сериализация каждой строки). response_model в декораторе остаётся для OpenAPI.
+"""
+from decimal import Decimal
+from functools import lru_cache
+from typing import Any, Iterable, List, Optional, Type, TypeVar, Union, get_args, get_origin
+
+import orjson
+from fastapi.responses import Response
+from pydantic import BaseModel
+
+M = TypeVar("M", bound=BaseModel)
+
+
+_object_setattr = object.__setattr__
+
+
+@lru_cache(maxsize=None)
+def _plan(model: Type[BaseModel]) -> tuple:
+    """(все поля, поля float и Optional[float]) - psycopg2 и asyncpg отдают DECIMAL как Decimal"""
+    floats = []
+    for name, field in model.model_fields.items():
+        annotation = field.annotation
+        if get_origin(annotation) is Union:
+            annotation = next((arg for arg in get_args(annotation) if arg is not type(None)), None)
+        if annotation is float:
+            floats.append(name)
+    return tuple(model.model_fields), tuple(floats)
+
+
+def from_row(model: Type[M], row) -> Optional[M]:
+    """Модель из строки базы без валидации; None для пустой строки"""
+    if row is None:
+        return None
+    names, floats = _plan(model)
+    try:
+        data = {name: row[name] for name in names}
+    except KeyError:
+        data = None
+    if data is None:
+        # Запрос вернул не все поля - значения по умолчанию подставит model_construct
+        keys = set(row.keys())
+        data = {name: row[name] for name in names if name in keys}
+    for name in floats:
+        value = data.get(name)
+        if value is not None and value.__class__ is not float:
+            data[name] = float(value)
+    if len(data) < len(names):
+        return model.model_construct(**data)
+    # То же, что делает model_construct, но без поиска значений по умолчанию для каждого поля:
+    # в pydantic 2.5 он заметно медленнее самой валидации
+    obj = model.__new__(model)
+    _object_setattr(obj, "__dict__", data)
+    _object_setattr(obj, "__pydantic_fields_set__", set(names))
+    _object_setattr(obj, "__pydantic_extra__", None)
+    _object_setattr(obj, "__pydantic_private__", None)
+    return obj
+
+
+def from_rows(model: Type[M], rows: Iterable) -> List[M]:
+    return [from_row(model, row) for row in rows]
+
+
+def _default(obj: Any):
+    # orjson сам пишет dict, list, str, числа, datetime и UUID; модели - через их поля
+    if isinstance(obj, BaseModel):
+        return obj.__dict__
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def dumps(content: Any) -> bytes:
+    return orjson.dumps(content, default=_default)
+
+
+class ORJSONListResponse(Response):
+    """Ответ из списка моделей (или уже готовых байт) без повторной валидации"""
+    media_type = "application/json"
+
+    def render(self, content: Any) -> bytes:
+        if isinstance(content, bytes):
+            return content
+        return dumps(content)
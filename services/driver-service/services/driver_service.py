@@ -1,30 +1,142 @@
 # services/driver-service/services/driver_service.py
-from typing import List, Optional
+import inspect
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
 from repositories.driver_repository import DriverRepository
-from models.driver import Driver, DriverCreate, DriverUpdate
+from models.driver import (
+    Driver, DriverCreate, DriverUpdate, DriverLocationPing, NearbyDriver,
+    DriverStatusUpdate, DriverStatusResult, DriverStatusBatchResult,
+)
+from services.location_writer import LocationWriteBehind
+from cache import ProfileCache
+from geo_index import driver_index
+from config import settings
 
 class DriverService:
-    def __init__(self, driver_repository: DriverRepository):
+    def __init__(self, driver_repository: DriverRepository, location_writer: Optional[LocationWriteBehind] = None,
+                 cache: Optional[ProfileCache] = None):
+        # DriverRepository (psycopg2) или AsyncDriverRepository (asyncpg) - см. DB_BACKEND
         self.driver_repository = driver_repository
+        self.location_writer = location_writer
+        # None - читаем напрямую из PostgreSQL (CACHE_ENABLED=false)
+        self.cache = cache
     
-    def get_driver(self, driver_id: str) -> Optional[Driver]:
-        return self.driver_repository.get_driver(driver_id)
+    async def _run(self, method, *args):
+        # Синхронный репозиторий блокирует поток, поэтому уводим его в threadpool
+        if inspect.iscoroutinefunction(method):
+            return await method(*args)
+        return await run_in_threadpool(method, *args)
     
-    def get_driver_by_phone(self, phone: str) -> Optional[Driver]:
-        return self.driver_repository.get_driver_by_phone(phone)
+    async def _cached(self, field: str, value: str, loader) -> Optional[Driver]:
+        if self.cache is None:
+            return await self._run(loader, value)
+        driver = await self.cache.get(field, value)
+        if driver is not None:
+            return driver
+        generation = self.cache.generation
+        driver = await self._run(loader, value)
+        if driver is not None:
+            await self.cache.set(driver, generation)
+        return driver
     
-    def get_drivers(self, skip: int = 0, limit: int = 100) -> List[Driver]:
-        return self.driver_repository.get_drivers(skip, limit)
+    async def get_driver(self, driver_id: str) -> Optional[Driver]:
+        return await self._cached("id", driver_id, self.driver_repository.get_driver)
     
-    def create_driver(self, driver: DriverCreate) -> Driver:
-        existing_driver = self.driver_repository.get_driver_by_phone(driver.phone)
+    async def get_driver_by_phone(self, phone: str) -> Optional[Driver]:
+        return await self._cached("phone", phone, self.driver_repository.get_driver_by_phone)
+    
+    async def get_drivers(self, skip: int = 0, limit: int = 100,
+                          after: Optional[Tuple[datetime, str]] = None) -> List[Driver]:
+        return await self._run(self.driver_repository.get_drivers, skip, limit, after)
+    
+    async def create_driver(self, driver: DriverCreate) -> Driver:
+        existing_driver = await self._run(self.driver_repository.get_driver_by_phone, driver.phone)
         if existing_driver:
             raise ValueError(f"Driver with phone {driver.phone} already exists")
         
-        return self.driver_repository.create_driver(driver)
+        return await self._run(self.driver_repository.create_driver, driver)
+    
+    async def update_driver(self, driver_id: str, driver: DriverUpdate) -> Optional[Driver]:
+        updated_driver = await self._run(self.driver_repository.update_driver, driver_id, driver)
+        if updated_driver and self.cache:
+            await self.cache.invalidate(updated_driver)
+        return updated_driver
     
-    def update_driver(self, driver_id: str, driver: DriverUpdate) -> Optional[Driver]:
-        return self.driver_repository.update_driver(driver_id, driver)
+    async def delete_driver(self, driver_id: str) -> bool:
+        # Телефон нужен, чтобы сбросить и второй ключ кэша
+        existing_driver = await self._run(self.driver_repository.get_driver, driver_id)
+        deleted = await self._run(self.driver_repository.delete_driver, driver_id)
+        if existing_driver and self.cache:
+            await self.cache.invalidate(existing_driver)
+        return deleted
+    
+    async def update_statuses(self, updates: List[DriverStatusUpdate]) -> DriverStatusBatchResult:
+        # Один водитель дважды в пачке - побеждает последняя запись. id приводим
+        # к каноническому виду UUID, как его вернёт RETURNING
+        latest, invalid = {}, []
+        for update in updates:
+            try:
+                driver_id = str(uuid.UUID(update.driver_id))
+            except ValueError:
+                invalid.append(update.driver_id)
+                continue
+            latest.pop(driver_id, None)
+            latest[driver_id] = update.model_copy(update={"driver_id": driver_id})
+        
+        valid = list(latest.values())
+        rows = await self._run(self.driver_repository.update_statuses, valid) if valid else []
+        updated = {row["id"]: row for row in rows}
+        
+        if self.cache and rows:
+            keys = []
+            for row in rows:
+                keys += [self.cache.key("id", row["id"]), self.cache.key("phone", row["phone"])]
+            await self.cache.invalidate_keys(keys)
+        
+        results = [DriverStatusResult(driver_id=driver_id, status="invalid_id") for driver_id in invalid]
+        for driver_id in latest:
+            row = updated.get(driver_id)
+            if row is None:
+                results.append(DriverStatusResult(driver_id=driver_id, status="not_found"))
+            else:
+                results.append(DriverStatusResult(
+                    driver_id=driver_id, status="updated",
+                    is_online=row["is_online"], is_busy=row["is_busy"]
+                ))
+        return DriverStatusBatchResult(
+            updated=len(rows),
+            not_found=sum(1 for r in results if r.status == "not_found"),
+            results=results
+        )
+    
+    async def ingest_locations(self, pings: List[DriverLocationPing]) -> int:
+        """Принять пинги; возвращает, сколько из них от онлайн-водителей (остальные отброшены)"""
+        if not pings:
+            return 0
+        now = datetime.now(timezone.utc)
+        for ping in pings:
+            if ping.recorded_at is None:
+                ping.recorded_at = now
+            elif ping.recorded_at.tzinfo is None:
+                ping.recorded_at = ping.recorded_at.replace(tzinfo=timezone.utc)
+        
+        moved = await self._run(self.driver_repository.update_locations_in_redis, pings)
+        # Пинги offline, вытесненных и неизвестных водителей не пишем и в PostgreSQL:
+        # иначе триггер обновит updated_at, и sweeper не снимет водителя с линии
+        pings = [ping for ping in pings if ping.driver_id in moved]
+        # В PostgreSQL координаты попадут при следующем сбросе write-behind
+        if pings and self.location_writer is not None:
+            self.location_writer.submit(pings)
+        return len(pings)
     
-    def delete_driver(self, driver_id: str) -> bool:
-        return self.driver_repository.delete_driver(driver_id)
+    @staticmethod
+    def find_nearby(latitude: float, longitude: float, limit: int,
+                    radius: Optional[float] = None) -> List[NearbyDriver]:
+        # Только память процесса: ни PostgreSQL, ни Redis не трогаем
+        if radius is not None:
+            found = driver_index.within_radius(latitude, longitude, radius, limit)
+        else:
+            found = driver_index.nearest(latitude, longitude, limit, settings.SPATIAL_INDEX_MAX_RADIUS)
+        return [NearbyDriver(**item) for item in found]
@@ -0,0 +1,213 @@
+# services/driver-service/services/driver_sweeper.py
+"""
+Очистка drivers:online от водителей, которые перестали присылать пинги.
+
+drivers:last_seen (ZSET, score - unix time последнего пинга) ведётся теми же
+записями, что и drivers:online. Раз в DRIVER_SWEEP_INTERVAL секунд всё, что
+старше DRIVER_STALE_AFTER, удаляется пачками по DRIVER_SWEEP_BATCH_SIZE
+Lua-скриптом: выборка и удаление атомарны, поэтому пинг, пришедший во время
+очистки, водителя не потеряет, а свиперы нескольких реплик не мешают друг другу.
+Убранные водители помечаются offline в PostgreSQL, иначе пересборка geo-индекса
+и sync_drivers_to_redis.py вернули бы их обратно.
+"""
+import asyncio
+import logging
+import threading
+import time
+from collections import deque
+from typing import List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from cache import driver_cache
+from config import settings
+from db import db
+from geo_index import driver_index
+
+logger = logging.getLogger(__name__)
+
+GEO_KEY = "drivers:online"
+LAST_SEEN_KEY = "drivers:last_seen"
+LOCATION_KEY_PREFIX = "driver:location:"
+
+# KEYS[1] - drivers:last_seen, KEYS[2] - drivers:online; ARGV: cutoff, limit, префикс HASH
+EVICT_SCRIPT = """
+local ids = redis.call('ZRANGEBYSCORE', KEYS[1], '-inf', ARGV[1], 'LIMIT', 0, ARGV[2])
+if #ids == 0 then
+    return ids
+end
+redis.call('ZREM', KEYS[1], unpack(ids))
+redis.call('ZREM', KEYS[2], unpack(ids))
+for _, id in ipairs(ids) do
+    redis.call('DEL', ARGV[3] .. id)
+end
+return ids
+"""
+
+# Водитель мог снова выйти на линию через API - тогда updated_at свежий и его не трогаем
+MARK_OFFLINE_SQL_SYNC = """
+    UPDATE drivers SET is_online = false
+    WHERE id = ANY(%s::uuid[]) AND is_online = true
+      AND updated_at < NOW() - make_interval(secs => %s)
+    RETURNING id::text, phone
+"""
+MARK_OFFLINE_SQL_ASYNC = """
+    UPDATE drivers SET is_online = false
+    WHERE id = ANY($1::uuid[]) AND is_online = true
+      AND updated_at < NOW() - make_interval(secs => $2)
+    RETURNING id::text, phone
+"""
+
+RATE_WINDOW_SECONDS = 600
+
+
+class StaleDriverSweeper:
+    def __init__(self, interval: float, stale_after: float, batch_size: int):
+        self.interval = interval
+        self.stale_after = stale_after
+        self.batch_size = batch_size
+        # updated_at в PostgreSQL ставит сброс write-behind, т.е. позже последнего пинга
+        # на интервал сброса - сравниваем с запасом
+        self.offline_after = max(stale_after - 2 * settings.LOCATION_FLUSH_INTERVAL, stale_after / 2)
+        self._lock = threading.Lock()
+        self._task = None
+        self._script = None
+
+        self.evicted_total = 0
+        self.last_sweep_at = None
+        self.last_sweep_evicted = 0
+        # (время, сколько убрали) за последние RATE_WINDOW_SECONDS - для eviction rate
+        self._history = deque()
+
+    async def _redis(self, method: str, *args, **kwargs):
+        client = db.redis
+        if settings.DB_BACKEND == "async":
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_in_threadpool(getattr(client, method), *args, **kwargs)
+
+    async def _evict_batch(self, cutoff: float) -> List[str]:
+        if self._script is None:
+            self._script = db.redis.register_script(EVICT_SCRIPT)
+        args = dict(keys=[LAST_SEEN_KEY, GEO_KEY], args=[cutoff, self.batch_size, LOCATION_KEY_PREFIX])
+        if settings.DB_BACKEND == "async":
+            return await self._script(**args)
+        return await run_in_threadpool(self._script, **args)
+
+    async def _mark_offline(self, ids: List[str]) -> List[Tuple[str, str]]:
+        if settings.DB_BACKEND == "async":
+            async with db.async_connection() as conn:
+                rows = await conn.fetch(MARK_OFFLINE_SQL_ASYNC, ids, float(self.offline_after))
+            return [tuple(row) for row in rows]
+        return await run_in_threadpool(self._mark_offline_sync, ids)
+
+    def _mark_offline_sync(self, ids: List[str]) -> List[Tuple[str, str]]:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(MARK_OFFLINE_SQL_SYNC, (ids, self.offline_after))
+                rows = cur.fetchall()
+            conn.commit()
+        return rows
+
+    async def adopt_untracked(self) -> int:
+        """Водителям в drivers:online без отметки last_seen (записаны до свипера) ставим "сейчас" """
+        now = time.time()
+        adopted = 0
+        cursor = 0
+        while True:
+            cursor, members = await self._redis("zscan", GEO_KEY, cursor, count=self.batch_size)
+            if members:
+                adopted += await self._redis(
+                    "zadd", LAST_SEEN_KEY, {member: now for member, _ in members}, nx=True
+                )
+            if cursor == 0:
+                break
+        return adopted
+
+    async def sweep(self) -> int:
+        cutoff = time.time() - self.stale_after
+        evicted = 0
+        while True:
+            ids = await self._evict_batch(cutoff)
+            if not ids:
+                break
+            evicted += len(ids)
+            for driver_id in ids:
+                driver_index.remove(driver_id)
+            try:
+                offline = await self._mark_offline(ids)
+            except Exception as e:
+                # Redis уже очищен; в PostgreSQL водитель остался online, и полная
+                # синхронизация вернёт его в drivers:online со старым last_seen до следующей очистки
+                logger.error(f"Failed to mark {len(ids)} stale drivers offline: {e}")
+                offline = []
+            keys = []
+            for driver_id, phone in offline:
+                keys += [driver_cache.key("id", driver_id), driver_cache.key("phone", phone)]
+            await driver_cache.invalidate_keys(keys)
+            if len(ids) < self.batch_size:
+                break
+
+        now = time.time()
+        with self._lock:
+            self.evicted_total += evicted
+            self.last_sweep_at = now
+            self.last_sweep_evicted = evicted
+            self._history.append((now, evicted))
+            while self._history and self._history[0][0] < now - RATE_WINDOW_SECONDS:
+                self._history.popleft()
+        return evicted
+
+    async def stats(self) -> dict:
+        try:
+            geoset_size = await self._redis("zcard", GEO_KEY)
+            tracked = await self._redis("zcard", LAST_SEEN_KEY)
+        except Exception as e:
+            logger.warning(f"Failed to read GEOSET size: {e}")
+            geoset_size = tracked = None
+        with self._lock:
+            window_evicted = sum(count for _, count in self._history)
+            return {
+                "geoset_size": geoset_size,
+                "last_seen_size": tracked,
+                "stale_after_seconds": self.stale_after,
+                "evicted_total": self.evicted_total,
+                "last_sweep_at": self.last_sweep_at,
+                "last_sweep_evicted": self.last_sweep_evicted,
+                "evictions_per_minute": round(window_evicted / (RATE_WINDOW_SECONDS / 60), 2),
+            }
+
+    async def _run(self):
+        try:
+            adopted = await self.adopt_untracked()
+            if adopted:
+                logger.info(f"Started tracking last_seen for {adopted} drivers")
+        except Exception as e:
+            logger.error(f"Failed to adopt untracked drivers: {e}")
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                evicted = await self.sweep()
+            except Exception as e:
+                logger.error(f"Stale driver sweep failed: {e}")
+                continue
+            if evicted:
+                logger.info(f"Evicted {evicted} stale drivers from {GEO_KEY}")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+driver_sweeper = StaleDriverSweeper(
+    settings.DRIVER_SWEEP_INTERVAL,
+    settings.DRIVER_STALE_AFTER,
+    settings.DRIVER_SWEEP_BATCH_SIZE,
+)
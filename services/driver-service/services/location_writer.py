@@ -0,0 +1,132 @@
+# services/driver-service/services/location_writer.py
+"""
+Отложенная запись координат водителей в PostgreSQL (write-behind).
+
+GPS-пинги сразу попадают в Redis, а в drivers.current_latitude/current_longitude
+уходят пачкой раз в LOCATION_FLUSH_INTERVAL секунд. Между сбросами для каждого
+водителя хранится только последняя точка, поэтому нагрузка на базу зависит от
+числа активных водителей, а не от частоты пингов.
+"""
+import asyncio
+import logging
+import threading
+from datetime import datetime
+from typing import Dict, List, Tuple
+
+import asyncpg
+import psycopg2
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+from models.driver import DriverLocationPing
+
+logger = logging.getLogger(__name__)
+
+# Один UPDATE на всю пачку; unnest одинаково работает с psycopg2 и asyncpg
+FLUSH_SQL_SYNC = """
+    UPDATE drivers AS d
+    SET current_latitude = v.lat, current_longitude = v.lon
+    FROM unnest(%s::uuid[], %s::float8[], %s::float8[]) AS v(id, lat, lon)
+    WHERE d.id = v.id
+"""
+FLUSH_SQL_ASYNC = """
+    UPDATE drivers AS d
+    SET current_latitude = v.lat, current_longitude = v.lon
+    FROM unnest($1::uuid[], $2::float8[], $3::float8[]) AS v(id, lat, lon)
+    WHERE d.id = v.id
+"""
+# Ошибки в самих данных: повтор той же пачки упадёт снова, поэтому её делим,
+# а не возвращаем в очередь. Остальное (нет соединения и т.п.) - повторяем
+DATA_ERRORS = (psycopg2.DataError, asyncpg.exceptions.DataError)
+
+
+class LocationWriteBehind:
+    def __init__(self, interval: float):
+        self.interval = interval
+        # driver_id -> (latitude, longitude, recorded_at)
+        self._pending: Dict[str, Tuple[float, float, datetime]] = {}
+        # submit() вызывается и из event loop, и из threadpool
+        self._lock = threading.Lock()
+        self._task = None
+
+    def submit(self, pings: List[DriverLocationPing]):
+        with self._lock:
+            for ping in pings:
+                self._merge(ping.driver_id, (ping.latitude, ping.longitude, ping.recorded_at))
+
+    def _merge(self, driver_id: str, point: Tuple[float, float, datetime]):
+        # Пинги могут прийти не по порядку - оставляем самую свежую точку
+        current = self._pending.get(driver_id)
+        if current is None or point[2] >= current[2]:
+            self._pending[driver_id] = point
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending)
+
+    async def flush(self) -> int:
+        with self._lock:
+            batch, self._pending = self._pending, {}
+        if not batch:
+            return 0
+
+        try:
+            return await self._write(list(batch.items()))
+        except Exception as e:
+            logger.error(f"Location flush failed, will retry {len(batch)} drivers: {e}")
+            # Возвращаем пачку, не затирая точки, пришедшие во время сброса
+            with self._lock:
+                for driver_id, point in batch.items():
+                    self._merge(driver_id, point)
+            return 0
+
+    async def _write(self, items: List[Tuple[str, Tuple[float, float, datetime]]]) -> int:
+        """Записать пачку; при ошибке в данных - делить пополам, пока не останутся
+        строки-виновники, и отбросить только их. Возвращает число записанных водителей"""
+        ids = [driver_id for driver_id, _ in items]
+        lats = [point[0] for _, point in items]
+        lons = [point[1] for _, point in items]
+        try:
+            if settings.DB_BACKEND == "async":
+                async with db.async_connection() as conn:
+                    await conn.execute(FLUSH_SQL_ASYNC, ids, lats, lons)
+            else:
+                await run_in_threadpool(self._flush_sync, ids, lats, lons)
+        except DATA_ERRORS as e:
+            if len(items) == 1:
+                logger.error(f"Dropping location of driver {ids[0]!r}: {e}")
+                return 0
+            middle = len(items) // 2
+            return await self._write(items[:middle]) + await self._write(items[middle:])
+        return len(items)
+
+    def _flush_sync(self, ids, lats, lons):
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(FLUSH_SQL_SYNC, (ids, lats, lons))
+            conn.commit()
+
+    async def _run(self):
+        while True:
+            await asyncio.sleep(self.interval)
+            flushed = await self.flush()
+            if flushed:
+                logger.info(f"Flushed locations for {flushed} drivers")
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # Последний сброс до закрытия пулов
+        await self.flush()
+
+
+location_writer = LocationWriteBehind(settings.LOCATION_FLUSH_INTERVAL)
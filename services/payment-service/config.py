@@ -1,4 +1,31 @@
 import os
 
 KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:29092')
+# Producer batching/backpressure: events wait up to KAFKA_LINGER_MS to be batched and
+# compressed; when the buffer is full new payments are rejected with 503
+KAFKA_LINGER_MS = int(os.getenv('KAFKA_LINGER_MS', 20))
+KAFKA_BATCH_SIZE = int(os.getenv('KAFKA_BATCH_SIZE', 65536))
+KAFKA_COMPRESSION_TYPE = os.getenv('KAFKA_COMPRESSION_TYPE', 'gzip')
+KAFKA_BUFFER_MAX_MESSAGES = int(os.getenv('KAFKA_BUFFER_MAX_MESSAGES', 10000))
+KAFKA_SHUTDOWN_TIMEOUT = float(os.getenv('KAFKA_SHUTDOWN_TIMEOUT', 10))
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+# Idempotency-Key on /payments/process: responses are kept for IDEMPOTENCY_TTL seconds,
+# a duplicate waits up to IDEMPOTENCY_WAIT_TIMEOUT for the first request to finish
+IDEMPOTENCY_TTL = int(os.getenv('IDEMPOTENCY_TTL', 86400))
+IDEMPOTENCY_LOCK_TTL = int(os.getenv('IDEMPOTENCY_LOCK_TTL', 30))
+IDEMPOTENCY_WAIT_TIMEOUT = float(os.getenv('IDEMPOTENCY_WAIT_TIMEOUT', 10))
+# Async payments (POST /process?mode=async): 202 at once, the provider is called by a worker pool.
+# PAYMENT_PROCESS_MODE is the mode when the request does not choose one
+PAYMENT_PROCESS_MODE = os.getenv('PAYMENT_PROCESS_MODE', 'sync')
+# Provider calls in flight: for the whole service and per provider ("name=limit,...")
+PAYMENT_WORKERS = int(os.getenv('PAYMENT_WORKERS', 32))
+PAYMENT_PROVIDER_CONCURRENCY = os.getenv('PAYMENT_PROVIDER_CONCURRENCY', 'stripe=16,mock=32')
+PAYMENT_PROVIDER_DEFAULT_CONCURRENCY = int(os.getenv('PAYMENT_PROVIDER_DEFAULT_CONCURRENCY', 8))
+# Payments waiting for a worker; beyond this new async payments get 503
+PAYMENT_QUEUE_SIZE = int(os.getenv('PAYMENT_QUEUE_SIZE', 10000))
+# Seconds the status of an async payment can be polled
+PAYMENT_STATUS_TTL = int(os.getenv('PAYMENT_STATUS_TTL', 86400))
+# Seconds queued payments get to finish at shutdown; the rest are failed without charging
+PAYMENT_SHUTDOWN_TIMEOUT = float(os.getenv('PAYMENT_SHUTDOWN_TIMEOUT', 10))
 STRIPE_SECRET_KEY = os.getenv('STRIPE_SECRET_KEY', 'sk_test_...')
@@ -0,0 +1,207 @@
+# Shared by ride-service and payment-service: keep the code of both copies identical
+# (comments are in the language of each service).
+"""
+Idempotency-Key support for POST endpoints that clients retry on timeout.
+
+The first request with a key takes an in-flight lock in Redis (SET NX with
+lock_ttl) and runs normally. Its response (status + JSON body) replaces the lock
+and lives for ttl seconds. Duplicates that arrive meanwhile poll the key until
+the result appears, then replay it. The key is bound to a hash of the request
+body, so reusing it with a different body is rejected with 422.
+
+If the handler fails (exception or no result recorded), the lock is dropped
+and the next retry runs from scratch. If Redis is unavailable, requests run
+without deduplication, as they did before.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import redis.asyncio as aioredis
+from fastapi import Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# KEYS[1] - idempotency key; ARGV: our lock value, new value ("" = delete), ttl.
+# A lock that expired and was taken by another request is left alone
+FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+class IdempotencyReplay(Exception):
+    """Raised from the dependency to short-circuit a duplicate with the stored response"""
+
+    def __init__(self, status_code: int, body: Any):
+        self.status_code = status_code
+        self.body = body
+
+
+def replay_response(exc: IdempotencyReplay) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content=exc.body, headers={REPLAYED_HEADER: "true"})
+
+
+class IdempotencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "started": 0,
+            "replayed": 0,
+            "waited": 0,
+            "in_progress_conflicts": 0,
+            "mismatches": 0,
+            "redis_errors": 0,
+        }
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+class IdempotentRequest:
+    """Handle for the request that owns the key; the handler records its result here"""
+
+    def __init__(self, key: str, lock: str, fingerprint: str):
+        self.key = key
+        self.lock = lock
+        self.fingerprint = fingerprint
+        self.result: Optional[dict] = None
+
+    def complete(self, body: Any, status_code: int = 200):
+        self.result = {
+            "state": "done",
+            "fingerprint": self.fingerprint,
+            "status_code": status_code,
+            "body": jsonable_encoder(body),
+        }
+
+
+class IdempotencyStore:
+    def __init__(self, scope: str, get_client: Callable[[], Any], ttl: int, lock_ttl: int, wait_timeout: float):
+        # scope separates endpoints: the same client key may be sent to both of them
+        self.scope = scope
+        self.get_client = get_client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.stats = IdempotencyStats()
+
+    async def _redis(self, method: str, *args, **kwargs):
+        client = self.get_client()
+        if isinstance(client, aioredis.Redis):
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_in_threadpool(getattr(client, method), *args, **kwargs)
+
+    def key(self, idempotency_key: str) -> str:
+        return f"idempotency:{self.scope}:{idempotency_key}"
+
+    async def begin(self, idempotency_key: str, fingerprint: str) -> Optional[IdempotentRequest]:
+        """Take the key, or raise IdempotencyReplay / HTTPException for a duplicate.
+
+        Returns None if Redis is unavailable (the request runs without deduplication).
+        """
+        key = self.key(idempotency_key)
+        lock = json.dumps({"state": "in_progress", "token": uuid.uuid4().hex, "fingerprint": fingerprint})
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        waited = False
+        while True:
+            try:
+                if await self._redis("set", key, lock, nx=True, ex=self.lock_ttl):
+                    self.stats.incr("started")
+                    return IdempotentRequest(key, lock, fingerprint)
+                raw = await self._redis("get", key)
+            except Exception as e:
+                self.stats.incr("redis_errors")
+                logger.warning(f"Idempotency check failed for {key}: {e}")
+                return None
+            if raw is None:
+                # The first request failed and released the key - try to take it ourselves
+                continue
+
+            entry = json.loads(raw)
+            if entry["fingerprint"] != fingerprint:
+                self.stats.incr("mismatches")
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} was already used with a different request body",
+                )
+            if entry["state"] == "done":
+                self.stats.incr("replayed")
+                raise IdempotencyReplay(entry["status_code"], entry["body"])
+            if time.monotonic() >= deadline:
+                self.stats.incr("in_progress_conflicts")
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                )
+            if not waited:
+                waited = True
+                self.stats.incr("waited")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def finish(self, request: IdempotentRequest):
+        """Store the recorded result for replay, or release the key if there is none"""
+        value = json.dumps(request.result) if request.result is not None else ""
+        try:
+            await self._redis("eval", FINISH_SCRIPT, 1, request.key, request.lock, value, self.ttl)
+        except Exception as e:
+            # The lock expires by itself after lock_ttl
+            self.stats.incr("redis_errors")
+            logger.warning(f"Idempotency result write failed for {request.key}: {e}")
+
+    def dependency(self):
+        """FastAPI dependency yielding IdempotentRequest (or None without the header).
+
+        Declare it before dependencies that take resources (e.g. a DB connection),
+        so duplicates wait and replay without holding them.
+        """
+
+        async def idempotent_request(
+            request: Request,
+            idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+        ):
+            if not idempotency_key:
+                yield None
+                return
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters",
+                )
+            fingerprint = hashlib.sha256(await request.body()).hexdigest()
+            handle = await self.begin(idempotency_key, fingerprint)
+            if handle is None:
+                yield None
+                return
+            try:
+                yield handle
+            finally:
+                await self.finish(handle)
+
+        return idempotent_request
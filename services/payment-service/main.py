@@ -1,8 +1,35 @@
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import JSONResponse
 from routers import payments
+from idempotency import IdempotencyReplay, replay_response
+from producer.kafka_producer import ProducerBufferFullError, get_producer, start_producer, stop_producer
+from services.payment_queue import PaymentQueueFullError, StatusStoreUnavailableError
+import config
 import uvicorn
 
-app = FastAPI(title="Payment Service", version="1.0.0")
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Connects to Kafka in the background, so the service starts without brokers
+    start_producer(
+        config.KAFKA_BOOTSTRAP_SERVERS,
+        linger_ms=config.KAFKA_LINGER_MS,
+        batch_size=config.KAFKA_BATCH_SIZE,
+        compression_type=config.KAFKA_COMPRESSION_TYPE,
+        max_buffered=config.KAFKA_BUFFER_MAX_MESSAGES,
+        shutdown_timeout=config.KAFKA_SHUTDOWN_TIMEOUT,
+    )
+    payments.payment_pool.start()
+    yield
+    # Finish queued async payments while the producer can still publish their events
+    await payments.payment_pool.stop()
+    # Flush buffered events before exit
+    await run_in_threadpool(stop_producer)
+    await payments.redis_client.aclose()
+
+app = FastAPI(title="Payment Service", version="1.0.0", lifespan=lifespan)
 
 # Include routers
 app.include_router(payments.router)
@@ -11,5 +38,27 @@ app.include_router(payments.router)
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/kafka")
+def kafka_health_check():
+    return get_producer().stats()
+
+@app.get("/health/idempotency")
+def idempotency_health_check():
+    return payments.payment_idempotency.stats.snapshot()
+
+@app.get("/health/payments")
+def payments_health_check():
+    return payments.payment_pool.stats()
+
+@app.exception_handler(IdempotencyReplay)
+async def idempotency_replay_handler(request: Request, exc: IdempotencyReplay):
+    return replay_response(exc)
+
+@app.exception_handler(ProducerBufferFullError)
+@app.exception_handler(PaymentQueueFullError)
+@app.exception_handler(StatusStoreUnavailableError)
+async def overload_handler(request: Request, exc: Exception):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8007)
@@ -19,6 +19,18 @@ class PaymentResponse(BaseModel):
     created_at: datetime
     transaction_id: Optional[str] = None
 
+class PaymentAccepted(BaseModel):
+    """202 answer of an async payment; the result is polled at status_url"""
+    payment_id: str
+    ride_id: str
+    status: str  # pending
+    status_url: str
+
+class PaymentStatus(PaymentResponse):
+    """Async payment: pending -> processing -> succeeded / failed"""
+    updated_at: datetime
+    error: Optional[str] = None
+
 class PaymentEvent(BaseModel):
     payment_id: str
     ride_id: str
@@ -0,0 +1,204 @@
+# Shared by ride-service and payment-service: keep the code of both copies identical
+# (comments are in the language of each service).
+#
+# The package is called "producer", not "kafka": a local kafka/ directory is
+# shadowed by kafka-python and could never be imported.
+import json
+import logging
+import queue
+import threading
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Any, Callable, List, Optional, Tuple
+
+from kafka import KafkaProducer
+from kafka.errors import KafkaError
+
+logger = logging.getLogger(__name__)
+
+
+class ProducerBufferFullError(Exception):
+    """The in-memory event buffer is full; callers should shed load (HTTP 503)."""
+
+
+def json_serializer(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+class EventProducer:
+    """Non-blocking Kafka publisher.
+
+    publish() only puts the event on a bounded queue. A background thread owns
+    the KafkaProducer: it (re)connects, hands events to the client, which
+    batches them (linger_ms/batch_size) and compresses them, and counts
+    delivery results in the callbacks. The request path never waits on Kafka,
+    and the service starts even when the brokers are down.
+    """
+
+    def __init__(self, bootstrap_servers: str, linger_ms: int = 20, batch_size: int = 64 * 1024,
+                 compression_type: str = "gzip", max_buffered: int = 10000,
+                 shutdown_timeout: float = 10.0, reconnect_backoff: float = 2.0):
+        self.bootstrap_servers = bootstrap_servers
+        self.linger_ms = linger_ms
+        self.batch_size = batch_size
+        self.compression_type = compression_type
+        self.shutdown_timeout = shutdown_timeout
+        self.reconnect_backoff = reconnect_backoff
+
+        self._queue: "queue.Queue" = queue.Queue(maxsize=max_buffered)
+        self._producer: Optional[KafkaProducer] = None
+        self._stopping = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+        self._lock = threading.Lock()
+        self._counters = {"published": 0, "delivered": 0, "failed": 0, "dropped": 0}
+
+    # --- request path ---
+
+    @property
+    def saturated(self) -> bool:
+        return self._queue.full()
+
+    def ensure_capacity(self):
+        """Reject new work up front instead of accepting it and dropping its event later."""
+        if self._queue.full():
+            raise ProducerBufferFullError(
+                f"Event buffer is full ({self._queue.maxsize} messages), Kafka is not keeping up"
+            )
+
+    def publish(self, topic: str, value: Any, key: Optional[str] = None,
+                headers: Optional[List[Tuple[str, bytes]]] = None,
+                on_delivery: Optional[Callable[[Optional[Exception]], None]] = None) -> bool:
+        """Queue an event. on_delivery(None) / on_delivery(exc) is called from the
+        producer thread once Kafka acknowledges or rejects it."""
+        try:
+            self._queue.put_nowait((topic, key, value, headers, on_delivery))
+        except queue.Full:
+            self._incr("dropped")
+            logger.error(f"Event buffer full, dropped {topic} event (key={key})")
+            return False
+        self._incr("published")
+        return True
+
+    # --- background sender ---
+
+    def _connect(self) -> bool:
+        try:
+            self._producer = KafkaProducer(
+                bootstrap_servers=[s.strip() for s in self.bootstrap_servers.split(",")],
+                key_serializer=lambda k: k.encode("utf-8") if k is not None else None,
+                value_serializer=lambda v: json.dumps(v, default=json_serializer).encode("utf-8"),
+                linger_ms=self.linger_ms,
+                batch_size=self.batch_size,
+                compression_type=self.compression_type,
+                acks="all",
+                retries=5,
+                # With retries, more than one in-flight request can reorder events of the same key
+                max_in_flight_requests_per_connection=1,
+            )
+            logger.info(f"Connected to Kafka at {self.bootstrap_servers}")
+            return True
+        except KafkaError as e:
+            logger.warning(f"Kafka unavailable ({e}), {self._queue.qsize()} events buffered")
+            return False
+
+    def _run(self):
+        while not (self._stopping.is_set() and self._queue.empty()):
+            if self._producer is None:
+                if self._stopping.is_set():
+                    break
+                if not self._connect():
+                    self._stopping.wait(self.reconnect_backoff)
+                    continue
+            try:
+                topic, key, value, headers, on_delivery = self._queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            try:
+                future = self._producer.send(topic, key=key, value=value, headers=headers)
+                future.add_callback(self._on_delivered, on_delivery)
+                future.add_errback(self._on_failed, topic, key, on_delivery)
+            except Exception as e:
+                self._on_failed(topic, key, on_delivery, e)
+
+        left = 0
+        while True:
+            try:
+                topic, key, _, _, on_delivery = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            left += 1
+            if on_delivery is not None:
+                on_delivery(RuntimeError("Producer stopped before the event was sent"))
+        if left:
+            self._incr("dropped", left)
+            logger.error(f"Shutting down without Kafka, {left} buffered events lost")
+        if self._producer is not None:
+            self._producer.flush(timeout=self.shutdown_timeout)
+            self._producer.close(timeout=self.shutdown_timeout)
+            self._producer = None
+
+    def _on_delivered(self, on_delivery, metadata):
+        self._incr("delivered")
+        if on_delivery is not None:
+            on_delivery(None)
+
+    def _on_failed(self, topic, key, on_delivery, exc):
+        self._incr("failed")
+        logger.error(f"Failed to deliver {topic} event (key={key}): {exc}")
+        if on_delivery is not None:
+            on_delivery(exc)
+
+    def _incr(self, name: str, value: int = 1):
+        with self._lock:
+            self._counters[name] += value
+
+    # --- lifecycle ---
+
+    def start(self):
+        self._stopping.clear()
+        self._thread = threading.Thread(target=self._run, name="kafka-producer", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Drain the buffer and flush in-flight batches (bounded by shutdown_timeout)."""
+        self._stopping.set()
+        if self._thread is not None:
+            self._thread.join(timeout=self.shutdown_timeout * 2)
+            self._thread = None
+
+    def stats(self) -> dict:
+        with self._lock:
+            result = dict(self._counters)
+        result["buffered"] = self._queue.qsize()
+        result["buffer_capacity"] = self._queue.maxsize
+        result["connected"] = self._producer is not None
+        return result
+
+
+_producer: Optional[EventProducer] = None
+
+
+def start_producer(bootstrap_servers: str, **options) -> EventProducer:
+    global _producer
+    _producer = EventProducer(bootstrap_servers, **options)
+    _producer.start()
+    return _producer
+
+
+def stop_producer():
+    global _producer
+    if _producer is not None:
+        _producer.stop()
+        _producer = None
+
+
+def get_producer() -> EventProducer:
+    """FastAPI dependency; the producer is created in the app lifespan."""
+    if _producer is None:
+        raise RuntimeError("Kafka producer is not started")
+    return _producer
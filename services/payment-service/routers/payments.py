@@ -1,30 +1,93 @@
-from fastapi import APIRouter, HTTPException
-from kafka import KafkaProducer
-import json
-import os
+from fastapi import APIRouter, Depends, HTTPException, Query, Response
+from fastapi.concurrency import run_in_threadpool
 from datetime import datetime
-from models.payment import PaymentRequest, PaymentResponse, PaymentEvent
+from typing import Optional, Union
+import uuid
+import redis.asyncio as aioredis
+from models.payment import PaymentRequest, PaymentResponse, PaymentEvent, PaymentAccepted, PaymentStatus
 from services.processor import PaymentProcessor
-from config import KAFKA_BOOTSTRAP_SERVERS
+from services.payment_queue import PaymentWorkerPool, parse_provider_limits
+from producer.kafka_producer import EventProducer, get_producer
+from idempotency import IdempotencyStore, IdempotentRequest
+import config
 
 router = APIRouter(prefix="/api/v1/payments", tags=["payments"])
 
-# Kafka producer
-def json_serializer(obj):
-    if isinstance(obj, datetime):
-        return obj.isoformat()
-    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+# Connections are opened lazily, so the service starts without Redis
+redis_client = aioredis.Redis(host=config.REDIS_HOST, port=config.REDIS_PORT, db=0, decode_responses=True)
 
-producer = KafkaProducer(
-    bootstrap_servers=[KAFKA_BOOTSTRAP_SERVERS],
-    value_serializer=lambda v: json.dumps(v, default=json_serializer).encode('utf-8')
+# A retried /process with the same Idempotency-Key returns the first charge instead of charging again
+payment_idempotency = IdempotencyStore(
+    "payments.process",
+    lambda: redis_client,
+    config.IDEMPOTENCY_TTL,
+    config.IDEMPOTENCY_LOCK_TTL,
+    config.IDEMPOTENCY_WAIT_TIMEOUT,
 )
 
-@router.post("/process", response_model=PaymentResponse)
-def process_payment(payment_request: PaymentRequest):
+# Async payments: 202 at once, the provider is called by workers (started in main.py)
+payment_pool = PaymentWorkerPool(
+    lambda: redis_client,
+    workers=config.PAYMENT_WORKERS,
+    queue_size=config.PAYMENT_QUEUE_SIZE,
+    provider_limits=parse_provider_limits(config.PAYMENT_PROVIDER_CONCURRENCY),
+    default_limit=config.PAYMENT_PROVIDER_DEFAULT_CONCURRENCY,
+    status_ttl=config.PAYMENT_STATUS_TTL,
+    shutdown_timeout=config.PAYMENT_SHUTDOWN_TIMEOUT,
+)
+
+@router.post("/process", response_model=Union[PaymentResponse, PaymentAccepted])
+async def process_payment(
+    payment_request: PaymentRequest,
+    response: Response,
+    mode: str = Query(config.PAYMENT_PROCESS_MODE, pattern="^(sync|async)$"),
+    idempotency: Optional[IdempotentRequest] = Depends(payment_idempotency.dependency()),
+    producer: EventProducer = Depends(get_producer)
+):
+    """mode=sync charges before answering; mode=async answers 202 with payment_id and charges in
+    the background (poll GET /{payment_id} or consume payments.processed)"""
+    # Reject before charging if the event buffer is full (handled as 503 in main.py)
+    producer.ensure_capacity()
+    if mode == "async":
+        # Full queue or no status store - 503 in main.py, nothing is charged
+        status = await payment_pool.submit(payment_request, str(uuid.uuid4()))
+        accepted = PaymentAccepted(
+            payment_id=status.payment_id,
+            ride_id=status.ride_id,
+            status=status.status,
+            status_url=f"{router.prefix}/{status.payment_id}"
+        )
+        if idempotency:
+            # A retry gets the same payment_id instead of queueing a second charge
+            idempotency.complete(accepted, status_code=202)
+        response.status_code = 202
+        return accepted
+    # The provider call blocks, so the synchronous path runs in the threadpool as before
+    return await run_in_threadpool(_process_now, payment_request, idempotency, producer)
+
+@router.get("/{payment_id}", response_model=PaymentStatus)
+async def get_payment_status(payment_id: str):
+    """Status of an async payment (kept for PAYMENT_STATUS_TTL seconds)"""
+    try:
+        status = await payment_pool.get_status(payment_id)
+    except Exception as e:
+        raise HTTPException(status_code=503, detail=f"Payment status store is unavailable: {str(e)}")
+    if status is None:
+        raise HTTPException(status_code=404, detail="Payment not found")
+    return status
+
+def _process_now(
+    payment_request: PaymentRequest,
+    idempotency: Optional[IdempotentRequest],
+    producer: EventProducer
+) -> PaymentResponse:
     try:
         # Process payment
         payment_result = PaymentProcessor.process_payment(payment_request)
+        if idempotency:
+            # Recorded right after the charge: even if publishing fails below,
+            # a retry must get this result rather than charge again
+            idempotency.complete(payment_result)
         
         # Send event to Kafka
         payment_event = PaymentEvent(
@@ -37,8 +100,8 @@ def process_payment(payment_request: PaymentRequest):
             timestamp=datetime.utcnow()
         )
         
-        producer.send('payments.processed', payment_event.dict())
-        producer.flush()
+        # Queued only; the background producer batches and sends it
+        producer.publish('payments.processed', payment_event.dict(), key=payment_event.ride_id)
         
         return payment_result
         
@@ -0,0 +1,255 @@
+"""
+Asynchronous payment processing (POST /process?mode=async).
+
+The request path only records the payment as "pending" in Redis (key
+payment:{payment_id}) and puts the job on an in-process queue, then answers
+202 Accepted. The provider round trip happens on the worker pool:
+
+  - every provider has its own lane (queue + workers), so a slow provider
+    fills up its own lane and does not hold jobs of the others;
+  - PAYMENT_PROVIDER_CONCURRENCY caps the calls in flight per provider
+    (PAYMENT_PROVIDER_DEFAULT_CONCURRENCY for providers not listed) and
+    PAYMENT_WORKERS caps them for the whole service;
+  - at most PAYMENT_QUEUE_SIZE jobs wait in all lanes together; beyond that
+    new payments are rejected with 503 (PaymentQueueFullError).
+
+A worker moves the status to "processing" and then to "succeeded" or "failed"
+(polled via GET /api/v1/payments/{payment_id}), and publishes payments.processed
+like the synchronous path. Jobs still queued at shutdown are marked failed
+without being charged, so the client may retry them.
+"""
+import asyncio
+import json
+import logging
+from datetime import datetime
+from typing import Any, Callable, Dict, Optional
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+
+from models.payment import PaymentEvent, PaymentRequest, PaymentStatus
+from producer.kafka_producer import get_producer
+from services.processor import PaymentProcessor
+
+logger = logging.getLogger(__name__)
+
+STATUS_KEY_PREFIX = "payment:"
+# A status written after the charge is retried a few times before giving up
+STATUS_WRITE_ATTEMPTS = 3
+
+
+class PaymentQueueFullError(Exception):
+    """Too many payments are waiting for a provider; callers should shed load (HTTP 503)"""
+
+
+class StatusStoreUnavailableError(Exception):
+    """The pending status could not be recorded, so the payment is not accepted (HTTP 503)"""
+
+
+def parse_provider_limits(value: str) -> Dict[str, int]:
+    """"stripe=16,mock=64" -> {"stripe": 16, "mock": 64}"""
+    limits = {}
+    for item in value.split(","):
+        if item.strip():
+            name, limit = item.split("=")
+            limits[name.strip()] = int(limit)
+    return limits
+
+
+class _Lane:
+    """Queue and workers of one provider"""
+
+    def __init__(self, provider: str, limit: int):
+        self.provider = provider
+        self.limit = limit
+        self.queue: "asyncio.Queue" = asyncio.Queue()
+        self.workers = []
+        self.in_flight = 0
+
+
+class PaymentWorkerPool:
+    def __init__(self, get_client: Callable[[], Any], workers: int, queue_size: int,
+                 provider_limits: Dict[str, int], default_limit: int, status_ttl: int, shutdown_timeout: float):
+        self.get_client = get_client
+        self.workers = workers
+        self.queue_size = queue_size
+        self.provider_limits = provider_limits
+        self.default_limit = default_limit
+        self.status_ttl = status_ttl
+        self.shutdown_timeout = shutdown_timeout
+        self._lanes: Dict[str, _Lane] = {}
+        self._slots: Optional[asyncio.Semaphore] = None
+        self._queued = 0
+        self._accepting = False
+        self._counters = {"accepted": 0, "rejected": 0, "succeeded": 0, "failed": 0, "status_errors": 0}
+
+    # --- status store ---
+
+    def _key(self, payment_id: str) -> str:
+        return STATUS_KEY_PREFIX + payment_id
+
+    async def _write_status(self, status: PaymentStatus):
+        await self.get_client().set(
+            self._key(status.payment_id), json.dumps(jsonable_encoder(status)), ex=self.status_ttl
+        )
+
+    async def _save_status(self, status: PaymentStatus):
+        """Write from a worker: retried, and never fails the job"""
+        for attempt in range(1, STATUS_WRITE_ATTEMPTS + 1):
+            try:
+                await self._write_status(status)
+                return
+            except Exception as e:
+                if attempt == STATUS_WRITE_ATTEMPTS:
+                    self._counters["status_errors"] += 1
+                    logger.error(f"Failed to store status {status.status} of payment {status.payment_id}: {e}")
+                    return
+                await asyncio.sleep(0.1 * attempt)
+
+    async def get_status(self, payment_id: str) -> Optional[PaymentStatus]:
+        raw = await self.get_client().get(self._key(payment_id))
+        return PaymentStatus(**json.loads(raw)) if raw is not None else None
+
+    # --- request path ---
+
+    def ensure_capacity(self):
+        if not self._accepting:
+            raise PaymentQueueFullError("Payment service is shutting down")
+        if self._queued >= self.queue_size:
+            self._counters["rejected"] += 1
+            raise PaymentQueueFullError(
+                f"Payment queue is full ({self.queue_size} payments), providers are not keeping up"
+            )
+
+    def _lane(self, provider: str) -> _Lane:
+        lane = self._lanes.get(provider)
+        if lane is None:
+            lane = _Lane(provider, self.provider_limits.get(provider, self.default_limit))
+            lane.workers = [
+                asyncio.create_task(self._work(lane), name=f"payments-{provider}-{i}") for i in range(lane.limit)
+            ]
+            self._lanes[provider] = lane
+        return lane
+
+    async def submit(self, payment_request: PaymentRequest, payment_id: str) -> PaymentStatus:
+        """Record the payment as pending and queue it; the caller answers 202"""
+        self.ensure_capacity()
+        now = datetime.utcnow()
+        status = PaymentStatus(
+            payment_id=payment_id,
+            ride_id=payment_request.ride_id,
+            status="pending",
+            amount=payment_request.amount,
+            currency=payment_request.currency,
+            created_at=now,
+            updated_at=now,
+        )
+        # The slot is taken before the write, so concurrent requests cannot overfill the queue
+        self._queued += 1
+        try:
+            await self._write_status(status)
+        except Exception as e:
+            self._queued -= 1
+            self._counters["status_errors"] += 1
+            raise StatusStoreUnavailableError(f"Payment status store is unavailable: {e}")
+        self._counters["accepted"] += 1
+        self._lane(PaymentProcessor.provider(payment_request)).queue.put_nowait((payment_request, status))
+        return status
+
+    # --- workers ---
+
+    async def _work(self, lane: _Lane):
+        while True:
+            payment_request, status = await lane.queue.get()
+            self._queued -= 1
+            try:
+                async with self._slots:
+                    lane.in_flight += 1
+                    try:
+                        await self._process(payment_request, status)
+                    finally:
+                        lane.in_flight -= 1
+            finally:
+                lane.queue.task_done()
+
+    async def _process(self, payment_request: PaymentRequest, pending: PaymentStatus):
+        await self._save_status(pending.model_copy(update={"status": "processing", "updated_at": datetime.utcnow()}))
+        try:
+            result = await run_in_threadpool(PaymentProcessor.process_payment, payment_request, pending.payment_id)
+            status = PaymentStatus(**result.model_dump(), updated_at=datetime.utcnow())
+        except Exception as e:
+            logger.error(f"Payment {pending.payment_id} failed: {e}")
+            status = pending.model_copy(update={"status": "failed", "updated_at": datetime.utcnow(), "error": str(e)})
+        self._counters["succeeded" if status.status == "succeeded" else "failed"] += 1
+        await self._save_status(status)
+        self._publish(payment_request, status)
+
+    def _publish(self, payment_request: PaymentRequest, status: PaymentStatus):
+        payment_event = PaymentEvent(
+            payment_id=status.payment_id,
+            ride_id=status.ride_id,
+            user_id=payment_request.user_id,
+            amount=status.amount,
+            currency=status.currency,
+            status=status.status,
+            timestamp=datetime.utcnow()
+        )
+        get_producer().publish('payments.processed', payment_event.dict(), key=payment_event.ride_id)
+
+    # --- lifecycle ---
+
+    def start(self):
+        self._slots = asyncio.Semaphore(self.workers)
+        self._accepting = True
+
+    async def _drain(self, lanes) -> bool:
+        try:
+            await asyncio.wait_for(asyncio.gather(*(lane.queue.join() for lane in lanes)), self.shutdown_timeout)
+            return True
+        except asyncio.TimeoutError:
+            return False
+
+    async def stop(self):
+        """Stop accepting, let queued payments finish (bounded by shutdown_timeout), fail the rest"""
+        self._accepting = False
+        lanes = list(self._lanes.values())
+        if not await self._drain(lanes):
+            # Taken off the queues at once (no await), so workers cannot pick them up meanwhile
+            left = []
+            for lane in lanes:
+                while not lane.queue.empty():
+                    left.append(lane.queue.get_nowait())
+                    lane.queue.task_done()
+            self._queued -= len(left)
+            logger.warning(f"Payment queue not drained in {self.shutdown_timeout}s, failing {len(left)} payments")
+            for payment_request, pending in left:
+                self._counters["failed"] += 1
+                status = pending.model_copy(update={
+                    "status": "failed",
+                    "updated_at": datetime.utcnow(),
+                    "error": "Not processed: payment service stopped before charging",
+                })
+                await self._save_status(status)
+                self._publish(payment_request, status)
+            # Provider calls already in flight are charging: give them time to record the result
+            if not await self._drain(lanes):
+                logger.error("Payments still in flight at shutdown, their status stays 'processing'")
+
+        for lane in lanes:
+            for worker in lane.workers:
+                worker.cancel()
+            await asyncio.gather(*lane.workers, return_exceptions=True)
+        self._lanes = {}
+
+    def stats(self) -> dict:
+        return {
+            **self._counters,
+            "accepting": self._accepting,
+            "queued": self._queued,
+            "queue_capacity": self.queue_size,
+            "workers": self.workers,
+            "providers": {
+                lane.provider: {"limit": lane.limit, "queued": lane.queue.qsize(), "in_flight": lane.in_flight}
+                for lane in self._lanes.values()
+            },
+        }
@@ -1,10 +1,20 @@
 from datetime import datetime
+from typing import Optional
 import uuid
 from models.payment import PaymentRequest, PaymentResponse
 
 class PaymentProcessor:
     @staticmethod
-    def process_payment(payment_request: PaymentRequest) -> PaymentResponse:
+    def provider(payment_request: PaymentRequest) -> str:
+        """Payment provider of the method; async payments are limited per provider"""
+        if payment_request.payment_method_id.startswith("pm_mock"):
+            return "mock"
+        return "stripe"
+
+    @staticmethod
+    def process_payment(payment_request: PaymentRequest, payment_id: Optional[str] = None) -> PaymentResponse:
+        """payment_id is given for async payments: the client already got it with 202"""
+        payment_id = payment_id or str(uuid.uuid4())
         try:
             # В тестовом режиме всегда успешная оплата
             # Здесь имитируем успешную обработку
@@ -18,7 +28,7 @@ class PaymentProcessor:
                 transaction_id = f"txn_mock_{uuid.uuid4().hex[:8]}"
             
             return PaymentResponse(
-                payment_id=str(uuid.uuid4()),
+                payment_id=payment_id,
                 ride_id=payment_request.ride_id,
                 status=status,
                 amount=payment_request.amount,
@@ -30,7 +40,7 @@ class PaymentProcessor:
         except Exception as e:
             # В случае ошибки - возвращаем failed
             return PaymentResponse(
-                payment_id=str(uuid.uuid4()),
+                payment_id=payment_id,
                 ride_id=payment_request.ride_id,
                 status="failed",
                 amount=payment_request.amount,
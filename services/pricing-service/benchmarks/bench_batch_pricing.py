@@ -0,0 +1,130 @@
+#!/usr/bin/env python3
+"""
+Batch pricing benchmark: scalar calculate_pricing loop vs calculate_pricing_batch.
+
+Usage (from services/pricing-service):
+    python benchmarks/bench_batch_pricing.py
+    python benchmarks/bench_batch_pricing.py --sizes 1 100 100000 --endpoint
+    python benchmarks/bench_batch_pricing.py --tariff UberSUV
+    python benchmarks/bench_batch_pricing.py --road-matrix ../../data/road_matrix
+
+Trips are spread over the NYC bbox and a week of pickup times. For every size the
+batch result is checked against the scalar path field by field. --endpoint also
+measures POST /api/v1/pricing/calculate/batch in-process (TestClient: JSON
+parsing, validation and serialization included, no network). Tariffs are the
+seed rows of init.sql (services/tariffs.py), no database is needed. Trips are
+estimated by straight line unless --road-matrix points to a matrix built by
+scripts/build_road_matrix.py.
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime, timedelta
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services.calculator import PricingCalculator  # noqa: E402
+from services.road_matrix import road_matrix  # noqa: E402
+from services.tariffs import DEFAULT_TARIFFS  # noqa: E402
+
+BBOX = (40.55, 40.90, -74.05, -73.75)  # lat_min, lat_max, lon_min, lon_max
+FIELDS = ("base_fare", "distance_fare", "time_fare", "surge_multiplier", "total_amount")
+
+
+def make_trips(n: int, rng):
+    lat_min, lat_max, lon_min, lon_max = BBOX
+    start = datetime(2024, 1, 15)
+    return (
+        rng.uniform(lat_min, lat_max, n),
+        rng.uniform(lon_min, lon_max, n),
+        rng.uniform(lat_min, lat_max, n),
+        rng.uniform(lon_min, lon_max, n),
+        [start + timedelta(minutes=int(m)) for m in rng.integers(0, 7 * 24 * 60, n)],
+    )
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def scalar(trips, tariff):
+    plat, plon, dlat, dlon, dts = trips
+    return [
+        PricingCalculator.calculate_pricing(float(a), float(b), float(c), float(d), dt, tariff)
+        for a, b, c, d, dt in zip(plat, plon, dlat, dlon, dts)
+    ]
+
+
+def check(trips, batch, expected):
+    for i, row in enumerate(expected):
+        for name in FIELDS:
+            assert batch[name][i] == row[name], f"trip {i}: {name} {batch[name][i]} != {row[name]}"
+
+
+def rate(n: int, seconds: float) -> str:
+    return f"{n / seconds:>12,.0f} trips/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scalar vs vectorized pricing")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1, 100, 100000])
+    parser.add_argument("--endpoint", action="store_true", help="also time the HTTP endpoint in-process")
+    parser.add_argument("--tariff", default="UberX", choices=[t.name for t in DEFAULT_TARIFFS])
+    parser.add_argument("--road-matrix", help="road matrix directory (default: straight line at 30 mph)")
+    args = parser.parse_args()
+    tariff = next(t for t in DEFAULT_TARIFFS if t.name == args.tariff)
+    if args.road_matrix:
+        road_matrix.path = args.road_matrix
+        if not road_matrix.load():
+            sys.exit(f"Road matrix not loaded: {road_matrix.last_error}")
+
+    rng = np.random.default_rng(42)
+    client = None
+    if args.endpoint:
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+
+    for n in args.sizes:
+        trips = make_trips(n, rng)
+        # Small batches are timed many times so the numbers are not just timer noise
+        repeat = max(3, min(2000, 100000 // n))
+        expected = scalar(trips, tariff)
+        batch = PricingCalculator.calculate_pricing_batch(*trips, tariff)
+        check(trips, batch, expected)
+
+        scalar_time = best_of(lambda: scalar(trips, tariff), max(3, repeat // 10))
+        batch_time = best_of(lambda: PricingCalculator.calculate_pricing_batch(*trips, tariff), repeat)
+        line = f"n={n:<7} scalar {rate(n, scalar_time)}   batch {rate(n, batch_time)}   x{scalar_time / batch_time:.1f}"
+
+        if client is not None:
+            body = {
+                "pickup_latitude": trips[0].tolist(),
+                "pickup_longitude": trips[1].tolist(),
+                "dropoff_latitude": trips[2].tolist(),
+                "dropoff_longitude": trips[3].tolist(),
+                "pickup_datetime": [dt.isoformat() for dt in trips[4]],
+                "tariff": tariff.name,
+            }
+            response = client.post("/api/v1/pricing/calculate/batch", json=body)
+            assert response.status_code == 200, response.text
+            check(trips, response.json(), expected)
+            endpoint_time = best_of(
+                lambda: client.post("/api/v1/pricing/calculate/batch", json=body), max(3, repeat // 20)
+            )
+            line += f"   endpoint {rate(n, endpoint_time)}"
+        print(line)
+
+    print("✅ Batch results match the scalar path")
+
+
+if __name__ == "__main__":
+    main()
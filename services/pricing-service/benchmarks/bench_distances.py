@@ -0,0 +1,153 @@
+#!/usr/bin/env python3
+"""
+Candidate ranking benchmark: scalar estimate_trip loop + sort vs services/distances.py.
+
+Usage (from services/pricing-service):
+    python benchmarks/bench_distances.py
+    python benchmarks/bench_distances.py --candidates 100 1000 10000 --matrix 10 100 1000 --endpoint
+    python benchmarks/bench_distances.py --road-matrix ../../data/road_matrix
+
+One-to-many: one pickup and N drivers in the NYC bbox, ranked by ETA (full order
+and --limit best). Many-to-many: N x N origins and destinations. Every result is
+checked against the scalar path (PricingCalculator.estimate_trip per pair).
+--endpoint also times POST /api/v1/pricing/distances/rank and /distances/matrix
+in-process (TestClient, no network).
+"""
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from services import distances  # noqa: E402
+from services.calculator import KM_PER_MILE, PricingCalculator  # noqa: E402
+from services.road_matrix import road_matrix  # noqa: E402
+
+BBOX = (40.55, 40.90, -74.05, -73.75)  # lat_min, lat_max, lon_min, lon_max
+DEPARTURE = datetime(2024, 1, 15, 8, 30)
+
+
+def make_points(n: int, rng):
+    lat_min, lat_max, lon_min, lon_max = BBOX
+    return rng.uniform(lat_min, lat_max, n), rng.uniform(lon_min, lon_max, n)
+
+
+def best_of(fn, repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started)
+    return best
+
+
+def scalar_trips(origin_lat, origin_lon, destination_lat, destination_lon):
+    """[(km, minutes)] for every origin x destination pair, row by row"""
+    trips = []
+    for a, b in zip(origin_lat.tolist(), origin_lon.tolist()):
+        for c, d in zip(destination_lat.tolist(), destination_lon.tolist()):
+            miles, minutes = PricingCalculator.estimate_trip(a, b, c, d, DEPARTURE)
+            trips.append((miles * KM_PER_MILE, minutes))
+    return trips
+
+
+def scalar_rank(pickup, lat, lon):
+    trips = scalar_trips(lat, lon, np.array([pickup[0]]), np.array([pickup[1]]))
+    return sorted(range(len(trips)), key=lambda i: trips[i][1]), trips
+
+
+def rate(n: int, seconds: float, unit: str) -> str:
+    return f"{n / seconds:>12,.0f} {unit}/s"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Scalar vs vectorized distances and ETAs")
+    parser.add_argument("--candidates", type=int, nargs="+", default=[100, 1000, 10000])
+    parser.add_argument("--matrix", type=int, nargs="+", default=[10, 100, 1000], help="N for N x N matrices")
+    parser.add_argument("--limit", type=int, default=10, help="best candidates returned by the partial ranking")
+    parser.add_argument("--endpoint", action="store_true", help="also time the HTTP endpoints in-process")
+    parser.add_argument("--road-matrix", help="road matrix directory (default: straight line at 30 mph)")
+    args = parser.parse_args()
+    if args.road_matrix:
+        road_matrix.path = args.road_matrix
+        if not road_matrix.load():
+            sys.exit(f"Road matrix not loaded: {road_matrix.last_error}")
+
+    rng = np.random.default_rng(42)
+    client = None
+    if args.endpoint:
+        from fastapi.testclient import TestClient
+        from main import app
+        client = TestClient(app)
+
+    pickup = (40.7580, -73.9855)
+    for n in args.candidates:
+        lat, lon = make_points(n, rng)
+        expected_order, trips = scalar_rank(pickup, lat, lon)
+        expected_eta = np.array([trips[i][1] for i in expected_order])
+        ranked = distances.rank_candidates(*pickup, lat, lon, DEPARTURE)
+        # Sorted ETAs must agree; indices may only differ between (near-)equal ETAs
+        assert np.allclose(ranked["eta_minutes"], expected_eta, rtol=1e-12, atol=0)
+        top = distances.rank_candidates(*pickup, lat, lon, DEPARTURE, limit=args.limit)
+        assert np.array_equal(top["eta_minutes"], ranked["eta_minutes"][:args.limit])
+
+        repeat = max(3, min(1000, 100000 // n))
+        scalar_time = best_of(lambda: scalar_rank(pickup, lat, lon), max(3, repeat // 10))
+        full_time = best_of(lambda: distances.rank_candidates(*pickup, lat, lon, DEPARTURE), repeat)
+        top_time = best_of(lambda: distances.rank_candidates(*pickup, lat, lon, DEPARTURE, limit=args.limit), repeat)
+        line = (f"rank   n={n:<8} scalar {rate(n, scalar_time, 'drivers')}   "
+                f"numpy {rate(n, full_time, 'drivers')}   top-{args.limit} {rate(n, top_time, 'drivers')}   "
+                f"x{scalar_time / full_time:.1f}")
+        if client is not None:
+            body = {"pickup_latitude": pickup[0], "pickup_longitude": pickup[1],
+                    "latitude": lat.tolist(), "longitude": lon.tolist(),
+                    "departure_datetime": DEPARTURE.isoformat(), "limit": args.limit}
+            response = client.post("/api/v1/pricing/distances/rank", json=body)
+            assert response.status_code == 200, response.text
+            endpoint_time = best_of(
+                lambda: client.post("/api/v1/pricing/distances/rank", json=body), max(3, repeat // 20)
+            )
+            line += f"   endpoint {rate(n, endpoint_time, 'drivers')}"
+        print(line)
+
+    for n in args.matrix:
+        origin_lat, origin_lon = make_points(n, rng)
+        destination_lat, destination_lon = make_points(n, rng)
+        result = distances.distance_matrix(origin_lat, origin_lon, destination_lat, destination_lon, DEPARTURE)
+        # The scalar loop is quadratic, so only a slice of the largest matrices is checked
+        rows = min(n, max(1, 20000 // n))
+        expected = np.array(scalar_trips(origin_lat[:rows], origin_lon[:rows], destination_lat, destination_lon))
+        assert np.allclose(result["distance_km"][:rows].ravel(), expected[:, 0], rtol=1e-12, atol=0)
+        assert np.allclose(result["eta_minutes"][:rows].ravel(), expected[:, 1], rtol=1e-12, atol=0)
+
+        pairs = n * n
+        repeat = max(3, min(1000, 1000000 // pairs))
+        scalar_time = best_of(
+            lambda: scalar_trips(origin_lat[:rows], origin_lon[:rows], destination_lat, destination_lon), 3
+        ) * n / rows
+        numpy_time = best_of(
+            lambda: distances.distance_matrix(origin_lat, origin_lon, destination_lat, destination_lon, DEPARTURE),
+            repeat
+        )
+        line = (f"matrix {f'{n}x{n}':<10} scalar {rate(pairs, scalar_time, 'pairs')}   "
+                f"numpy {rate(pairs, numpy_time, 'pairs')}   x{scalar_time / numpy_time:.1f}")
+        if client is not None:
+            body = {"origin_latitude": origin_lat.tolist(), "origin_longitude": origin_lon.tolist(),
+                    "destination_latitude": destination_lat.tolist(),
+                    "destination_longitude": destination_lon.tolist(),
+                    "departure_datetime": DEPARTURE.isoformat()}
+            response = client.post("/api/v1/pricing/distances/matrix", json=body)
+            assert response.status_code == 200, response.text
+            endpoint_time = best_of(lambda: client.post("/api/v1/pricing/distances/matrix", json=body), 3)
+            line += f"   endpoint {rate(pairs, endpoint_time, 'pairs')}"
+        print(line)
+
+    print("✅ Vectorized distances and ETAs match the scalar path")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+import os
+
+# Batch pricing: larger batches are rejected with 413 (split them on the client)
+PRICING_BATCH_MAX_TRIPS = int(os.getenv('PRICING_BATCH_MAX_TRIPS', 100000))
+# Distances/ETAs: candidates per POST /distances/rank and origins x destinations per /distances/matrix
+DISTANCE_MAX_CANDIDATES = int(os.getenv('DISTANCE_MAX_CANDIDATES', 10000))
+DISTANCE_MAX_PAIRS = int(os.getenv('DISTANCE_MAX_PAIRS', 1000000))
+
+# PostgreSQL (tariffs are read from here only to refresh the in-memory snapshot)
+POSTGRES_HOST = os.getenv('POSTGRES_HOST', 'localhost')
+POSTGRES_PORT = int(os.getenv('POSTGRES_PORT', 5432))
+POSTGRES_DB = os.getenv('POSTGRES_DB', 'uber')
+POSTGRES_USER = os.getenv('POSTGRES_USER', 'uber')
+POSTGRES_PASSWORD = os.getenv('POSTGRES_PASSWORD', 'uber_secret_password')
+
+# Tariffs: used when a request does not name one
+PRICING_DEFAULT_TARIFF = os.getenv('PRICING_DEFAULT_TARIFF', 'UberX')
+# Seconds between tariff reloads; changes also arrive at once via NOTIFY tariffs_changed
+TARIFF_REFRESH_INTERVAL = float(os.getenv('TARIFF_REFRESH_INTERVAL', 60))
+
+# Kafka / Redis inputs of the surge engine (services/surge.py)
+KAFKA_BOOTSTRAP_SERVERS = os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:29092')
+REDIS_HOST = os.getenv('REDIS_HOST', 'redis')
+REDIS_PORT = int(os.getenv('REDIS_PORT', 6379))
+
+# Supply/demand surge: open requests vs free drivers per cell of SURGE_CELL_SIZE degrees
+# (~1.1 km for 0.01) over the last SURGE_WINDOW seconds, recomputed every SURGE_UPDATE_INTERVAL.
+# Disabled or without fresh data, the time-of-day schedule applies
+SURGE_ENABLED = os.getenv('SURGE_ENABLED', 'true').lower() == 'true'
+SURGE_CELL_SIZE = float(os.getenv('SURGE_CELL_SIZE', 0.01))
+SURGE_WINDOW = float(os.getenv('SURGE_WINDOW', 300))
+SURGE_UPDATE_INTERVAL = float(os.getenv('SURGE_UPDATE_INTERVAL', 5))
+# Share of the gap to the target multiplier closed per update (1 = no smoothing)
+SURGE_SMOOTHING = float(os.getenv('SURGE_SMOOTHING', 0.3))
+# Multiplier growth per extra request per free driver: 1 + SENSITIVITY * (requests / drivers - 1)
+SURGE_SENSITIVITY = float(os.getenv('SURGE_SENSITIVITY', 0.5))
+# Cells with fewer open requests never surge (noise)
+SURGE_MIN_DEMAND = int(os.getenv('SURGE_MIN_DEMAND', 3))
+SURGE_MAX_MULTIPLIER = float(os.getenv('SURGE_MAX_MULTIPLIER', 3.0))
+# Area of drivers:online sampled for supply (default: NYC)
+SURGE_AREA_LATITUDE = float(os.getenv('SURGE_AREA_LATITUDE', 40.7128))
+SURGE_AREA_LONGITUDE = float(os.getenv('SURGE_AREA_LONGITUDE', -74.0060))
+SURGE_AREA_RADIUS_KM = float(os.getenv('SURGE_AREA_RADIUS_KM', 60))
+
+# Quotes (POST /quote): trips are quantized to QUOTE_COORD_PRECISION decimals and
+# QUOTE_TIME_BUCKET seconds (must divide 3600); repeats are served from an in-process
+# LRU cache for QUOTE_CACHE_TTL seconds; quote_id can be redeemed for QUOTE_TTL seconds
+QUOTE_COORD_PRECISION = int(os.getenv('QUOTE_COORD_PRECISION', 3))
+QUOTE_TIME_BUCKET = int(os.getenv('QUOTE_TIME_BUCKET', 300))
+QUOTE_CACHE_SIZE = int(os.getenv('QUOTE_CACHE_SIZE', 100000))
+QUOTE_CACHE_TTL = float(os.getenv('QUOTE_CACHE_TTL', 60))
+QUOTE_TTL = int(os.getenv('QUOTE_TTL', 600))
+
+# Road matrix (scripts/build_road_matrix.py): historical road/straight-line distance ratios
+# and hour-of-week speeds per cell pair, memory-mapped at startup. Empty: straight line at 30 mph
+ROAD_MATRIX_PATH = os.getenv('ROAD_MATRIX_PATH', '')
@@ -1,8 +1,27 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
 from routers import pricing
+from services.quotes import quote_service
+from services.road_matrix import road_matrix
+from services.surge import surge_engine
+from services.tariffs import tariff_store
 import uvicorn
 
-app = FastAPI(title="Pricing Service", version="1.0.0")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Memory-mapped, so loading is cheap; without a matrix trips are priced by straight line
+    road_matrix.load()
+    # Falls back to the seed tariffs if the database is not reachable yet
+    await tariff_store.start()
+    # Reads Kafka and Redis in a background thread; quotes use the schedule until it has data
+    surge_engine.start()
+    yield
+    await run_in_threadpool(surge_engine.stop)
+    await tariff_store.stop()
+    await quote_service.close()
+
+app = FastAPI(title="Pricing Service", version="1.0.0", lifespan=lifespan)
 
 # Include routers
 app.include_router(pricing.router)
@@ -11,5 +30,21 @@ app.include_router(pricing.router)
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/health/tariffs")
+def tariffs_health_check():
+    return tariff_store.stats()
+
+@app.get("/health/surge")
+def surge_health_check():
+    return surge_engine.stats()
+
+@app.get("/health/road-matrix")
+def road_matrix_health_check():
+    return road_matrix.stats()
+
+@app.get("/health/quotes")
+def quotes_health_check():
+    return quote_service.stats()
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8006)
@@ -1,6 +1,22 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, ConfigDict, Field, model_validator
 from datetime import datetime
-from typing import Optional
+from typing import List, Literal, Optional
+
+class Tariff(BaseModel):
+    """Row of the tariffs table; immutable, shared by all requests through the snapshot"""
+    model_config = ConfigDict(frozen=True)
+
+    name: str
+    base_fare: float
+    per_km: float
+    per_minute: float
+    min_fare: float
+
+class TariffList(BaseModel):
+    version: int
+    source: str
+    loaded_at: Optional[datetime] = None
+    tariffs: List[Tariff]
 
 class RideRequest(BaseModel):
     pickup_latitude: float
@@ -9,11 +25,116 @@ class RideRequest(BaseModel):
     dropoff_longitude: float
     passenger_count: int
     pickup_datetime: datetime
+    tariff: Optional[str] = None  # PRICING_DEFAULT_TARIFF if omitted
 
 class PricingResponse(BaseModel):
+    tariff: str
     base_fare: float
     distance_fare: float
     time_fare: float
     surge_multiplier: float
     total_amount: float
     currency: str = "USD"
+
+class QuoteResponse(PricingResponse):
+    """Price of the quantized trip; quote_id is null if the quote could not be stored"""
+    quote_id: Optional[str] = None
+    expires_at: datetime
+    distance_km: float
+
+class BatchRideRequest(BaseModel):
+    """Trips as parallel arrays (one element per trip), so the batch is priced column-wise"""
+    pickup_latitude: List[float]
+    pickup_longitude: List[float]
+    dropoff_latitude: List[float]
+    dropoff_longitude: List[float]
+    pickup_datetime: List[datetime]
+    passenger_count: Optional[List[int]] = None
+    tariff: Optional[str] = None  # one tariff for the whole batch
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        lengths = {len(values) for values in (
+            self.pickup_latitude, self.pickup_longitude,
+            self.dropoff_latitude, self.dropoff_longitude, self.pickup_datetime,
+        )}
+        if self.passenger_count is not None:
+            lengths.add(len(self.passenger_count))
+        if len(lengths) != 1:
+            raise ValueError("all trip arrays must have the same length")
+        return self
+
+    def __len__(self) -> int:
+        return len(self.pickup_latitude)
+
+class BatchPricingColumns(BaseModel):
+    """Columnar batch result: element i of every list belongs to trip i"""
+    tariff: str
+    count: int
+    base_fare: List[float]
+    distance_fare: List[float]
+    time_fare: List[float]
+    surge_multiplier: List[float]
+    total_amount: List[float]
+    currency: str = "USD"
+
+class CandidateRankingRequest(BaseModel):
+    """Drivers near one pickup as parallel arrays; ranked by their trip to the pickup"""
+    pickup_latitude: float
+    pickup_longitude: float
+    latitude: List[float]
+    longitude: List[float]
+    driver_id: Optional[List[str]] = None  # echoed back in ranked order
+    departure_datetime: Optional[datetime] = None  # hour of week for road speeds; now if omitted
+    order_by: Literal["eta", "distance"] = "eta"
+    limit: Optional[int] = Field(None, ge=1)  # only the best N candidates
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        lengths = {len(self.latitude), len(self.longitude)}
+        if self.driver_id is not None:
+            lengths.add(len(self.driver_id))
+        if len(lengths) != 1:
+            raise ValueError("latitude, longitude and driver_id must have the same length")
+        return self
+
+    def __len__(self) -> int:
+        return len(self.latitude)
+
+class CandidateRanking(BaseModel):
+    """Best candidate first; order holds indices into the request arrays"""
+    count: int
+    order: List[int]
+    driver_id: Optional[List[str]] = None
+    distance_km: List[float]
+    eta_minutes: List[float]
+
+class DistanceMatrixRequest(BaseModel):
+    """Origins (drivers) x destinations (pickups), each as parallel arrays"""
+    origin_latitude: List[float]
+    origin_longitude: List[float]
+    destination_latitude: List[float]
+    destination_longitude: List[float]
+    departure_datetime: Optional[datetime] = None
+
+    @model_validator(mode="after")
+    def check_lengths(self):
+        if len(self.origin_latitude) != len(self.origin_longitude):
+            raise ValueError("origin arrays must have the same length")
+        if len(self.destination_latitude) != len(self.destination_longitude):
+            raise ValueError("destination arrays must have the same length")
+        if not self.origin_latitude or not self.destination_latitude:
+            raise ValueError("at least one origin and one destination are required")
+        return self
+
+    @property
+    def pairs(self) -> int:
+        return len(self.origin_latitude) * len(self.destination_latitude)
+
+class DistanceMatrix(BaseModel):
+    """Element [i][j] is the trip from origin i to destination j"""
+    origins: int
+    destinations: int
+    distance_km: List[List[float]]
+    eta_minutes: List[List[float]]
+    nearest_origin: List[int]  # per destination: the origin with the lowest ETA
@@ -1,19 +1,201 @@
-from fastapi import APIRouter, HTTPException
-from models.pricing import RideRequest, PricingResponse
+from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
+from typing import List, Optional, Union
+import numpy as np
+from models.pricing import (
+    RideRequest, PricingResponse, QuoteResponse, BatchRideRequest, BatchPricingColumns, Tariff, TariffList,
+    CandidateRankingRequest, CandidateRanking, DistanceMatrixRequest, DistanceMatrix
+)
+from services import distances
+from services.quotes import quote_service
 from services.calculator import PricingCalculator
+from services.surge import surge_engine
+from services.tariffs import tariff_store, UnknownTariffError
+import config
 
 router = APIRouter(prefix="/api/v1/pricing", tags=["pricing"])
 
+BATCH_COLUMNS = ("base_fare", "distance_fare", "time_fare", "surge_multiplier", "total_amount")
+
+def get_tariff(name: Optional[str]) -> Tariff:
+    """Tariff from the in-memory snapshot (no database access)"""
+    try:
+        return tariff_store.get(name)
+    except UnknownTariffError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+@router.get("/tariffs", response_model=TariffList)
+def list_tariffs():
+    snapshot = tariff_store.snapshot
+    return TariffList(
+        version=snapshot.version,
+        source=snapshot.source,
+        loaded_at=snapshot.loaded_at,
+        tariffs=list(snapshot.tariffs)
+    )
+
 @router.post("/calculate", response_model=PricingResponse)
 def calculate_price(ride_request: RideRequest):
+    tariff = get_tariff(ride_request.tariff)
+    # Live multiplier from the in-memory surge snapshot (None - time-of-day schedule)
+    surge = surge_engine.multiplier(ride_request.pickup_latitude, ride_request.pickup_longitude)
     try:
         pricing_data = PricingCalculator.calculate_pricing(
             ride_request.pickup_latitude,
             ride_request.pickup_longitude,
             ride_request.dropoff_latitude,
             ride_request.dropoff_longitude,
-            ride_request.pickup_datetime
+            ride_request.pickup_datetime,
+            tariff,
+            surge
         )
         return PricingResponse(**pricing_data)
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Pricing calculation error: {str(e)}")
+
+@router.post("/quote", response_model=QuoteResponse)
+async def quote_price(ride_request: RideRequest):
+    """Like /calculate for the trip rounded to QUOTE_COORD_PRECISION / QUOTE_TIME_BUCKET.
+
+    Repeats are answered from the quote cache; pass quote_id to POST /api/v1/rides/
+    to create the ride at this price.
+    """
+    snapshot = tariff_store.snapshot
+    try:
+        tariff = snapshot.get(ride_request.tariff)
+    except UnknownTariffError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    try:
+        return await quote_service.quote(ride_request, tariff, snapshot.version, surge_engine.multiplier)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Pricing calculation error: {str(e)}")
+
+@router.post("/calculate/all", response_model=List[PricingResponse])
+def calculate_price_all_tariffs(ride_request: RideRequest):
+    """The trip priced with every active tariff (tariff selection screen); tariff in the body is ignored"""
+    # One snapshot for the whole response, so a concurrent reload cannot mix two versions
+    snapshot = tariff_store.snapshot
+    surge = surge_engine.multiplier(ride_request.pickup_latitude, ride_request.pickup_longitude)
+    try:
+        return [
+            PricingResponse(**PricingCalculator.calculate_pricing(
+                ride_request.pickup_latitude,
+                ride_request.pickup_longitude,
+                ride_request.dropoff_latitude,
+                ride_request.dropoff_longitude,
+                ride_request.pickup_datetime,
+                tariff,
+                surge
+            ))
+            for tariff in snapshot.tariffs
+        ]
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Pricing calculation error: {str(e)}")
+
+@router.post("/calculate/batch", response_model=Union[BatchPricingColumns, List[PricingResponse]])
+def calculate_price_batch(
+    batch: BatchRideRequest,
+    format: str = Query("columns", pattern="^(columns|rows)$")
+):
+    """Price many trips in one call; results match /calculate for every trip.
+
+    format=columns returns one array per field, format=rows one object per trip.
+    Live surge is looked up per pickup cell in one surge snapshot, as /calculate does
+    (time-of-day schedule when there is no fresh surge data).
+    """
+    if len(batch) > config.PRICING_BATCH_MAX_TRIPS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"Batch of {len(batch)} trips exceeds the limit of {config.PRICING_BATCH_MAX_TRIPS}"
+        )
+    tariff = get_tariff(batch.tariff)
+    try:
+        surge = surge_engine.multipliers(batch.pickup_latitude, batch.pickup_longitude)
+        result = PricingCalculator.calculate_pricing_batch(
+            batch.pickup_latitude,
+            batch.pickup_longitude,
+            batch.dropoff_latitude,
+            batch.dropoff_longitude,
+            batch.pickup_datetime,
+            tariff,
+            surge
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Pricing calculation error: {str(e)}")
+
+    # Returned as a ready response: re-validating 100k rows through response_model
+    # would cost more than pricing them
+    if format == "rows":
+        columns = [result[name].tolist() for name in BATCH_COLUMNS]
+        rows = [dict(zip(BATCH_COLUMNS, values), tariff=tariff.name, currency="USD") for values in zip(*columns)]
+        return ORJSONResponse(rows)
+    # ORJSONResponse serializes the NumPy columns directly
+    return ORJSONResponse({
+        "tariff": tariff.name,
+        "count": len(batch),
+        **{name: result[name] for name in BATCH_COLUMNS},
+        "currency": "USD",
+    })
+
+@router.post("/distances/rank", response_model=CandidateRanking)
+def rank_candidates(request: CandidateRankingRequest):
+    """Rank drivers by their trip to one pickup (distance and ETA as for priced trips).
+
+    With limit only the best candidates are returned; order holds their indices in the request.
+    """
+    if len(request) > config.DISTANCE_MAX_CANDIDATES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{len(request)} candidates exceed the limit of {config.DISTANCE_MAX_CANDIDATES}"
+        )
+    try:
+        result = distances.rank_candidates(
+            request.pickup_latitude,
+            request.pickup_longitude,
+            request.latitude,
+            request.longitude,
+            request.departure_datetime,
+            request.order_by,
+            request.limit
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Distance calculation error: {str(e)}")
+
+    driver_id = None
+    if request.driver_id is not None:
+        driver_id = [request.driver_id[i] for i in result["order"].tolist()]
+    return ORJSONResponse({
+        "count": len(request),
+        "order": result["order"],
+        "driver_id": driver_id,
+        "distance_km": np.round(result["distance_km"], 3),
+        "eta_minutes": np.round(result["eta_minutes"], 2),
+    })
+
+@router.post("/distances/matrix", response_model=DistanceMatrix)
+def distance_matrix(request: DistanceMatrixRequest):
+    """Distances and ETAs from every origin (driver) to every destination (pickup) for batch assignment"""
+    if request.pairs > config.DISTANCE_MAX_PAIRS:
+        raise HTTPException(
+            status_code=413,
+            detail=f"{request.pairs} origin-destination pairs exceed the limit of {config.DISTANCE_MAX_PAIRS}"
+        )
+    try:
+        result = distances.distance_matrix(
+            request.origin_latitude,
+            request.origin_longitude,
+            request.destination_latitude,
+            request.destination_longitude,
+            request.departure_datetime
+        )
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=f"Distance calculation error: {str(e)}")
+
+    # 2-D arrays are serialized by orjson as nested lists
+    return ORJSONResponse({
+        "origins": len(request.origin_latitude),
+        "destinations": len(request.destination_latitude),
+        "distance_km": np.round(result["distance_km"], 3),
+        "eta_minutes": np.round(result["eta_minutes"], 2),
+        "nearest_origin": result["nearest_origin"],
+    })
@@ -1,6 +1,24 @@
 import math
 from datetime import datetime
-from typing import Tuple
+from typing import Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+from models.pricing import Tariff
+from services.road_matrix import hour_of_week, road_matrix
+
+# Amounts the batch path rounds to cents (everything else in the response is exact)
+ROUNDED_AMOUNTS = ("distance_fare", "time_fare", "total_amount")
+# How close (in cents) an unrounded amount may get to a half-cent before the row is
+# re-priced by the scalar path. NumPy's sin/cos and rint(x * 100) may differ from
+# math/round() in the last bit, which only matters right at a rounding boundary
+TIE_WINDOW_CENTS = 1e-6
+# Tariffs are priced per km, distances are computed in miles
+KM_PER_MILE = 1.609344
+# Below this many trips NumPy's per-call overhead costs more than the scalar loop
+SCALAR_BATCH_MAX = 16
+# Average speed assumed without a road matrix
+DEFAULT_SPEED_MPH = 30
 
 class PricingCalculator:
     @staticmethod
@@ -20,9 +38,36 @@ class PricingCalculator:
         
         return R * c
 
+    @staticmethod
+    def estimate_trip(
+        pickup_lat: float,
+        pickup_lon: float,
+        dropoff_lat: float,
+        dropoff_lon: float,
+        pickup_datetime: datetime
+    ) -> Tuple[float, float]:
+        """(road distance in miles, duration in minutes) for the trip.
+
+        With a road matrix the straight-line distance is scaled by the historical
+        road/straight ratio of the cell pair and divided by the historical speed at
+        that hour of the week; without one it is the straight line at 30 mph.
+        """
+        distance = PricingCalculator.calculate_distance(
+            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon
+        )
+        matrix = road_matrix.matrix
+        if matrix is None:
+            return distance, (distance / DEFAULT_SPEED_MPH) * 60
+
+        ratio, speed_kmh = matrix.correction(
+            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, hour_of_week(pickup_datetime)
+        )
+        distance = distance * ratio
+        return distance, (distance * KM_PER_MILE / speed_kmh) * 60
+
     @staticmethod
     def get_surge_multiplier(pickup_datetime: datetime) -> float:
-        """Simple surge pricing based on time of day"""
+        """Simple surge pricing based on time of day (used when there is no live surge)"""
         hour = pickup_datetime.hour
         
         # Peak hours: 7-9 AM, 5-7 PM
@@ -40,34 +85,164 @@ class PricingCalculator:
         pickup_lon: float,
         dropoff_lat: float,
         dropoff_lon: float,
-        pickup_datetime: datetime
+        pickup_datetime: datetime,
+        tariff: Tariff,
+        surge_multiplier: Optional[float] = None
     ) -> dict:
-        # Calculate distance
-        distance = PricingCalculator.calculate_distance(
-            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon
+        """surge_multiplier: live supply/demand multiplier; time-of-day schedule if None"""
+        # Road distance and time (historical corrections if a road matrix is loaded)
+        distance, estimated_time_minutes = PricingCalculator.estimate_trip(
+            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetime
         )
         
-        # Calculate time (assume average speed 30 mph)
-        estimated_time_minutes = (distance / 30) * 60
-        
-        # Base pricing
-        base_fare = 2.50
-        distance_rate = 1.75  # per mile
-        time_rate = 0.30      # per minute
-        
-        distance_fare = distance * distance_rate
-        time_fare = estimated_time_minutes * time_rate
+        distance_fare = distance * KM_PER_MILE * tariff.per_km
+        time_fare = estimated_time_minutes * tariff.per_minute
         
         # Surge pricing
-        surge_multiplier = PricingCalculator.get_surge_multiplier(pickup_datetime)
+        if surge_multiplier is None:
+            surge_multiplier = PricingCalculator.get_surge_multiplier(pickup_datetime)
         
-        total_amount = (base_fare + distance_fare + time_fare) * surge_multiplier
+        # The minimum fare is applied before surge, so surge raises short trips too
+        total_amount = max(tariff.base_fare + distance_fare + time_fare, tariff.min_fare) * surge_multiplier
         
         return {
-            "base_fare": round(base_fare, 2),
+            "tariff": tariff.name,
+            "base_fare": round(tariff.base_fare, 2),
             "distance_fare": round(distance_fare, 2),
             "time_fare": round(time_fare, 2),
             "surge_multiplier": round(surge_multiplier, 2),
             "total_amount": round(total_amount, 2),
             "currency": "USD"
         }
+
+    @staticmethod
+    def calculate_distances(lat1: np.ndarray, lon1: np.ndarray, lat2: np.ndarray, lon2: np.ndarray) -> np.ndarray:
+        """Vectorized calculate_distance: miles for each pair of points"""
+        R = 3958.8  # Earth radius in miles
+
+        lat1_rad = np.radians(lat1)
+        lat2_rad = np.radians(lat2)
+        delta_lat = np.radians(lat2 - lat1)
+        delta_lon = np.radians(lon2 - lon1)
+
+        a = (np.sin(delta_lat/2) * np.sin(delta_lat/2) +
+             np.cos(lat1_rad) * np.cos(lat2_rad) *
+             np.sin(delta_lon/2) * np.sin(delta_lon/2))
+        c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+        return R * c
+
+    @staticmethod
+    def estimate_trips(
+        pickup_lat: np.ndarray,
+        pickup_lon: np.ndarray,
+        dropoff_lat: np.ndarray,
+        dropoff_lon: np.ndarray,
+        hours_of_week: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized estimate_trip (same operation order, so the results are identical)"""
+        distance = PricingCalculator.calculate_distances(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon)
+        matrix = road_matrix.matrix
+        if matrix is None:
+            return distance, (distance / DEFAULT_SPEED_MPH) * 60
+
+        ratio, speed_kmh = matrix.corrections(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, hours_of_week)
+        distance = distance * ratio
+        return distance, (distance * KM_PER_MILE / speed_kmh) * 60
+
+    @staticmethod
+    def get_surge_multipliers(hours: np.ndarray) -> np.ndarray:
+        """Vectorized get_surge_multiplier over pickup hours"""
+        peak = ((7 <= hours) & (hours <= 9)) | ((17 <= hours) & (hours <= 19))
+        late_night = (hours >= 22) | (hours <= 6)
+        return np.select([peak, late_night], [1.5, 1.2], default=1.0)
+
+    @staticmethod
+    def _round_cents(values: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """(values rounded to cents, mask of values too close to a half-cent to trust)"""
+        scaled = values * 100
+        near_tie = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < TIE_WINDOW_CENTS
+        return np.rint(scaled) / 100, near_tie
+
+    @staticmethod
+    def _calculate_pricing_loop(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetimes, tariff,
+                                surge_multipliers=None):
+        if surge_multipliers is None:
+            surge_multipliers = [None] * len(pickup_datetimes)
+        rows = [
+            PricingCalculator.calculate_pricing(
+                float(a), float(b), float(c), float(d), dt, tariff, None if surge is None else float(surge)
+            )
+            for a, b, c, d, dt, surge in zip(
+                pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetimes, surge_multipliers
+            )
+        ]
+        return {
+            name: np.array([row[name] for row in rows], dtype=np.float64)
+            for name in ("base_fare", "surge_multiplier") + ROUNDED_AMOUNTS
+        }
+
+    @staticmethod
+    def calculate_pricing_batch(
+        pickup_lat: np.ndarray,
+        pickup_lon: np.ndarray,
+        dropoff_lat: np.ndarray,
+        dropoff_lon: np.ndarray,
+        pickup_datetimes: Sequence[datetime],
+        tariff: Tariff,
+        surge_multipliers: Optional[np.ndarray] = None
+    ) -> Dict[str, np.ndarray]:
+        """calculate_pricing for many trips at once; columns are float64 arrays.
+
+        surge_multipliers: live multiplier per trip; time-of-day schedule if None.
+        Matches calculate_pricing exactly: rows near a rounding boundary are
+        re-priced by the scalar path (a handful per million), and batches of up to
+        SCALAR_BATCH_MAX trips go through it entirely.
+        """
+        if len(pickup_datetimes) <= SCALAR_BATCH_MAX:
+            return PricingCalculator._calculate_pricing_loop(
+                pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetimes, tariff, surge_multipliers
+            )
+
+        pickup_lat = np.asarray(pickup_lat, dtype=np.float64)
+        pickup_lon = np.asarray(pickup_lon, dtype=np.float64)
+        dropoff_lat = np.asarray(dropoff_lat, dtype=np.float64)
+        dropoff_lon = np.asarray(dropoff_lon, dtype=np.float64)
+        hours_of_week = np.fromiter(
+            (hour_of_week(dt) for dt in pickup_datetimes), dtype=np.int16, count=len(pickup_lat)
+        )
+        hours = hours_of_week % 24
+
+        distance, estimated_time_minutes = PricingCalculator.estimate_trips(
+            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, hours_of_week
+        )
+
+        # Same operation order as calculate_pricing
+        distance_fare = distance * KM_PER_MILE * tariff.per_km
+        time_fare = estimated_time_minutes * tariff.per_minute
+        if surge_multipliers is None:
+            surge_multiplier = PricingCalculator.get_surge_multipliers(hours)
+        else:
+            surge_multiplier = np.asarray(surge_multipliers, dtype=np.float64)
+        total_amount = np.maximum(tariff.base_fare + distance_fare + time_fare, tariff.min_fare) * surge_multiplier
+
+        result = {
+            "base_fare": np.full(len(distance), round(tariff.base_fare, 2)),
+            "surge_multiplier": surge_multiplier,
+        }
+        suspicious = np.zeros(len(distance), dtype=bool)
+        for name, values in (("distance_fare", distance_fare), ("time_fare", time_fare),
+                             ("total_amount", total_amount)):
+            result[name], near_tie = PricingCalculator._round_cents(values)
+            suspicious |= near_tie
+
+        for i in np.flatnonzero(suspicious):
+            exact = PricingCalculator.calculate_pricing(
+                float(pickup_lat[i]), float(pickup_lon[i]),
+                float(dropoff_lat[i]), float(dropoff_lon[i]),
+                pickup_datetimes[i], tariff,
+                None if surge_multipliers is None else float(surge_multiplier[i])
+            )
+            for name in ROUNDED_AMOUNTS:
+                result[name][i] = exact[name]
+        return result
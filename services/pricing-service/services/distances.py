@@ -0,0 +1,82 @@
+"""
+Distances and ETAs for many points at once (candidate ranking, batch assignment).
+
+Built on PricingCalculator.estimate_trips, so a driver's trip to the pickup is
+estimated exactly as a priced trip would be: haversine distance, corrected by
+the road matrix when one is loaded. Everything is computed column-wise in
+NumPy; only the best `limit` candidates are fully sorted.
+"""
+from datetime import datetime
+from typing import Dict, Optional
+
+import numpy as np
+
+from services.calculator import KM_PER_MILE, PricingCalculator
+from services.road_matrix import hour_of_week
+
+
+def _estimate(origin_lat, origin_lon, destination_lat, destination_lon, departure: datetime):
+    """(km, minutes) for equal-length float64 arrays of trips"""
+    hours = np.full(len(origin_lat), hour_of_week(departure), dtype=np.int16)
+    miles, minutes = PricingCalculator.estimate_trips(origin_lat, origin_lon, destination_lat, destination_lon, hours)
+    return miles * KM_PER_MILE, minutes
+
+
+def rank_candidates(
+    pickup_lat: float,
+    pickup_lon: float,
+    latitude,
+    longitude,
+    departure: Optional[datetime] = None,
+    order_by: str = "eta",
+    limit: Optional[int] = None
+) -> Dict[str, np.ndarray]:
+    """Candidates (driver positions) ordered by their trip to the pickup, best first.
+
+    Returns order (indices into the input), distance_km and eta_minutes in that order.
+    Ties keep the input order.
+    """
+    latitude = np.asarray(latitude, dtype=np.float64)
+    longitude = np.asarray(longitude, dtype=np.float64)
+    n = len(latitude)
+    distance_km, eta_minutes = _estimate(
+        latitude, longitude, np.full(n, pickup_lat), np.full(n, pickup_lon), departure or datetime.now()
+    )
+    key = eta_minutes if order_by == "eta" else distance_km
+
+    if limit is not None and limit < n:
+        # O(n) selection of the best `limit`, then a sort of just those
+        best = np.argpartition(key, limit - 1)[:limit]
+        order = best[np.lexsort((best, key[best]))]
+    else:
+        order = np.argsort(key, kind="stable")
+    return {"order": order, "distance_km": distance_km[order], "eta_minutes": eta_minutes[order]}
+
+
+def distance_matrix(
+    origin_lat,
+    origin_lon,
+    destination_lat,
+    destination_lon,
+    departure: Optional[datetime] = None
+) -> Dict[str, np.ndarray]:
+    """distance_km and eta_minutes as [origins x destinations] arrays, plus nearest_origin
+    (per destination, the origin with the lowest ETA)"""
+    origin_lat = np.asarray(origin_lat, dtype=np.float64)
+    origin_lon = np.asarray(origin_lon, dtype=np.float64)
+    destination_lat = np.asarray(destination_lat, dtype=np.float64)
+    destination_lon = np.asarray(destination_lon, dtype=np.float64)
+    shape = (len(origin_lat), len(destination_lat))
+
+    # Flattened row by row: trip k is origin k // destinations -> destination k % destinations
+    distance_km, eta_minutes = _estimate(
+        np.repeat(origin_lat, shape[1]), np.repeat(origin_lon, shape[1]),
+        np.tile(destination_lat, shape[0]), np.tile(destination_lon, shape[0]),
+        departure or datetime.now()
+    )
+    eta_minutes = eta_minutes.reshape(shape)
+    return {
+        "distance_km": distance_km.reshape(shape),
+        "eta_minutes": eta_minutes,
+        "nearest_origin": eta_minutes.argmin(axis=0),
+    }
@@ -0,0 +1,166 @@
+"""
+Price quotes with IDs (POST /api/v1/pricing/quote).
+
+While the user drags the map the frontend asks for nearly the same price over
+and over. A quote is therefore priced for a quantized trip: coordinates rounded
+to QUOTE_COORD_PRECISION decimals (3 - about 110 m) and the pickup time floored
+to QUOTE_TIME_BUCKET seconds. The key also holds the tariff, the tariff snapshot
+version and the live surge multiplier, so a tariff reload or a surge change is a
+miss rather than a stale price.
+
+Quotes live in two places:
+  - an in-process LRU cache (QUOTE_CACHE_SIZE entries, QUOTE_CACHE_TTL seconds):
+    repeat quotes are answered from memory, with no pricing and no Redis I/O;
+  - Redis, key quote:{quote_id}, for QUOTE_TTL seconds: ride-service reads it
+    when a ride is created with quote_id and takes the fare from it instead of
+    recomputing. QUOTE_CACHE_TTL is shorter than QUOTE_TTL, so a quote served
+    from the cache stays valid for at least their difference.
+
+If Redis is unavailable the price is still returned, without quote_id.
+"""
+import logging
+import time
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta, timezone
+from typing import Hashable
+
+import orjson
+import redis.asyncio as aioredis
+
+import config
+from models.pricing import RideRequest, Tariff
+from services.calculator import KM_PER_MILE, PricingCalculator
+
+logger = logging.getLogger(__name__)
+
+QUOTE_KEY_PREFIX = "quote:"
+# A slow Redis must not hold up quoting: the price is then returned without quote_id
+REDIS_TIMEOUT = 1
+
+
+class QuoteCache:
+    """LRU cache with a per-entry TTL; used from the event loop only"""
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size = max_size
+        self.ttl = ttl
+        self._entries: "OrderedDict[Hashable, tuple]" = OrderedDict()  # key -> (expires at, value)
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: Hashable, now: float):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= now:
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key: Hashable, value, now: float):
+        self._entries[key] = (now + self.ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            # The least recently used entry is the first one
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._entries),
+            "max_size": self.max_size,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+        }
+
+
+def time_bucket(value: datetime, bucket: int) -> datetime:
+    """Floor to the bucket within the day (bucket divides 3600, so hour-based surge is unaffected)"""
+    seconds = value.hour * 3600 + value.minute * 60 + value.second
+    midnight = value.replace(hour=0, minute=0, second=0, microsecond=0)
+    return midnight + timedelta(seconds=seconds - seconds % bucket)
+
+
+class QuoteService:
+    def __init__(self, cache_size: int, cache_ttl: float, quote_ttl: int, precision: int, bucket: int):
+        # A cached quote must not outlive its quote_id
+        self.cache = QuoteCache(cache_size, min(cache_ttl, quote_ttl))
+        self.quote_ttl = quote_ttl
+        self.precision = precision
+        self.bucket = bucket
+        self.redis_errors = 0
+        # Connections are opened lazily, so the service starts without Redis
+        self.redis = aioredis.Redis(
+            host=config.REDIS_HOST,
+            port=config.REDIS_PORT,
+            db=0,
+            socket_timeout=REDIS_TIMEOUT,
+            socket_connect_timeout=REDIS_TIMEOUT,
+        )
+
+    async def quote(self, ride_request: RideRequest, tariff: Tariff, tariff_version: int, surge) -> dict:
+        """Quote for the trip; surge is a callable (latitude, longitude) -> live multiplier or None"""
+        p = self.precision
+        pickup_lat = round(ride_request.pickup_latitude, p)
+        pickup_lon = round(ride_request.pickup_longitude, p)
+        dropoff_lat = round(ride_request.dropoff_latitude, p)
+        dropoff_lon = round(ride_request.dropoff_longitude, p)
+        pickup_datetime = time_bucket(ride_request.pickup_datetime, self.bucket)
+        surge_multiplier = surge(pickup_lat, pickup_lon)
+
+        key = (tariff.name, tariff_version, pickup_lat, pickup_lon, dropoff_lat, dropoff_lon,
+               pickup_datetime, surge_multiplier)
+        now = time.time()
+        cached = self.cache.get(key, now)
+        if cached is not None:
+            return cached
+
+        quote = PricingCalculator.calculate_pricing(
+            pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetime, tariff, surge_multiplier
+        )
+        distance, _ = PricingCalculator.estimate_trip(pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, pickup_datetime)
+        quote.update(
+            quote_id=uuid.uuid4().hex,
+            expires_at=datetime.fromtimestamp(now + self.quote_ttl, tz=timezone.utc),
+            distance_km=round(distance * KM_PER_MILE, 2),
+            pickup_latitude=pickup_lat,
+            pickup_longitude=pickup_lon,
+            dropoff_latitude=dropoff_lat,
+            dropoff_longitude=dropoff_lon,
+            pickup_datetime=pickup_datetime,
+            # How far the ride's coordinates may be from the quoted ones (one rounding step)
+            coord_tolerance=10 ** -p,
+            # The ride's pickup time must fall within [pickup_datetime, pickup_datetime + time_bucket)
+            time_bucket=self.bucket,
+        )
+        try:
+            await self.redis.set(QUOTE_KEY_PREFIX + quote["quote_id"], orjson.dumps(quote), ex=self.quote_ttl)
+        except Exception as e:
+            self.redis_errors += 1
+            logger.warning(f"Failed to store quote: {e}")
+            # Not cached: the next request tries to store it again
+            return {**quote, "quote_id": None}
+        self.cache.put(key, quote, now)
+        return quote
+
+    def stats(self) -> dict:
+        return {**self.cache.stats(), "quote_ttl": self.quote_ttl, "redis_errors": self.redis_errors}
+
+    async def close(self):
+        await self.redis.aclose()
+
+
+quote_service = QuoteService(
+    cache_size=config.QUOTE_CACHE_SIZE,
+    cache_ttl=config.QUOTE_CACHE_TTL,
+    quote_ttl=config.QUOTE_TTL,
+    precision=config.QUOTE_COORD_PRECISION,
+    bucket=config.QUOTE_TIME_BUCKET,
+)
@@ -0,0 +1,153 @@
+"""
+Historical road-distance and speed corrections.
+
+scripts/build_road_matrix.py turns completed rides into a directory of .npy
+arrays: for every pair of grid cells (pickup -> dropoff) the median ratio of
+road distance to straight-line distance, and the median speed per hour of the
+week (Monday 00:00 = 0). The arrays are opened with np.load(mmap_mode="r"), so
+they are paged in by the OS instead of being copied into every worker, and a
+lookup is a few array indexings - O(1) per trip.
+
+Fallbacks, from most to least specific:
+  - ratio: the cell pair, then the city-wide median;
+  - speed: the cell pair at that hour, then the city at that hour, then the
+    city-wide median.
+
+The matrix is loaded once at startup from ROAD_MATRIX_PATH. Without it (path
+not set, directory missing or unreadable) trips are estimated as before: the
+straight-line distance at 30 mph.
+"""
+import json
+import logging
+import math
+import os
+from datetime import datetime
+from typing import Optional, Tuple
+
+import numpy as np
+
+import config
+
+logger = logging.getLogger(__name__)
+
+HOURS_PER_WEEK = 168
+ARRAYS = ("pair_index", "ratio", "speed", "global_speed")
+
+
+def hour_of_week(value: datetime) -> int:
+    return value.weekday() * 24 + value.hour
+
+
+class RoadMatrix:
+    """Read-only view of one matrix directory"""
+
+    def __init__(self, path: str):
+        with open(os.path.join(path, "meta.json")) as f:
+            self.meta = json.load(f)
+        arrays = {name: np.load(os.path.join(path, f"{name}.npy"), mmap_mode="r") for name in ARRAYS}
+        self.path = path
+        self.lat_min = float(self.meta["lat_min"])
+        self.lon_min = float(self.meta["lon_min"])
+        self.cell_size = float(self.meta["cell_size"])
+        self.n_lat = int(self.meta["n_lat"])
+        self.n_lon = int(self.meta["n_lon"])
+        self.global_ratio = float(self.meta["ratio"])
+        self.overall_speed = float(self.meta["speed"])
+        self.pair_index = arrays["pair_index"]
+        self.ratio = arrays["ratio"]
+        self.speed = arrays["speed"]
+        self.global_speed = arrays["global_speed"]
+
+        n_cells = self.n_lat * self.n_lon
+        if (self.pair_index.shape != (n_cells, n_cells) or self.speed.shape != (len(self.ratio), HOURS_PER_WEEK)
+                or self.global_speed.shape != (HOURS_PER_WEEK,)):
+            raise ValueError(f"Road matrix arrays in {path} do not match meta.json")
+
+    def cell(self, lat: float, lon: float) -> int:
+        """Cell number or -1 outside the grid (same formula as the build script)"""
+        i = math.floor((lat - self.lat_min) / self.cell_size)
+        j = math.floor((lon - self.lon_min) / self.cell_size)
+        if 0 <= i < self.n_lat and 0 <= j < self.n_lon:
+            return i * self.n_lon + j
+        return -1
+
+    def correction(self, pickup_lat: float, pickup_lon: float, dropoff_lat: float, dropoff_lon: float,
+                   how: int) -> Tuple[float, float]:
+        """(road / straight-line distance ratio, speed in km/h) for one trip"""
+        origin = self.cell(pickup_lat, pickup_lon)
+        destination = self.cell(dropoff_lat, dropoff_lon)
+        row = int(self.pair_index[origin, destination]) if origin >= 0 and destination >= 0 else -1
+        if row < 0:
+            return self.global_ratio, float(self.global_speed[how])
+        speed = float(self.speed[row, how])
+        if math.isnan(speed):
+            speed = float(self.global_speed[how])
+        return float(self.ratio[row]), speed
+
+    def cells(self, lat: np.ndarray, lon: np.ndarray) -> np.ndarray:
+        i = np.floor((lat - self.lat_min) / self.cell_size).astype(np.int64)
+        j = np.floor((lon - self.lon_min) / self.cell_size).astype(np.int64)
+        inside = (i >= 0) & (i < self.n_lat) & (j >= 0) & (j < self.n_lon)
+        return np.where(inside, i * self.n_lon + j, -1)
+
+    def corrections(self, pickup_lat: np.ndarray, pickup_lon: np.ndarray, dropoff_lat: np.ndarray,
+                    dropoff_lon: np.ndarray, how: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """Vectorized correction: float64 arrays of ratios and speeds"""
+        origin = self.cells(pickup_lat, pickup_lon)
+        destination = self.cells(dropoff_lat, dropoff_lon)
+        known = (origin >= 0) & (destination >= 0)
+        rows = np.full(len(origin), -1, dtype=np.int64)
+        rows[known] = self.pair_index[origin[known], destination[known]]
+
+        has_pair = rows >= 0
+        city_speed = self.global_speed[how].astype(np.float64)
+        ratio = np.full(len(rows), self.global_ratio)
+        ratio[has_pair] = self.ratio[rows[has_pair]]
+        speed = city_speed.copy()
+        speed[has_pair] = self.speed[rows[has_pair], how[has_pair]]
+        missing = np.isnan(speed)
+        speed[missing] = city_speed[missing]
+        return ratio, speed
+
+    def stats(self) -> dict:
+        return {
+            "path": self.path,
+            "built_at": self.meta.get("built_at"),
+            "cells": self.n_lat * self.n_lon,
+            "cell_size": self.cell_size,
+            "pairs": len(self.ratio),
+            "rides": self.meta.get("rides"),
+            "ratio": self.global_ratio,
+            "speed_kmh": self.overall_speed,
+        }
+
+
+class RoadMatrixStore:
+    def __init__(self, path: str):
+        self.path = path
+        self.matrix: Optional[RoadMatrix] = None
+        self.last_error: Optional[str] = None
+
+    def load(self) -> bool:
+        """Open the matrix; on failure keep straight-line estimates and return False"""
+        if not self.path:
+            logger.info("ROAD_MATRIX_PATH is not set, estimating trips by straight-line distance")
+            return False
+        try:
+            self.matrix = RoadMatrix(self.path)
+        except Exception as e:
+            self.last_error = str(e)
+            logger.warning(f"Road matrix not loaded from {self.path}, estimating trips by straight-line distance: {e}")
+            return False
+        logger.info(
+            f"Road matrix loaded: {len(self.matrix.ratio)} cell pairs, built {self.matrix.meta.get('built_at')}"
+        )
+        return True
+
+    def stats(self) -> dict:
+        if self.matrix is None:
+            return {"loaded": False, "path": self.path or None, "last_error": self.last_error}
+        return {"loaded": True, **self.matrix.stats()}
+
+
+road_matrix = RoadMatrixStore(config.ROAD_MATRIX_PATH)
@@ -0,0 +1,397 @@
+"""
+Supply/demand surge pricing.
+
+The city is split into square cells of SURGE_CELL_SIZE degrees. Per cell the
+engine tracks:
+  - demand: open ride requests - rides.created events of the last SURGE_WINDOW
+    seconds that have not been assigned or cancelled yet;
+  - supply: available drivers - members of the drivers:online GEO set (Redis),
+    minus drivers with an assigned ride (rides.assigned until rides.completed /
+    rides.cancelled), averaged over the samples of the last SURGE_WINDOW seconds.
+
+Every SURGE_UPDATE_INTERVAL seconds a background thread turns the counts into
+multipliers, smooths them over time (exponential moving average, so prices do
+not jump on a single request) and publishes an immutable SurgeSnapshot. Quoting
+only looks the pickup cell up in the current snapshot - no Redis or Kafka I/O
+per quote. If the snapshot is stale (Kafka or Redis unavailable) or the engine
+is disabled, multiplier() returns None and the time-of-day schedule applies.
+
+Every pricing-service instance reads all events itself (no consumer group) and
+starts SURGE_WINDOW seconds back, so the counts are warm right after a restart.
+"""
+import logging
+import math
+import threading
+import time
+from collections import Counter, deque
+from types import MappingProxyType
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+import orjson
+import redis
+from kafka import KafkaConsumer, TopicPartition
+
+import config
+
+logger = logging.getLogger(__name__)
+
+GEO_KEY = "drivers:online"
+CREATED_TOPIC = "rides.created"
+ASSIGNED_TOPIC = "rides.assigned"
+CLOSED_TOPICS = ("rides.completed", "rides.cancelled")
+TOPICS = (CREATED_TOPIC, ASSIGNED_TOPIC) + CLOSED_TOPICS
+# A driver whose ride never completed (lost event) is counted as busy for at most this long
+BUSY_MAX_AGE = 3 * 3600
+# Smoothed multipliers below this are treated as "no surge" and the cell is dropped
+SURGE_EPSILON = 0.01
+RETRY_DELAY = 5
+
+Cell = Tuple[int, int]
+
+
+def cell_of(latitude: float, longitude: float, cell_size: float) -> Cell:
+    return math.floor(latitude / cell_size), math.floor(longitude / cell_size)
+
+
+class SurgeSnapshot:
+    """Multipliers of surging cells at one point in time; cells not listed are 1.0"""
+    __slots__ = ("multipliers", "computed_at", "cell_size")
+
+    def __init__(self, multipliers: Dict[Cell, float], computed_at: float, cell_size: float):
+        self.multipliers = MappingProxyType(multipliers)
+        self.computed_at = computed_at
+        self.cell_size = cell_size
+
+    def multiplier_at(self, latitude: float, longitude: float) -> float:
+        return self.multipliers.get(cell_of(latitude, longitude, self.cell_size), 1.0)
+
+
+class SurgeEngine:
+    def __init__(
+        self,
+        enabled: bool,
+        cell_size: float,
+        window: float,
+        update_interval: float,
+        smoothing: float,
+        sensitivity: float,
+        min_demand: int,
+        max_multiplier: float,
+    ):
+        self.enabled = enabled
+        self.cell_size = cell_size
+        self.window = window
+        self.update_interval = update_interval
+        self.smoothing = smoothing
+        self.sensitivity = sensitivity
+        self.min_demand = min_demand
+        self.max_multiplier = max_multiplier
+        # Quotes fall back to the schedule if the engine misses this many updates
+        self.stale_after = 3 * update_interval
+
+        self._snapshot: Optional[SurgeSnapshot] = None
+        # State below is touched only by the engine thread
+        self._open: Dict[str, Tuple[Cell, float]] = {}  # ride_id -> (pickup cell, created at)
+        self._busy: Dict[str, float] = {}               # driver_id -> assigned at
+        # ride_id -> closed at; a created event replayed or delivered after the ride was
+        # assigned/cancelled (topics are not ordered relative to each other) is ignored
+        self._closed: Dict[str, float] = {}
+        self._supply_samples: deque = deque()           # (sampled at, Counter of free drivers per cell)
+        self._smoothed: Dict[Cell, float] = {}
+        self._consumer = None
+        self._partitions = set()
+        self._redis = None
+
+        self._thread = None
+        self._stop = threading.Event()
+        self._stats_lock = threading.Lock()
+        self.counters = {"events": 0, "bad_events": 0, "updates": 0, "kafka_errors": 0, "redis_errors": 0}
+        self.last_error: Optional[str] = None
+
+    @property
+    def snapshot(self) -> Optional[SurgeSnapshot]:
+        return self._snapshot
+
+    def _fresh(self, snapshot: Optional[SurgeSnapshot]) -> bool:
+        return snapshot is not None and time.time() - snapshot.computed_at <= self.stale_after
+
+    def multiplier(self, latitude: float, longitude: float) -> Optional[float]:
+        """Current multiplier for a pickup point, or None if there is no fresh data"""
+        snapshot = self._snapshot
+        if not self._fresh(snapshot):
+            return None
+        return snapshot.multiplier_at(latitude, longitude)
+
+    def multipliers(self, latitudes, longitudes) -> Optional[np.ndarray]:
+        """multiplier() for many pickup points, all from one snapshot; None if there is no fresh data"""
+        snapshot = self._snapshot
+        if not self._fresh(snapshot):
+            return None
+        latitudes = np.asarray(latitudes, dtype=np.float64)
+        longitudes = np.asarray(longitudes, dtype=np.float64)
+        result = np.ones(len(latitudes))
+        if not snapshot.multipliers:
+            return result
+        # Same floor arithmetic as cell_of, then one dict lookup per distinct cell
+        cells = np.stack([
+            np.floor(latitudes / snapshot.cell_size), np.floor(longitudes / snapshot.cell_size)
+        ], axis=1).astype(np.int64)
+        unique, inverse = np.unique(cells, axis=0, return_inverse=True)
+        values = np.array([snapshot.multipliers.get((int(i), int(j)), 1.0) for i, j in unique])
+        return values[inverse.reshape(-1)]
+
+    # --- inputs --------------------------------------------------------------
+
+    def observe(self, topic: str, ride: dict, at: float):
+        """Apply one ride event (payload is the ride as published by ride-service)"""
+        ride_id = ride["id"]
+        if topic == CREATED_TOPIC:
+            if ride_id in self._closed:
+                return
+            cell = cell_of(float(ride["pickup_latitude"]), float(ride["pickup_longitude"]), self.cell_size)
+            self._open[ride_id] = (cell, at)
+            return
+        self._open.pop(ride_id, None)
+        # Re-inserted so the dict stays ordered by close time for _expire
+        self._closed.pop(ride_id, None)
+        self._closed[ride_id] = at
+        driver_id = ride.get("driver_id")
+        if driver_id:
+            if topic == ASSIGNED_TOPIC:
+                self._busy[driver_id] = at
+            else:
+                self._busy.pop(driver_id, None)
+
+    def observe_supply(self, drivers, at: float):
+        """drivers: (driver_id, latitude, longitude) of everyone in drivers:online"""
+        free = Counter(
+            cell_of(latitude, longitude, self.cell_size)
+            for driver_id, latitude, longitude in drivers
+            if driver_id not in self._busy
+        )
+        self._supply_samples.append((at, free))
+
+    # --- computation ---------------------------------------------------------
+
+    def _expire(self, now: float):
+        cutoff = now - self.window
+        # Events arrive roughly in time order, so old entries are at the front
+        stale = []
+        for ride_id, (_, created_at) in self._open.items():
+            if created_at >= cutoff:
+                break
+            stale.append(ride_id)
+        for ride_id in stale:
+            del self._open[ride_id]
+        stale = []
+        for ride_id, closed_at in self._closed.items():
+            if closed_at >= cutoff:
+                break
+            stale.append(ride_id)
+        for ride_id in stale:
+            del self._closed[ride_id]
+        busy_cutoff = now - BUSY_MAX_AGE
+        for driver_id in [d for d, at in self._busy.items() if at < busy_cutoff]:
+            del self._busy[driver_id]
+        while self._supply_samples and self._supply_samples[0][0] < cutoff:
+            self._supply_samples.popleft()
+
+    def target_multiplier(self, demand: int, supply: float) -> float:
+        """Unsmoothed multiplier for a cell: grows with requests per available driver"""
+        if demand < self.min_demand:
+            return 1.0
+        ratio = demand / max(supply, 1.0)
+        return min(self.max_multiplier, max(1.0, 1.0 + self.sensitivity * (ratio - 1.0)))
+
+    def compute(self, now: float) -> SurgeSnapshot:
+        """Recompute multipliers from the current windows and publish a new snapshot"""
+        self._expire(now)
+        demand = Counter(cell for cell, _ in self._open.values())
+        supply: Counter = Counter()
+        for _, sample in self._supply_samples:
+            supply.update(sample)
+        samples = max(len(self._supply_samples), 1)
+
+        smoothed = {}
+        for cell in set(demand) | set(self._smoothed):
+            target = self.target_multiplier(demand.get(cell, 0), supply.get(cell, 0) / samples)
+            previous = self._smoothed.get(cell, 1.0)
+            value = previous + self.smoothing * (target - previous)
+            if value >= 1.0 + SURGE_EPSILON:
+                smoothed[cell] = value
+        self._smoothed = smoothed
+
+        # Quoted multipliers move in 0.1 steps
+        multipliers = {cell: round(value, 1) for cell, value in smoothed.items() if round(value, 1) > 1.0}
+        self._snapshot = SurgeSnapshot(multipliers, now, self.cell_size)
+        self._count("updates")
+        return self._snapshot
+
+    # --- I/O (engine thread) -------------------------------------------------
+
+    def _count(self, name: str, error: Optional[Exception] = None):
+        with self._stats_lock:
+            self.counters[name] += 1
+            if error is not None:
+                self.last_error = str(error)
+
+    def _connect(self):
+        consumer = KafkaConsumer(
+            bootstrap_servers=[config.KAFKA_BOOTSTRAP_SERVERS],
+            group_id=None,
+            enable_auto_commit=False,
+            value_deserializer=orjson.loads,
+        )
+        self._consumer = consumer
+        self._partitions = set()
+        self._assign()
+
+    def _assign(self):
+        """Assign all partitions of TOPICS; new ones are read from SURGE_WINDOW seconds ago"""
+        consumer = self._consumer
+        consumer.topics()  # refreshes metadata, topics may have been created since the last call
+        partitions = {
+            TopicPartition(topic, partition)
+            for topic in TOPICS
+            for partition in (consumer.partitions_for_topic(topic) or ())
+        }
+        new = partitions - self._partitions
+        if not new:
+            return
+        positions = {tp: consumer.position(tp) for tp in self._partitions}
+        consumer.assign(list(partitions))
+        for tp, offset in positions.items():
+            consumer.seek(tp, offset)
+        start_ms = int((time.time() - self.window) * 1000)
+        for tp, found in consumer.offsets_for_times({tp: start_ms for tp in new}).items():
+            if found is None:
+                consumer.seek_to_end(tp)
+            else:
+                consumer.seek(tp, found.offset)
+        self._partitions = partitions
+
+    def _close_consumer(self):
+        consumer, self._consumer = self._consumer, None
+        if consumer is not None:
+            try:
+                consumer.close()
+            except Exception:
+                pass
+
+    def _consume(self, timeout_ms: int):
+        for records in self._consumer.poll(timeout_ms=timeout_ms, max_records=5000).values():
+            for message in records:
+                try:
+                    self.observe(message.topic, message.value, message.timestamp / 1000)
+                except (KeyError, TypeError, ValueError):
+                    self._count("bad_events")
+                    continue
+                self._count("events")
+
+    def _sample_supply(self, now: float):
+        if self._redis is None:
+            self._redis = redis.Redis(
+                host=config.REDIS_HOST, port=config.REDIS_PORT, decode_responses=True, socket_timeout=5
+            )
+        drivers = self._redis.geosearch(
+            GEO_KEY,
+            longitude=config.SURGE_AREA_LONGITUDE,
+            latitude=config.SURGE_AREA_LATITUDE,
+            radius=config.SURGE_AREA_RADIUS_KM,
+            unit="km",
+            withcoord=True,
+        )
+        self.observe_supply(((driver_id, lat, lon) for driver_id, (lon, lat) in drivers), now)
+
+    def _run(self):
+        next_update = time.monotonic()
+        while not self._stop.is_set():
+            try:
+                if self._consumer is None:
+                    self._connect()
+                self._consume(timeout_ms=int(min(self.update_interval, 1) * 1000))
+            except Exception as e:
+                self._count("kafka_errors", e)
+                logger.error(f"Surge engine Kafka error: {e}")
+                self._close_consumer()
+                self._stop.wait(RETRY_DELAY)
+                continue
+
+            if time.monotonic() < next_update:
+                continue
+            next_update = time.monotonic() + self.update_interval
+            now = time.time()
+            try:
+                self._assign()
+            except Exception as e:
+                self._count("kafka_errors", e)
+                logger.error(f"Surge engine Kafka error: {e}")
+                self._close_consumer()
+                continue
+            try:
+                self._sample_supply(now)
+            except Exception as e:
+                # Without fresh supply the snapshot is not updated and goes stale
+                self._count("redis_errors", e)
+                logger.error(f"Surge engine supply sampling failed: {e}")
+                continue
+            self.compute(now)
+
+    def start(self):
+        if not self.enabled:
+            logger.info("Surge engine disabled, using the time-of-day schedule")
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="surge-engine", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 10):
+        if self._thread is None:
+            return
+        self._stop.set()
+        self._thread.join(timeout)
+        self._thread = None
+        self._close_consumer()
+        if self._redis is not None:
+            self._redis.close()
+            self._redis = None
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        with self._stats_lock:
+            counters = dict(self.counters)
+            last_error = self.last_error
+        top = []
+        if snapshot is not None:
+            top = sorted(snapshot.multipliers.items(), key=lambda item: item[1], reverse=True)[:10]
+        return {
+            "enabled": self.enabled,
+            "live": self._fresh(snapshot),
+            "computed_at": snapshot.computed_at if snapshot else None,
+            "surging_cells": len(snapshot.multipliers) if snapshot else 0,
+            "top_cells": [
+                {
+                    "latitude": (lat + 0.5) * self.cell_size,
+                    "longitude": (lon + 0.5) * self.cell_size,
+                    "multiplier": value,
+                }
+                for (lat, lon), value in top
+            ],
+            "open_requests": len(self._open),
+            "busy_drivers": len(self._busy),
+            **counters,
+            "last_error": last_error,
+        }
+
+
+surge_engine = SurgeEngine(
+    enabled=config.SURGE_ENABLED,
+    cell_size=config.SURGE_CELL_SIZE,
+    window=config.SURGE_WINDOW,
+    update_interval=config.SURGE_UPDATE_INTERVAL,
+    smoothing=config.SURGE_SMOOTHING,
+    sensitivity=config.SURGE_SENSITIVITY,
+    min_demand=config.SURGE_MIN_DEMAND,
+    max_multiplier=config.SURGE_MAX_MULTIPLIER,
+)
@@ -0,0 +1,208 @@
+"""
+In-memory tariff table.
+
+Active rows of the tariffs table are loaded into an immutable TariffSnapshot at
+startup, and quoting only ever reads the current snapshot - never the database.
+A background task reloads the table every TARIFF_REFRESH_INTERVAL seconds and
+right after NOTIFY tariffs_changed (trigger from migrations/012). A new snapshot
+replaces the old one in a single assignment, so a request sees either the old
+table or the new one, never a mix of both.
+
+Until the first successful load (e.g. the database is down at startup) the seed
+tariffs of infrastructure/postgres/init.sql are served.
+"""
+import asyncio
+import logging
+import time
+from datetime import datetime
+from types import MappingProxyType
+from typing import Optional, Tuple
+
+import asyncpg
+
+import config
+from models.pricing import Tariff
+
+logger = logging.getLogger(__name__)
+
+NOTIFY_CHANNEL = "tariffs_changed"
+SELECT_SQL = """
+    SELECT name, base_fare, per_km, per_minute, min_fare
+    FROM tariffs
+    WHERE is_active
+    ORDER BY base_fare, name
+"""
+CONNECT_TIMEOUT = 5
+# A failed reload is retried sooner than the regular refresh
+RETRY_DELAY = 5
+
+# Seed rows of infrastructure/postgres/init.sql
+DEFAULT_TARIFFS = (
+    Tariff(name="UberX", base_fare=2.55, per_km=1.75, per_minute=0.35, min_fare=8.00),
+    Tariff(name="UberXL", base_fare=3.85, per_km=2.85, per_minute=0.50, min_fare=10.00),
+    Tariff(name="UberBLACK", base_fare=7.00, per_km=3.75, per_minute=0.65, min_fare=15.00),
+    Tariff(name="UberSUV", base_fare=14.00, per_km=4.50, per_minute=0.80, min_fare=25.00),
+)
+
+
+class UnknownTariffError(Exception):
+    def __init__(self, name: str, available: Tuple[str, ...]):
+        self.name = name
+        self.available = available
+        super().__init__(f"Unknown tariff '{name}', available: {', '.join(available)}")
+
+
+class TariffSnapshot:
+    """Active tariffs at one point in time; replaced as a whole, never modified"""
+    __slots__ = ("by_name", "tariffs", "version", "source", "loaded_at")
+
+    def __init__(self, tariffs: Tuple[Tariff, ...], version: int, source: str, loaded_at: Optional[datetime] = None):
+        self.tariffs = tariffs
+        self.by_name = MappingProxyType({tariff.name: tariff for tariff in tariffs})
+        self.version = version
+        self.source = source  # "defaults" or "database"
+        self.loaded_at = loaded_at
+
+    def get(self, name: Optional[str] = None) -> Tariff:
+        """Tariff by name; PRICING_DEFAULT_TARIFF if no name is given"""
+        name = name or config.PRICING_DEFAULT_TARIFF
+        tariff = self.by_name.get(name)
+        if tariff is None:
+            raise UnknownTariffError(name, tuple(self.by_name))
+        return tariff
+
+
+class TariffStore:
+    def __init__(self, refresh_interval: float):
+        self.refresh_interval = refresh_interval
+        self._snapshot = TariffSnapshot(DEFAULT_TARIFFS, version=0, source="defaults")
+        self._conn = None
+        self._changed: Optional[asyncio.Event] = None
+        self._task = None
+        self.reloads = 0
+        self.notifications = 0
+        self.errors = 0
+        self.last_error: Optional[str] = None
+        self.last_refresh_at: Optional[float] = None
+
+    @property
+    def snapshot(self) -> TariffSnapshot:
+        return self._snapshot
+
+    def get(self, name: Optional[str] = None) -> Tariff:
+        return self._snapshot.get(name)
+
+    def apply(self, tariffs: Tuple[Tariff, ...]) -> bool:
+        """Swap in a new snapshot if the table changed. Returns True if it did"""
+        current = self._snapshot
+        if not tariffs:
+            # Most likely a half-applied change; quoting with no tariffs at all would fail every request
+            logger.warning("No active tariffs in the database, keeping the current snapshot")
+            return False
+        if current.source == "database" and current.tariffs == tariffs:
+            return False
+        self._snapshot = TariffSnapshot(tariffs, current.version + 1, "database", datetime.utcnow())
+        self.reloads += 1
+        logger.info(f"Tariffs v{self._snapshot.version} loaded: {', '.join(t.name for t in tariffs)}")
+        return True
+
+    def _on_notify(self, conn, pid, channel, payload):
+        self.notifications += 1
+        self._changed.set()
+
+    async def _connect(self):
+        conn = await asyncpg.connect(
+            host=config.POSTGRES_HOST,
+            port=config.POSTGRES_PORT,
+            database=config.POSTGRES_DB,
+            user=config.POSTGRES_USER,
+            password=config.POSTGRES_PASSWORD,
+            timeout=CONNECT_TIMEOUT,
+        )
+        await conn.add_listener(NOTIFY_CHANNEL, self._on_notify)
+        return conn
+
+    async def _close(self):
+        conn, self._conn = self._conn, None
+        if conn is not None:
+            try:
+                await conn.close(timeout=CONNECT_TIMEOUT)
+            except Exception:
+                conn.terminate()
+
+    async def refresh(self) -> bool:
+        """Reload the table now. On failure the current snapshot stays; returns False"""
+        try:
+            if self._conn is None or self._conn.is_closed():
+                # LISTEN lives on the connection, so a new one subscribes again
+                await self._close()
+                self._conn = await self._connect()
+            # Cleared before reading: a NOTIFY that arrives meanwhile triggers another reload
+            self._changed.clear()
+            rows = await self._conn.fetch(SELECT_SQL)
+        except Exception as e:
+            self.errors += 1
+            self.last_error = str(e)
+            logger.error(f"Failed to load tariffs: {e}")
+            await self._close()
+            return False
+        tariffs = tuple(
+            Tariff(
+                name=row["name"],
+                base_fare=float(row["base_fare"]),
+                per_km=float(row["per_km"]),
+                per_minute=float(row["per_minute"]),
+                min_fare=float(row["min_fare"]),
+            )
+            for row in rows
+        )
+        self.apply(tariffs)
+        self.last_refresh_at = time.time()
+        return True
+
+    async def _run(self, ok: bool):
+        while True:
+            try:
+                await asyncio.wait_for(
+                    self._changed.wait(),
+                    timeout=self.refresh_interval if ok else min(self.refresh_interval, RETRY_DELAY),
+                )
+            except asyncio.TimeoutError:
+                pass
+            ok = await self.refresh()
+
+    async def start(self):
+        """Load the table, then keep it fresh in the background. Does not fail without a database"""
+        self._changed = asyncio.Event()
+        ok = await self.refresh()
+        if not ok:
+            logger.warning("Serving default tariffs until the tariffs table can be read")
+        self._task = asyncio.create_task(self._run(ok))
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self._close()
+
+    def stats(self) -> dict:
+        snapshot = self._snapshot
+        return {
+            "version": snapshot.version,
+            "source": snapshot.source,
+            "loaded_at": snapshot.loaded_at.isoformat() if snapshot.loaded_at else None,
+            "tariffs": list(snapshot.by_name),
+            "listening": self._conn is not None and not self._conn.is_closed(),
+            "reloads": self.reloads,
+            "notifications": self.notifications,
+            "errors": self.errors,
+            "last_error": self.last_error,
+            "last_refresh_at": self.last_refresh_at,
+        }
+
+
+tariff_store = TariffStore(config.TARIFF_REFRESH_INTERVAL)
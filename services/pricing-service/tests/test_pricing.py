@@ -0,0 +1,82 @@
+"""
+calculate_pricing_batch must return exactly what calculate_pricing returns for
+every trip, including amounts that land on (or within float noise of) half a cent.
+
+Run from services/pricing-service:
+    python -m pytest -q tests
+"""
+import os
+import sys
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from models.pricing import Tariff  # noqa: E402
+from services.calculator import KM_PER_MILE, ROUNDED_AMOUNTS, SCALAR_BATCH_MAX, PricingCalculator  # noqa: E402
+
+BBOX = (40.55, 40.90, -74.05, -73.75)  # lat_min, lat_max, lon_min, lon_max
+STANDARD = Tariff(name="standard", base_fare=2.5, per_km=1.5, per_minute=0.5, min_fare=5.0)
+COLUMNS = ("base_fare", "surge_multiplier") + ROUNDED_AMOUNTS
+
+
+def make_trips(n: int, rng):
+    lat_min, lat_max, lon_min, lon_max = BBOX
+    start = datetime(2024, 1, 15)
+    datetimes = [start + timedelta(minutes=int(m)) for m in rng.integers(0, 7 * 24 * 60, n)]
+    return (rng.uniform(lat_min, lat_max, n), rng.uniform(lon_min, lon_max, n),
+            rng.uniform(lat_min, lat_max, n), rng.uniform(lon_min, lon_max, n), datetimes)
+
+
+def assert_batch_matches_scalar(trips, tariff, surge=None):
+    pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, datetimes = trips
+    result = PricingCalculator.calculate_pricing_batch(
+        pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, datetimes, tariff, surge
+    )
+    for i in range(len(datetimes)):
+        expected = PricingCalculator.calculate_pricing(
+            float(pickup_lat[i]), float(pickup_lon[i]), float(dropoff_lat[i]), float(dropoff_lon[i]),
+            datetimes[i], tariff, None if surge is None else float(surge[i])
+        )
+        for name in COLUMNS:
+            assert float(result[name][i]) == expected[name], (i, name, float(result[name][i]), expected[name])
+
+
+@pytest.mark.parametrize("n", [1, SCALAR_BATCH_MAX, SCALAR_BATCH_MAX + 1, 5000])
+def test_batch_matches_scalar(n):
+    assert_batch_matches_scalar(make_trips(n, np.random.default_rng(n)), STANDARD)
+
+
+def test_batch_matches_scalar_with_live_surge():
+    rng = np.random.default_rng(7)
+    surge = np.round(rng.uniform(1.0, 3.0, 2000), 1)
+    assert_batch_matches_scalar(make_trips(2000, rng), STANDARD, surge)
+
+
+def test_batch_matches_scalar_on_half_cent_ties():
+    """Tariffs tuned so one trip of the batch lands on x.xx5 before rounding"""
+    rng = np.random.default_rng(42)
+    trips = make_trips(200, rng)
+    pickup_lat, pickup_lon, dropoff_lat, dropoff_lon, datetimes = trips
+    for i in rng.choice(len(datetimes), 25, replace=False):
+        miles, minutes = PricingCalculator.estimate_trip(
+            float(pickup_lat[i]), float(pickup_lon[i]), float(dropoff_lat[i]), float(dropoff_lon[i]), datetimes[i]
+        )
+        cents = int(rng.integers(100, 5000))
+        standard_fares = miles * KM_PER_MILE * STANDARD.per_km + minutes * STANDARD.per_minute
+        tariffs = (
+            # distance_fare on a half cent
+            STANDARD.model_copy(update={"per_km": (cents + 0.5) / 100 / (miles * KM_PER_MILE)}),
+            # time_fare on a half cent
+            STANDARD.model_copy(update={"per_minute": (cents + 0.5) / 100 / minutes}),
+            # total_amount on a half cent (surge 1.0 keeps the sum as is)
+            STANDARD.model_copy(update={
+                "base_fare": (cents + 0.5) / 100 - standard_fares,
+                "min_fare": 0.0,
+            }),
+        )
+        for tariff in tariffs:
+            assert_batch_matches_scalar(trips, tariff)
+            assert_batch_matches_scalar(trips, tariff, np.ones(len(datetimes)))
@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Бенчмарк сериализации списков: старый путь против быстрого (serialization.py).
+
+Старый путь - как было в роутерах: Model(**row) в репозитории, затем FastAPI
+прогоняет список через response_model (model_dump -> валидация -> JSON-режим)
+и json.dumps в JSONResponse. Быстрый - from_rows (model_construct) и
+ORJSONListResponse. Считается стоимость строки для Ride, Driver и User;
+JSON обоих путей сверяется.
+
+Использование (из services/ride-service):
+    python benchmarks/bench_serialization.py
+    python benchmarks/bench_serialization.py --rows 100 --pages 500
+
+Модели User и Driver берутся из соседних сервисов (models/ - namespace-пакет).
+"""
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+import uuid
+from datetime import datetime, timedelta
+from decimal import Decimal
+from typing import List
+
+SERVICE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICES_DIR = os.path.dirname(SERVICE_DIR)
+sys.path.insert(0, SERVICE_DIR)
+sys.path.append(os.path.join(SERVICES_DIR, "user-service"))
+sys.path.append(os.path.join(SERVICES_DIR, "driver-service"))
+
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.routing import serialize_response  # noqa: E402
+from fastapi.utils import create_response_field  # noqa: E402
+
+from models.driver import Driver  # noqa: E402
+from models.ride import Ride  # noqa: E402
+from models.user import User  # noqa: E402
+from serialization import ORJSONListResponse, from_rows  # noqa: E402
+
+BASE_TIME = datetime(2024, 1, 15, 8, 30)
+
+
+def user_row(i: int) -> dict:
+    # Так строку отдаёт psycopg2 (RealDictCursor): UUID строкой, DECIMAL - Decimal
+    return {
+        "id": str(uuid.uuid4()),
+        "phone": f"+7900{i:07d}",
+        "name": f"User {i}",
+        "email": f"user{i}@example.com",
+        "rating": Decimal("4.87"),
+        "total_rides": i % 300,
+        "created_at": BASE_TIME + timedelta(minutes=i),
+    }
+
+
+def driver_row(i: int) -> dict:
+    return {
+        "id": str(uuid.uuid4()),
+        "phone": f"+7910{i:07d}",
+        "name": f"Driver {i}",
+        "email": f"driver{i}@example.com",
+        "license_number": f"77AB{i:06d}",
+        "car_model": "Toyota Camry",
+        "car_plate": f"A{i % 1000:03d}AA77",
+        "car_color": "white",
+        "rating": Decimal("4.93"),
+        "total_rides": i % 5000,
+        "is_online": i % 2 == 0,
+        "is_busy": False,
+        "current_latitude": Decimal("55.75580000"),
+        "current_longitude": Decimal("37.61730000"),
+        "created_at": BASE_TIME + timedelta(minutes=i),
+        "updated_at": BASE_TIME + timedelta(minutes=i, seconds=30),
+    }
+
+
+def ride_row(i: int) -> dict:
+    pickup = BASE_TIME + timedelta(minutes=7 * i)
+    return {
+        "id": str(uuid.uuid4()),
+        "user_id": str(uuid.uuid4()),
+        "driver_id": str(uuid.uuid4()),
+        "vendor_id": 1 + i % 2,
+        "pickup_datetime": pickup,
+        "dropoff_datetime": pickup + timedelta(minutes=18),
+        "passenger_count": 1 + i % 4,
+        "pickup_latitude": Decimal("40.71280000"),
+        "pickup_longitude": Decimal("-74.00600000"),
+        "dropoff_latitude": Decimal("40.75800000"),
+        "dropoff_longitude": Decimal("-73.98550000"),
+        "pickup_district": "Manhattan",
+        "pickup_neighbourhood": "Tribeca",
+        "dropoff_district": "Manhattan",
+        "dropoff_neighbourhood": "Midtown",
+        "trip_duration": 1080,
+        "distance_km": Decimal("7.50"),
+        "total_fare": Decimal("24.43"),
+        "status": "completed",
+        "pickup_hour": pickup.hour,
+        "day_period": "morning",
+        "day_name": pickup.strftime("%A"),
+        "weekday_or_weekend": "weekday",
+        "regular_day_or_holiday": "regular",
+        "month": pickup.month,
+        "year": pickup.year,
+        "season": "winter",
+        "created_at": pickup,
+    }
+
+
+def new_path(model, rows) -> bytes:
+    return ORJSONListResponse(from_rows(model, rows)).body
+
+
+async def old_path(model, field, rows) -> bytes:
+    objs = [model(**row) for row in rows]
+    content = await serialize_response(field=field, response_content=objs, is_coroutine=True)
+    return JSONResponse(content).body
+
+
+def timed(fn, pages: int) -> float:
+    started = time.perf_counter()
+    for _ in range(pages):
+        fn()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Model(**row) + response_model vs model_construct + orjson")
+    parser.add_argument("--rows", type=int, default=100, help="строк на странице")
+    parser.add_argument("--pages", type=int, default=300)
+    args = parser.parse_args()
+
+    loop = asyncio.new_event_loop()
+    for model, make_row in ((Ride, ride_row), (Driver, driver_row), (User, user_row)):
+        rows = [make_row(i) for i in range(args.rows)]
+        field = create_response_field(name="response", type_=List[model])
+
+        old = loop.run_until_complete(old_path(model, field, rows))
+        new = new_path(model, rows)
+        assert json.loads(old) == json.loads(new), f"{model.__name__}: JSON старого и нового пути расходится"
+
+        old_time = timed(lambda: loop.run_until_complete(old_path(model, field, rows)), args.pages)
+        new_time = timed(lambda: new_path(model, rows), args.pages)
+        total = args.rows * args.pages
+        print(
+            f"📦 {model.__name__:<7} ({len(model.model_fields)} полей): "
+            f"старый {old_time / total * 1e6:7.2f} мкс/строка, "
+            f"новый {new_time / total * 1e6:7.2f} мкс/строка, "
+            f"x{old_time / new_time:.1f}"
+        )
+    loop.close()
+    print("✅ JSON обоих путей совпадает")
+
+
+if __name__ == "__main__":
+    main()
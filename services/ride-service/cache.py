@@ -0,0 +1,131 @@
+# services/ride-service/cache.py
+"""
+Кэш первой страницы истории поездок (/users/{id}/rides, /drivers/{id}/rides) в Redis.
+
+Кэшируются первые RIDE_HISTORY_CACHED_ROWS строк; запрос без курсора с limit не больше
+этого числа отдаётся срезом. Инвалидация - новая версия в ключе ...:ver (без DEL):
+страница хранится вместе с версией, прочитанной до запроса в базу, и при расхождении
+считается промахом. Так страница, прочитанная до изменения и записанная после
+инвалидации, не будет отдана. Ошибки Redis не ломают запрос - просто идём в базу.
+"""
+import json
+import logging
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+from models.ride import RideSummary
+
+logger = logging.getLogger(__name__)
+
+# Версия живёт заметно дольше страницы: к её истечению все страницы со старой версией уже истекли
+VERSION_TTL_FACTOR = 10
+
+
+class CacheStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "hits": 0,
+            "misses": 0,
+            "invalidations": 0,
+            "redis_errors": 0,
+        }
+
+    def incr(self, name: str, amount: int = 1):
+        with self._lock:
+            self.counters[name] += amount
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            result = dict(self.counters)
+        lookups = result["hits"] + result["misses"]
+        result["hit_rate"] = round(result["hits"] / lookups, 4) if lookups else 0.0
+        return result
+
+
+class RideHistoryCache:
+    def __init__(self, ttl: int, cached_rows: int):
+        self.ttl = ttl
+        self.cached_rows = cached_rows
+        self.stats = CacheStats()
+
+    @staticmethod
+    def key(owner: str, owner_id: str) -> str:
+        # owner - "user" или "driver"
+        return f"cache:rides:{owner}:{owner_id}"
+
+    async def _redis(self, method: str, *args, **kwargs):
+        client = db.redis
+        if settings.DB_BACKEND == "async":
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_in_threadpool(getattr(client, method), *args, **kwargs)
+
+    async def _set_versions(self, keys: Iterable[str], version: str):
+        # Один pipeline на все ключи: массовая загрузка сбрасывает тысячи историй разом
+        ttl = self.ttl * VERSION_TTL_FACTOR
+        if settings.DB_BACKEND == "async":
+            async with db.redis.pipeline(transaction=False) as pipe:
+                for key in keys:
+                    pipe.set(f"{key}:ver", version, ex=ttl)
+                await pipe.execute()
+            return
+
+        def set_sync():
+            pipe = db.redis.pipeline(transaction=False)
+            for key in keys:
+                pipe.set(f"{key}:ver", version, ex=ttl)
+            pipe.execute()
+
+        await run_in_threadpool(set_sync)
+
+    async def get(self, owner: str, owner_id: str) -> Tuple[Optional[List[RideSummary]], str]:
+        """(строки или None при промахе, текущая версия - передать в set после чтения из базы)"""
+        key = self.key(owner, owner_id)
+        try:
+            raw, version = await self._redis("mget", key, f"{key}:ver")
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache read failed for {key}: {e}")
+            return None, None
+        version = version or "0"
+        if raw is not None:
+            page = json.loads(raw)
+            if page["version"] == version:
+                self.stats.incr("hits")
+                return [RideSummary.model_validate(row) for row in page["rows"]], version
+        self.stats.incr("misses")
+        return None, version
+
+    async def set(self, owner: str, owner_id: str, rides: List[RideSummary], version: Optional[str]):
+        if version is None:
+            # Redis был недоступен при чтении - версия неизвестна, не кэшируем
+            return
+        key = self.key(owner, owner_id)
+        raw = json.dumps({"version": version, "rows": [ride.model_dump(mode="json") for ride in rides]})
+        try:
+            await self._redis("set", key, raw, ex=self.ttl)
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache write failed for {key}: {e}")
+
+    async def invalidate(self, owners: Iterable[Tuple[str, Optional[str]]]):
+        """owners - пары ("user"/"driver", id); пустые id пропускаются"""
+        keys = {self.key(owner, owner_id) for owner, owner_id in owners if owner_id}
+        if not keys:
+            return
+        # Уникальна и без общего счётчика: время в наносекундах
+        version = str(time.time_ns())
+        self.stats.incr("invalidations", len(keys))
+        try:
+            await self._set_versions(keys, version)
+        except Exception as e:
+            self.stats.incr("redis_errors")
+            logger.warning(f"Cache invalidation failed for {next(iter(keys))}: {e}")
+
+
+ride_history_cache = RideHistoryCache(settings.RIDE_HISTORY_CACHE_TTL, settings.RIDE_HISTORY_CACHED_ROWS)
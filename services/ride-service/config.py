@@ -9,7 +9,62 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "uber")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
     
+    # Пул соединений PostgreSQL
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_CONNECT_TIMEOUT: int = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+    # sync - psycopg2 в threadpool, async - asyncpg в event loop
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "sync")
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # Реплики для чтения: DSN через запятую, пусто - все запросы на primary
+    POSTGRES_REPLICA_DSNS: str = os.getenv("POSTGRES_REPLICA_DSNS", "")
+    # Реплика, отставшая больше чем на столько секунд, пропускается
+    DB_REPLICA_MAX_LAG: float = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 2))
+    # Столько секунд после записи клиент читает с primary (read-your-writes)
+    DB_READ_YOUR_WRITES_TTL: float = float(os.getenv("DB_READ_YOUR_WRITES_TTL", 5))
+    
+    # Redis
+    REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
+    REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    REDIS_POOL_MAX_SIZE: int = int(os.getenv("REDIS_POOL_MAX_SIZE", 50))
+    
+    # Выгрузка /api/v1/rides/export: строк на одну выборку серверного курсора
+    EXPORT_CHUNK_SIZE: int = int(os.getenv("EXPORT_CHUNK_SIZE", 1000))
+    
+    # Месячные секции rides: сколько месяцев вперёд держать созданными и как часто проверять
+    RIDES_PARTITIONS_AHEAD: int = int(os.getenv("RIDES_PARTITIONS_AHEAD", 3))
+    RIDES_PARTITION_CHECK_INTERVAL: float = float(os.getenv("RIDES_PARTITION_CHECK_INTERVAL", 86400))
+    
+    # Массовая загрузка /api/v1/rides/import: строк на одну транзакцию COPY + слияние
+    IMPORT_CHUNK_SIZE: int = int(os.getenv("IMPORT_CHUNK_SIZE", 5000))
+    IMPORT_MAX_ERRORS: int = int(os.getenv("IMPORT_MAX_ERRORS", 1000))
+    
+    # Кэш первой страницы истории поездок пользователя/водителя
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    RIDE_HISTORY_CACHE_TTL: int = int(os.getenv("RIDE_HISTORY_CACHE_TTL", 60))
+    RIDE_HISTORY_CACHED_ROWS: int = int(os.getenv("RIDE_HISTORY_CACHED_ROWS", 50))
+
+    # Idempotency-Key для POST /rides/: ответ хранится IDEMPOTENCY_TTL секунд, повтор
+    # ждёт первый запрос до IDEMPOTENCY_WAIT_TIMEOUT, блокировка живёт IDEMPOTENCY_LOCK_TTL
+    IDEMPOTENCY_TTL: int = int(os.getenv("IDEMPOTENCY_TTL", 86400))
+    IDEMPOTENCY_LOCK_TTL: int = int(os.getenv("IDEMPOTENCY_LOCK_TTL", 30))
+    IDEMPOTENCY_WAIT_TIMEOUT: float = float(os.getenv("IDEMPOTENCY_WAIT_TIMEOUT", 10))
+    
     KAFKA_BOOTSTRAP_SERVERS: str = os.getenv("KAFKA_BOOTSTRAP_SERVERS", "kafka:29092")
+    # Продюсер копит сообщения до KAFKA_LINGER_MS и сжимает пачку; при переполнении
+    # буфера (Kafka не успевает или недоступна) новые поездки получают 503
+    KAFKA_LINGER_MS: int = int(os.getenv("KAFKA_LINGER_MS", 20))
+    KAFKA_BATCH_SIZE: int = int(os.getenv("KAFKA_BATCH_SIZE", 65536))
+    KAFKA_COMPRESSION_TYPE: str = os.getenv("KAFKA_COMPRESSION_TYPE", "gzip")
+    KAFKA_BUFFER_MAX_MESSAGES: int = int(os.getenv("KAFKA_BUFFER_MAX_MESSAGES", 10000))
+    KAFKA_SHUTDOWN_TIMEOUT: float = float(os.getenv("KAFKA_SHUTDOWN_TIMEOUT", 10))
+    
+    # События поездок пишутся в ride_outbox в той же транзакции, relay переносит их в Kafka
+    OUTBOX_POLL_INTERVAL: float = float(os.getenv("OUTBOX_POLL_INTERVAL", 0.5))
+    OUTBOX_BATCH_SIZE: int = int(os.getenv("OUTBOX_BATCH_SIZE", 500))
+    OUTBOX_DELIVERY_TIMEOUT: float = float(os.getenv("OUTBOX_DELIVERY_TIMEOUT", 10))
     
     RIDE_SERVICE_PORT: int = int(os.getenv("RIDE_SERVICE_PORT", 8003))
     
@@ -0,0 +1,207 @@
+# Общий модуль ride-service и payment-service: код обеих копий должен совпадать
+# (комментарии - на языке сервиса).
+"""
+Поддержка Idempotency-Key для POST-эндпоинтов, которые клиенты повторяют по таймауту.
+
+Первый запрос с ключом берёт блокировку в Redis (SET NX с lock_ttl) и
+выполняется как обычно. Его ответ (статус + JSON-тело) заменяет блокировку и
+хранится ttl секунд. Дубликаты, пришедшие в это время, опрашивают ключ, пока не
+появится результат, и возвращают его повторно. Ключ привязан к хэшу тела
+запроса, поэтому повтор ключа с другим телом отклоняется с 422.
+
+Если обработчик упал (исключение или результат не записан), блокировка
+снимается, и следующий повтор выполняется заново. Если Redis недоступен,
+запросы выполняются без дедупликации, как раньше.
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+import redis.asyncio as aioredis
+from fastapi import Header, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.encoders import jsonable_encoder
+from fastapi.responses import JSONResponse
+
+logger = logging.getLogger(__name__)
+
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+REPLAYED_HEADER = "Idempotent-Replayed"
+MAX_KEY_LENGTH = 255
+
+# KEYS[1] - ключ идемпотентности; ARGV: значение нашей блокировки, новое значение ("" = удалить), ttl.
+# Истёкшую блокировку, которую уже взял другой запрос, не трогаем
+FINISH_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[1] then
+    return 0
+end
+if ARGV[2] == '' then
+    redis.call('DEL', KEYS[1])
+else
+    redis.call('SET', KEYS[1], ARGV[2], 'EX', ARGV[3])
+end
+return 1
+"""
+
+
+class IdempotencyReplay(Exception):
+    """Бросается из зависимости, чтобы сразу ответить дубликату сохранённым ответом"""
+
+    def __init__(self, status_code: int, body: Any):
+        self.status_code = status_code
+        self.body = body
+
+
+def replay_response(exc: IdempotencyReplay) -> JSONResponse:
+    return JSONResponse(status_code=exc.status_code, content=exc.body, headers={REPLAYED_HEADER: "true"})
+
+
+class IdempotencyStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.counters: Dict[str, int] = {
+            "started": 0,
+            "replayed": 0,
+            "waited": 0,
+            "in_progress_conflicts": 0,
+            "mismatches": 0,
+            "redis_errors": 0,
+        }
+
+    def incr(self, name: str):
+        with self._lock:
+            self.counters[name] += 1
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            return dict(self.counters)
+
+
+class IdempotentRequest:
+    """Запрос, владеющий ключом; обработчик записывает сюда свой результат"""
+
+    def __init__(self, key: str, lock: str, fingerprint: str):
+        self.key = key
+        self.lock = lock
+        self.fingerprint = fingerprint
+        self.result: Optional[dict] = None
+
+    def complete(self, body: Any, status_code: int = 200):
+        self.result = {
+            "state": "done",
+            "fingerprint": self.fingerprint,
+            "status_code": status_code,
+            "body": jsonable_encoder(body),
+        }
+
+
+class IdempotencyStore:
+    def __init__(self, scope: str, get_client: Callable[[], Any], ttl: int, lock_ttl: int, wait_timeout: float):
+        # scope разделяет эндпоинты: один и тот же ключ клиент может прислать в оба
+        self.scope = scope
+        self.get_client = get_client
+        self.ttl = ttl
+        self.lock_ttl = lock_ttl
+        self.wait_timeout = wait_timeout
+        self.stats = IdempotencyStats()
+
+    async def _redis(self, method: str, *args, **kwargs):
+        client = self.get_client()
+        if isinstance(client, aioredis.Redis):
+            return await getattr(client, method)(*args, **kwargs)
+        return await run_in_threadpool(getattr(client, method), *args, **kwargs)
+
+    def key(self, idempotency_key: str) -> str:
+        return f"idempotency:{self.scope}:{idempotency_key}"
+
+    async def begin(self, idempotency_key: str, fingerprint: str) -> Optional[IdempotentRequest]:
+        """Взять ключ или бросить IdempotencyReplay / HTTPException для дубликата.
+
+        Возвращает None, если Redis недоступен (запрос выполняется без дедупликации).
+        """
+        key = self.key(idempotency_key)
+        lock = json.dumps({"state": "in_progress", "token": uuid.uuid4().hex, "fingerprint": fingerprint})
+        deadline = time.monotonic() + self.wait_timeout
+        delay = 0.05
+        waited = False
+        while True:
+            try:
+                if await self._redis("set", key, lock, nx=True, ex=self.lock_ttl):
+                    self.stats.incr("started")
+                    return IdempotentRequest(key, lock, fingerprint)
+                raw = await self._redis("get", key)
+            except Exception as e:
+                self.stats.incr("redis_errors")
+                logger.warning(f"Idempotency check failed for {key}: {e}")
+                return None
+            if raw is None:
+                # Первый запрос упал и освободил ключ - пробуем взять его сами
+                continue
+
+            entry = json.loads(raw)
+            if entry["fingerprint"] != fingerprint:
+                self.stats.incr("mismatches")
+                raise HTTPException(
+                    status_code=422,
+                    detail=f"{IDEMPOTENCY_HEADER} was already used with a different request body",
+                )
+            if entry["state"] == "done":
+                self.stats.incr("replayed")
+                raise IdempotencyReplay(entry["status_code"], entry["body"])
+            if time.monotonic() >= deadline:
+                self.stats.incr("in_progress_conflicts")
+                raise HTTPException(
+                    status_code=409,
+                    detail=f"A request with this {IDEMPOTENCY_HEADER} is still in progress",
+                )
+            if not waited:
+                waited = True
+                self.stats.incr("waited")
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.5)
+
+    async def finish(self, request: IdempotentRequest):
+        """Сохранить записанный результат для повторов или освободить ключ, если результата нет"""
+        value = json.dumps(request.result) if request.result is not None else ""
+        try:
+            await self._redis("eval", FINISH_SCRIPT, 1, request.key, request.lock, value, self.ttl)
+        except Exception as e:
+            # Блокировка сама истечёт через lock_ttl
+            self.stats.incr("redis_errors")
+            logger.warning(f"Idempotency result write failed for {request.key}: {e}")
+
+    def dependency(self):
+        """FastAPI-зависимость, отдающая IdempotentRequest (или None без заголовка).
+
+        Объявляйте её раньше зависимостей, берущих ресурсы (например, соединение с БД),
+        чтобы дубликаты ждали и получали повтор, не удерживая их.
+        """
+
+        async def idempotent_request(
+            request: Request,
+            idempotency_key: Optional[str] = Header(None, alias=IDEMPOTENCY_HEADER),
+        ):
+            if not idempotency_key:
+                yield None
+                return
+            if len(idempotency_key) > MAX_KEY_LENGTH:
+                raise HTTPException(
+                    status_code=400,
+                    detail=f"{IDEMPOTENCY_HEADER} must be at most {MAX_KEY_LENGTH} characters",
+                )
+            fingerprint = hashlib.sha256(await request.body()).hexdigest()
+            handle = await self.begin(idempotency_key, fingerprint)
+            if handle is None:
+                yield None
+                return
+            try:
+                yield handle
+            finally:
+                await self.finish(handle)
+
+        return idempotent_request
@@ -1,20 +1,89 @@
 # services/ride-service/main.py
-from fastapi import FastAPI
-from routers import rides
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
+from routers import history, rides
+from cache import ride_history_cache
 from config import settings
+from db import PoolExhaustedError, open_pools, close_pools, pools_health, read_your_writes
+from fastapi.concurrency import run_in_threadpool
+from idempotency import IdempotencyReplay, replay_response
+from producer.kafka_producer import ProducerBufferFullError, get_producer, start_producer, stop_producer
+from services.outbox_relay import outbox_relay
+from services.partition_maintainer import partition_maintainer
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пулы соединений открываются один раз на процесс
+    await open_pools()
+    partition_maintainer.start()
+    # Продюсер подключается к Kafka в фоне: сервис стартует и без брокеров
+    start_producer(
+        settings.KAFKA_BOOTSTRAP_SERVERS,
+        linger_ms=settings.KAFKA_LINGER_MS,
+        batch_size=settings.KAFKA_BATCH_SIZE,
+        compression_type=settings.KAFKA_COMPRESSION_TYPE,
+        max_buffered=settings.KAFKA_BUFFER_MAX_MESSAGES,
+        shutdown_timeout=settings.KAFKA_SHUTDOWN_TIMEOUT,
+    )
+    outbox_relay.start()
+    yield
+    await outbox_relay.stop()
+    await partition_maintainer.stop()
+    # Дописываем накопленные события до закрытия
+    await run_in_threadpool(stop_producer)
+    await close_pools()
 
 app = FastAPI(
     title="Ride Service",
     description="Микросервис управления поездками",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Read-your-writes: после записи клиент какое-то время читает с primary, а не с реплики
+app.middleware("http")(read_your_writes)
+
 app.include_router(rides.router)
+app.include_router(history.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "ride-service"}
 
+@app.get("/health/db")
+async def db_health_check():
+    return await pools_health()
+
+@app.get("/health/cache")
+async def cache_health_check():
+    return {"enabled": settings.CACHE_ENABLED, "ride_history": ride_history_cache.stats.snapshot()}
+
+@app.get("/health/idempotency")
+async def idempotency_health_check():
+    return rides.ride_idempotency.stats.snapshot()
+
+@app.get("/health/kafka")
+async def kafka_health_check():
+    return get_producer().stats()
+
+@app.get("/health/outbox")
+async def outbox_health_check():
+    return await outbox_relay.stats()
+
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_handler(request: Request, exc: PoolExhaustedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
+@app.exception_handler(IdempotencyReplay)
+async def idempotency_replay_handler(request: Request, exc: IdempotencyReplay):
+    return replay_response(exc)
+
+@app.exception_handler(ProducerBufferFullError)
+async def producer_buffer_full_handler(request: Request, exc: ProducerBufferFullError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 @app.get("/")
 async def root():
     return {"message": "Ride Service - Uber Clone", "version": "1.0.0"}
@@ -1,7 +1,12 @@
 # services/ride-service/models/ride.py
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional
+from uuid import UUID
+from typing import List, Optional
+
+# Пределы типов колонок rides: INTEGER и DECIMAL(10,2)
+INT_MAX = 2**31 - 1
+DECIMAL_10_2_MAX = 99999999.99
 
 class RideBase(BaseModel):
     user_id: str
@@ -32,7 +37,8 @@ class RideBase(BaseModel):
     season: Optional[str] = None
 
 class RideCreate(RideBase):
-    pass
+    # Расчёт из POST /api/v1/pricing/quote: total_fare берётся из него, переданный игнорируется
+    quote_id: Optional[str] = Field(None, max_length=64)
 
 class RideUpdate(RideBase):
     pass
@@ -43,3 +49,82 @@ class Ride(RideBase):
     
     class Config:
         from_attributes = True
+
+class RideSummary(BaseModel):
+    """Строка истории поездок (/users/{id}/rides, /drivers/{id}/rides) - без аналитических полей"""
+    id: str
+    user_id: str
+    driver_id: Optional[str] = None
+    pickup_datetime: datetime
+    dropoff_datetime: Optional[datetime] = None
+    pickup_district: Optional[str] = None
+    dropoff_district: Optional[str] = None
+    distance_km: Optional[float] = None
+    total_fare: Optional[float] = None
+    status: str
+
+class RideAssign(BaseModel):
+    driver_id: UUID
+
+class RideComplete(BaseModel):
+    """Что не передано - остаётся как было; dropoff_datetime по умолчанию - сейчас"""
+    dropoff_datetime: Optional[datetime] = None
+    dropoff_latitude: Optional[float] = None
+    dropoff_longitude: Optional[float] = None
+    distance_km: Optional[float] = None
+    total_fare: Optional[float] = None
+
+class RideImport(RideBase):
+    """Строка массовой загрузки (/api/v1/rides/import). Ограничения - как в rides
+    (типы, длины и CHECK), чтобы плохая строка попала в отчёт, а не уронила COPY всей пачки"""
+    # Без id поездке выдаётся новый UUID (повторная загрузка тогда создаст дубль)
+    id: Optional[str] = Field(None, max_length=50)
+    dropoff_datetime: datetime
+    passenger_count: int = Field(ge=1, le=9)
+    # DECIMAL(10,8) / DECIMAL(11,8)
+    pickup_latitude: float = Field(ge=-90, le=90)
+    pickup_longitude: float = Field(ge=-180, le=180)
+    dropoff_latitude: float = Field(ge=-90, le=90)
+    dropoff_longitude: float = Field(ge=-180, le=180)
+    pickup_district: Optional[str] = Field(None, max_length=100)
+    pickup_neighbourhood: Optional[str] = Field(None, max_length=100)
+    dropoff_district: Optional[str] = Field(None, max_length=100)
+    dropoff_neighbourhood: Optional[str] = Field(None, max_length=100)
+    trip_duration: int = Field(ge=0, le=INT_MAX)
+    # DECIMAL(10,2)
+    distance_km: Optional[float] = Field(None, ge=0, le=DECIMAL_10_2_MAX)
+    total_fare: Optional[float] = Field(None, ge=0, le=DECIMAL_10_2_MAX)
+    status: str = Field("pending", max_length=20)
+    pickup_hour: Optional[int] = Field(None, ge=0, le=23)
+    day_period: Optional[str] = Field(None, max_length=20)
+    day_name: Optional[str] = Field(None, max_length=20)
+    weekday_or_weekend: Optional[str] = Field(None, max_length=10)
+    regular_day_or_holiday: Optional[str] = Field(None, max_length=10)
+    month: Optional[int] = Field(None, ge=1, le=12)
+    year: Optional[int] = Field(None, ge=0, le=INT_MAX)
+    season: Optional[str] = Field(None, max_length=20)
+
+    @field_validator("user_id", "driver_id")
+    @classmethod
+    def canonical_uuid(cls, value: Optional[str], info) -> Optional[str]:
+        # Колонки UUID: COPY отклонил бы всю пачку из-за одного кривого id
+        if value is None:
+            return value
+        try:
+            return str(UUID(value))
+        except ValueError:
+            raise ValueError(f"{info.field_name} must be a UUID")
+
+class RideImportError(BaseModel):
+    line: int
+    id: Optional[str] = None
+    error: str
+
+class RideImportResult(BaseModel):
+    received: int = 0
+    inserted: int = 0
+    duplicates: int = 0
+    failed: int = 0
+    errors: List[RideImportError] = []
+    # В errors не больше IMPORT_MAX_ERRORS записей, остальные только посчитаны
+    errors_truncated: bool = False
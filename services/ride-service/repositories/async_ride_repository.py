@@ -0,0 +1,208 @@
+# services/ride-service/repositories/async_ride_repository.py
+import uuid
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from models.ride import Ride, RideCreate, RideImport, RideSummary, RideUpdate
+from serialization import from_row, from_rows
+from repositories import outbox
+from repositories.ride_repository import (
+    HISTORY_COLUMNS, HISTORY_OWNERS, IMPORT_COLUMNS, IMPORT_COPY_COLUMNS,
+    IMPORT_MERGE_SQL, IMPORT_REJECTS_SQL, IMPORT_STAGING_SQL,
+    RIDE_TRANSITIONS, TRANSITION_COLUMNS, pickup_window, transition_sql,
+)
+
+
+def _naive(value: Optional[datetime]) -> Optional[datetime]:
+    # Колонки rides - TIMESTAMP без зоны, а asyncpg принимает только naive datetime.
+    # psycopg2 передаёт timestamptz, и PostgreSQL (TimeZone=UTC) приводит его к UTC - делаем так же
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+class AsyncRideRepository:
+    """Те же запросы, что в RideRepository, но через asyncpg (DB_BACKEND=async)"""
+
+    def __init__(self, connection):
+        self.conn = connection
+
+    async def get_ride(self, ride_id: str, pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        """pickup_hint - примерное pickup_datetime: поиск только в его секциях"""
+        window = pickup_window(_naive(pickup_hint))
+        if window is not None:
+            row = await self.conn.fetchrow(
+                "SELECT * FROM rides WHERE id = $1 AND pickup_datetime >= $2 AND pickup_datetime < $3",
+                ride_id, window[0], window[1]
+            )
+        else:
+            row = await self.conn.fetchrow("SELECT * FROM rides WHERE id = $1", ride_id)
+        return from_row(Ride, row)
+
+    async def get_rides(self, skip: int = 0, limit: int = 100,
+                        after: Optional[Tuple[datetime, str]] = None) -> List[Ride]:
+        if after is not None:
+            rows = await self.conn.fetch("""
+                SELECT * FROM rides
+                WHERE (pickup_datetime, id) < ($1::timestamp, $2::varchar) AND pickup_datetime <= $1
+                ORDER BY pickup_datetime DESC, id DESC
+                LIMIT $3
+            """, _naive(after[0]), after[1], limit)
+        else:
+            rows = await self.conn.fetch(
+                "SELECT * FROM rides ORDER BY pickup_datetime DESC, id DESC LIMIT $1 OFFSET $2",
+                limit, skip
+            )
+        return from_rows(Ride, rows)
+
+    async def get_history(self, owner: str, owner_id: str, limit: int,
+                          after: Optional[Tuple[datetime, str]] = None) -> List[RideSummary]:
+        """Поездки пользователя или водителя (owner - "user"/"driver"), новые сначала"""
+        column = HISTORY_OWNERS[owner]
+        if after is not None:
+            rows = await self.conn.fetch(f"""
+                SELECT {HISTORY_COLUMNS} FROM rides
+                WHERE {column} = $1::uuid AND (pickup_datetime, id) < ($2::timestamp, $3::varchar)
+                  AND pickup_datetime <= $2
+                ORDER BY pickup_datetime DESC, id DESC
+                LIMIT $4
+            """, owner_id, _naive(after[0]), after[1], limit)
+        else:
+            rows = await self.conn.fetch(f"""
+                SELECT {HISTORY_COLUMNS} FROM rides
+                WHERE {column} = $1::uuid
+                ORDER BY pickup_datetime DESC, id DESC
+                LIMIT $2
+            """, owner_id, limit)
+        return from_rows(RideSummary, rows)
+
+    async def iter_rides(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                         chunk_size: int = 1000):
+        """Отдавать строки поездок через серверный курсор - в памяти не больше chunk_size строк"""
+        # Условия только для заданных границ - иначе секции не отсекаются
+        conditions, params = [], []
+        if since is not None:
+            params.append(_naive(since))
+            conditions.append(f"pickup_datetime >= ${len(params)}")
+        if until is not None:
+            params.append(_naive(until))
+            conditions.append(f"pickup_datetime < ${len(params)}")
+        where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+        # Курсоры asyncpg живут только внутри транзакции
+        async with self.conn.transaction():
+            cursor = self.conn.cursor(
+                f"SELECT * FROM rides {where} ORDER BY pickup_datetime, id", *params, prefetch=chunk_size
+            )
+            async for row in cursor:
+                yield row
+
+    async def create_ride(self, ride: RideCreate) -> Ride:
+        ride_id = str(uuid.uuid4())
+        async with self.conn.transaction():
+            row = await self.conn.fetchrow(
+                """
+                INSERT INTO rides (
+                    id, user_id, driver_id, vendor_id,
+                    pickup_datetime, dropoff_datetime, passenger_count,
+                    pickup_latitude, pickup_longitude,
+                    dropoff_latitude, dropoff_longitude,
+                    pickup_district, pickup_neighbourhood,
+                    dropoff_district, dropoff_neighbourhood,
+                    trip_duration, distance_km, total_fare, status,
+                    pickup_hour, day_period, day_name,
+                    weekday_or_weekend, regular_day_or_holiday,
+                    month, year, season, created_at
+                )
+                VALUES ($1, $2, $3, $4, $5, $6, $7, $8, $9, $10, $11, $12, $13, $14,
+                        $15, $16, $17, $18, $19, $20, $21, $22, $23, $24, $25, $26, $27, NOW())
+                RETURNING *
+                """,
+                ride_id, ride.user_id, ride.driver_id, ride.vendor_id,
+                _naive(ride.pickup_datetime), _naive(ride.dropoff_datetime), ride.passenger_count,
+                ride.pickup_latitude, ride.pickup_longitude,
+                ride.dropoff_latitude, ride.dropoff_longitude,
+                ride.pickup_district, ride.pickup_neighbourhood,
+                ride.dropoff_district, ride.dropoff_neighbourhood,
+                ride.trip_duration, ride.distance_km, ride.total_fare, ride.status,
+                ride.pickup_hour, ride.day_period, ride.day_name,
+                ride.weekday_or_weekend, ride.regular_day_or_holiday,
+                ride.month, ride.year, ride.season
+            )
+            created = from_row(Ride, row)
+            # Событие - в той же транзакции, что и поездка
+            await self.conn.execute(
+                outbox.INSERT_SQL_ASYNC,
+                outbox.RIDE_CREATED_TOPIC, created.id, outbox.event_payload(created)
+            )
+        return created
+
+    async def transition(self, ride_id: str, action: str, changes: dict,
+                         pickup_hint: Optional[datetime] = None) -> Tuple[Optional[Ride], Optional[str]]:
+        """Перевести поездку по действию из RIDE_TRANSITIONS, меняя только колонки из changes.
+        Возвращает (поездка после перехода или None, статус до перехода или None - поездки нет)"""
+        from_statuses, status = RIDE_TRANSITIONS[action]
+        columns = sorted(column for column in changes if column in TRANSITION_COLUMNS)
+        values = {
+            "ride_id": ride_id, "status": status, "from_statuses": list(from_statuses),
+            "topic": outbox.STATUS_TOPICS[status],
+            **{column: _naive(changes[column]) if isinstance(changes[column], datetime) else changes[column]
+               for column in columns},
+        }
+        window = pickup_window(_naive(pickup_hint))
+        if window is not None:
+            values["window_from"], values["window_to"] = window
+        order = []
+
+        def placeholder(name):
+            if name not in order:
+                order.append(name)
+            return f"${order.index(name) + 1}"
+
+        sql = transition_sql(columns, placeholder, window is not None)
+        row = await self.conn.fetchrow(sql, *[values[name] for name in order])
+        if row is None:
+            return None, None
+        if row["id"] is None:
+            return None, row["current_status"]
+        return from_row(Ride, row), row["current_status"]
+
+    async def import_rides(self, rows: List[Tuple[int, RideImport]]) -> Tuple[List[tuple], List[tuple]]:
+        """Влить пачку (номер строки, поездка) одной транзакцией.
+        Возвращает (вставленные (id, user_id, driver_id), отклонённые (line_no, id, причина))"""
+        records = []
+        for line_no, ride in rows:
+            record = [line_no]
+            for column in IMPORT_COLUMNS:
+                value = getattr(ride, column)
+                record.append(_naive(value) if isinstance(value, datetime) else value)
+            records.append(record)
+        async with self.conn.transaction():
+            await self.conn.execute(IMPORT_STAGING_SQL)
+            await self.conn.copy_records_to_table("rides_import", records=records, columns=IMPORT_COPY_COLUMNS)
+            rejected = [tuple(row) for row in await self.conn.fetch(IMPORT_REJECTS_SQL)]
+            inserted = [tuple(row) for row in await self.conn.fetch(IMPORT_MERGE_SQL)]
+        return inserted, rejected
+
+    async def update_ride(self, ride_id: str, ride: RideUpdate) -> Optional[Ride]:
+        async with self.conn.transaction():
+            # prev блокирует строку и отдаёт статус до обновления - по нему решаем, нужно ли событие
+            row = await self.conn.fetchrow(
+                """
+                UPDATE rides AS r SET
+                    driver_id = $1, status = $2, dropoff_datetime = $3,
+                    dropoff_latitude = $4, dropoff_longitude = $5,
+                    distance_km = $6, total_fare = $7
+                FROM (SELECT id, pickup_datetime, status FROM rides WHERE id = $8 FOR UPDATE) AS prev
+                WHERE r.id = prev.id AND r.pickup_datetime = prev.pickup_datetime
+                RETURNING r.*, prev.status AS previous_status
+                """,
+                ride.driver_id, ride.status, _naive(ride.dropoff_datetime),
+                ride.dropoff_latitude, ride.dropoff_longitude,
+                ride.distance_km, ride.total_fare, ride_id
+            )
+            if not row:
+                return None
+            updated = from_row(Ride, row)
+            topic = outbox.status_topic(row["previous_status"], updated.status)
+            if topic:
+                await self.conn.execute(outbox.INSERT_SQL_ASYNC, topic, updated.id, outbox.event_payload(updated))
+        return updated
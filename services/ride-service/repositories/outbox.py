@@ -0,0 +1,33 @@
+# services/ride-service/repositories/outbox.py
+"""
+Transactional outbox: событие пишется в ride_outbox в той же транзакции, что и
+сама поездка, а в Kafka его отправляет services/outbox_relay.py. Так событие не
+теряется, если Kafka недоступна в момент коммита.
+"""
+import json
+from typing import Optional
+
+from models.ride import Ride
+
+RIDE_CREATED_TOPIC = "rides.created"
+
+# Смена статуса на один из этих порождает событие в соответствующий топик
+STATUS_TOPICS = {
+    "assigned": "rides.assigned",
+    "in_progress": "rides.started",
+    "completed": "rides.completed",
+    "cancelled": "rides.cancelled",
+}
+
+INSERT_SQL_SYNC = "INSERT INTO ride_outbox (topic, ride_id, payload) VALUES (%s, %s, %s::jsonb)"
+INSERT_SQL_ASYNC = "INSERT INTO ride_outbox (topic, ride_id, payload) VALUES ($1, $2, $3::jsonb)"
+
+
+def status_topic(previous_status: Optional[str], status: str) -> Optional[str]:
+    if previous_status == status:
+        return None
+    return STATUS_TOPICS.get(status)
+
+
+def event_payload(ride: Ride) -> str:
+    return json.dumps(ride.model_dump(mode="json"))
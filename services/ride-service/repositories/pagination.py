@@ -0,0 +1,30 @@
+# services/ride-service/repositories/pagination.py
+"""
+Непрозрачный курсор для keyset-пагинации.
+
+Курсор - base64 от (pickup_datetime, id) последней строки страницы. Следующая страница
+начинается строго после неё (WHERE (pickup_datetime, id) < курсор), поэтому PostgreSQL идёт
+по индексу и не читает и не отбрасывает строки предыдущих страниц, как при OFFSET.
+"""
+import base64
+import json
+from datetime import datetime
+from typing import Tuple
+
+
+class InvalidCursorError(ValueError):
+    pass
+
+
+def encode_cursor(sort_value: datetime, row_id: str) -> str:
+    raw = json.dumps([sort_value.isoformat(), str(row_id)]).encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        sort_value, row_id = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(sort_value), str(row_id)
+    except Exception:
+        raise InvalidCursorError("Invalid pagination cursor")
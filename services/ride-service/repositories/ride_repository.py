@@ -1,25 +1,223 @@
 # services/ride-service/repositories/ride_repository.py
+import csv
+import io
 import uuid
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import List, Optional
-from models.ride import Ride, RideCreate, RideUpdate
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+from models.ride import Ride, RideCreate, RideImport, RideSummary, RideUpdate
+from serialization import from_row, from_rows
+from repositories import outbox
+
+# Колонки RideSummary - все есть в idx_rides_user_history/idx_rides_driver_history (ключ + INCLUDE),
+# поэтому история читается index-only scan без похода в таблицу
+HISTORY_COLUMNS = """
+    id, user_id, driver_id, pickup_datetime, dropoff_datetime,
+    pickup_district, dropoff_district, distance_km, total_fare, status
+"""
+# Имя колонки подставляется в SQL - только из этого списка
+HISTORY_OWNERS = {"user": "user_id", "driver": "driver_id"}
+
+# --- секционирование: rides разбита по месяцам pickup_datetime ---
+
+# Если вызывающий знает pickup_datetime поездки (hint), ищем только в окне вокруг него -
+# PostgreSQL читает одну-две месячные секции вместо всех. Окно прощает сдвиг часового пояса
+PICKUP_HINT_WINDOW = timedelta(days=1)
+
+
+def pickup_window(hint: Optional[datetime]) -> Optional[Tuple[datetime, datetime]]:
+    if hint is None:
+        return None
+    return hint - PICKUP_HINT_WINDOW, hint + PICKUP_HINT_WINDOW
+
+
+# --- переходы статусов: compare-and-set одним запросом ---
+
+# действие -> (из каких статусов можно, в какой статус)
+RIDE_TRANSITIONS = {
+    "assign": (("pending", "searching"), "assigned"),
+    "start": (("assigned", "arriving"), "in_progress"),
+    "complete": (("in_progress",), "completed"),
+    "cancel": (("pending", "searching", "assigned", "arriving"), "cancelled"),
+}
+
+# Колонки, которые может менять переход (подставляются в SQL - только из этого списка)
+TRANSITION_COLUMNS = {
+    "driver_id", "dropoff_datetime", "dropoff_latitude", "dropoff_longitude", "distance_km", "total_fare",
+}
+
+# UPDATE срабатывает, только если статус всё ещё допустимый (повторная проверка на свежей версии
+# строки при конкурентном UPDATE), событие пишется в outbox тем же запросом. prev_ride нужен, чтобы
+# без второго чтения отличить "нет поездки" (0 строк) от "недопустимый переход" (updated пуст)
+_TRANSITION_SQL = """
+    WITH prev_ride AS (
+        SELECT status FROM rides WHERE id = {ride_id}{window}
+    ), updated AS (
+        UPDATE rides SET status = {status}{sets}
+        WHERE id = {ride_id}{window} AND status = ANY({from_statuses}::varchar[])
+        RETURNING *
+    ), events AS (
+        INSERT INTO ride_outbox (topic, ride_id, payload)
+        SELECT {topic}, u.id, to_jsonb(u) FROM updated u
+    )
+    SELECT p.status AS current_status, u.* FROM prev_ride p LEFT JOIN updated u ON true
+"""
+
+
+def transition_sql(columns: List[str], placeholder, with_window: bool = False) -> str:
+    """placeholder(имя) -> маркер параметра драйвера (%(имя)s или $n);
+    with_window - ограничить поиск окном pickup_window (параметры window_from/window_to)"""
+    sets = "".join(
+        f", {column} = COALESCE({placeholder(column)}, {column})"
+        for column in columns if column in TRANSITION_COLUMNS
+    )
+    window = ""
+    if with_window:
+        window = (f" AND pickup_datetime >= {placeholder('window_from')}"
+                  f" AND pickup_datetime < {placeholder('window_to')}")
+    return _TRANSITION_SQL.format(
+        ride_id=placeholder("ride_id"), status=placeholder("status"), window=window,
+        from_statuses=placeholder("from_statuses"), topic=placeholder("topic"), sets=sets,
+    )
+
+
+# --- массовая загрузка: COPY во временную таблицу и слияние одним INSERT ... SELECT ---
+
+IMPORT_COLUMNS = [
+    "id", "user_id", "driver_id", "vendor_id",
+    "pickup_datetime", "dropoff_datetime", "passenger_count",
+    "pickup_latitude", "pickup_longitude",
+    "dropoff_latitude", "dropoff_longitude",
+    "pickup_district", "pickup_neighbourhood",
+    "dropoff_district", "dropoff_neighbourhood",
+    "trip_duration", "distance_km", "total_fare", "status",
+    "pickup_hour", "day_period", "day_name",
+    "weekday_or_weekend", "regular_day_or_holiday",
+    "month", "year", "season",
+]
+# line_no - номер строки во входном файле, для отчёта об ошибках
+IMPORT_COPY_COLUMNS = ["line_no"] + IMPORT_COLUMNS
+
+IMPORT_STAGING_SQL = """
+    CREATE TEMP TABLE rides_import (LIKE rides INCLUDING DEFAULTS, line_no INTEGER)
+    ON COMMIT DROP
+"""
+
+# NULL - строку можно вливать; иначе причина отказа (внешние ключи проверяем сами,
+# чтобы одна строка с неизвестным водителем не откатывала всю пачку)
+_IMPORT_FK_ERROR = """
+    CASE
+        WHEN NOT EXISTS (SELECT 1 FROM vendors v WHERE v.id = s.vendor_id) THEN 'unknown vendor_id'
+        WHEN s.user_id IS NOT NULL
+             AND NOT EXISTS (SELECT 1 FROM users u WHERE u.id = s.user_id) THEN 'unknown user_id'
+        WHEN s.driver_id IS NOT NULL
+             AND NOT EXISTS (SELECT 1 FROM drivers d WHERE d.id = s.driver_id) THEN 'unknown driver_id'
+    END
+"""
+
+IMPORT_REJECTS_SQL = f"""
+    SELECT line_no, id, {_IMPORT_FK_ERROR} AS error
+    FROM rides_import s
+    WHERE {_IMPORT_FK_ERROR} IS NOT NULL
+"""
+
+# Первичный ключ - (id, pickup_datetime), но id поездки уникален: строка с id, который уже
+# есть в rides (с любым pickup_datetime), пропускается, а из повторов id внутри пачки
+# вливается первая годная строка. rides.created для всей пачки - одним INSERT в outbox
+IMPORT_MERGE_SQL = f"""
+    WITH inserted AS (
+        INSERT INTO rides ({", ".join(IMPORT_COLUMNS)}, created_at)
+        SELECT DISTINCT ON (s.id) {", ".join("s." + column for column in IMPORT_COLUMNS)}, s.created_at
+        FROM rides_import s
+        WHERE {_IMPORT_FK_ERROR} IS NULL
+          AND NOT EXISTS (SELECT 1 FROM rides r WHERE r.id = s.id)
+        ORDER BY s.id, s.line_no
+        ON CONFLICT (id, pickup_datetime) DO NOTHING
+        RETURNING *
+    ), events AS (
+        INSERT INTO ride_outbox (topic, ride_id, payload)
+        SELECT '{outbox.RIDE_CREATED_TOPIC}', i.id, to_jsonb(i) FROM inserted i
+    )
+    SELECT id, user_id::text AS user_id, driver_id::text AS driver_id FROM inserted
+"""
 
 class RideRepository:
     def __init__(self, connection):
         self.conn = connection
     
-    def get_ride(self, ride_id: str) -> Optional[Ride]:
+    def get_ride(self, ride_id: str, pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        """pickup_hint - примерное pickup_datetime: поиск только в его секциях"""
+        window = pickup_window(pickup_hint)
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM rides WHERE id = %s", (ride_id,))
+            if window is not None:
+                cur.execute(
+                    "SELECT * FROM rides WHERE id = %s AND pickup_datetime >= %s AND pickup_datetime < %s",
+                    (ride_id, window[0], window[1])
+                )
+            else:
+                cur.execute("SELECT * FROM rides WHERE id = %s", (ride_id,))
             row = cur.fetchone()
-            return Ride(**row) if row else None
+            return from_row(Ride, row)
     
-    def get_rides(self, skip: int = 0, limit: int = 100) -> List[Ride]:
+    def get_rides(self, skip: int = 0, limit: int = 100,
+                  after: Optional[Tuple[datetime, str]] = None) -> List[Ride]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute("SELECT * FROM rides ORDER BY pickup_datetime DESC LIMIT %s OFFSET %s", (limit, skip))
+            if after is not None:
+                # Keyset: продолжаем после последней строки прошлой страницы, без OFFSET
+                # Отдельное pickup_datetime <= - по сравнению кортежей секции не отсекаются
+                cur.execute("""
+                    SELECT * FROM rides
+                    WHERE (pickup_datetime, id) < (%s, %s) AND pickup_datetime <= %s
+                    ORDER BY pickup_datetime DESC, id DESC
+                    LIMIT %s
+                """, (after[0], after[1], after[0], limit))
+            else:
+                cur.execute(
+                    "SELECT * FROM rides ORDER BY pickup_datetime DESC, id DESC LIMIT %s OFFSET %s",
+                    (limit, skip)
+                )
             rows = cur.fetchall()
-            return [Ride(**row) for row in rows]
+            return from_rows(Ride, rows)
+    
+    def get_history(self, owner: str, owner_id: str, limit: int,
+                    after: Optional[Tuple[datetime, str]] = None) -> List[RideSummary]:
+        """Поездки пользователя или водителя (owner - "user"/"driver"), новые сначала"""
+        column = HISTORY_OWNERS[owner]
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            if after is not None:
+                cur.execute(f"""
+                    SELECT {HISTORY_COLUMNS} FROM rides
+                    WHERE {column} = %s AND (pickup_datetime, id) < (%s, %s) AND pickup_datetime <= %s
+                    ORDER BY pickup_datetime DESC, id DESC
+                    LIMIT %s
+                """, (owner_id, after[0], after[1], after[0], limit))
+            else:
+                cur.execute(f"""
+                    SELECT {HISTORY_COLUMNS} FROM rides
+                    WHERE {column} = %s
+                    ORDER BY pickup_datetime DESC, id DESC
+                    LIMIT %s
+                """, (owner_id, limit))
+            return from_rows(RideSummary, cur.fetchall())
+    
+    def iter_rides(self, since: Optional[datetime] = None, until: Optional[datetime] = None,
+                   chunk_size: int = 1000):
+        """Отдавать строки поездок через серверный курсор - в памяти не больше chunk_size строк"""
+        with self.conn.cursor(name="export_rides", cursor_factory=RealDictCursor) as cur:
+            cur.itersize = chunk_size
+            # Условия только для заданных границ - иначе секции не отсекаются
+            conditions, params = [], []
+            if since is not None:
+                conditions.append("pickup_datetime >= %s")
+                params.append(since)
+            if until is not None:
+                conditions.append("pickup_datetime < %s")
+                params.append(until)
+            where = f"WHERE {' AND '.join(conditions)}" if conditions else ""
+            cur.execute(f"SELECT * FROM rides {where} ORDER BY pickup_datetime, id", params)
+            for row in cur:
+                yield row
     
     def create_ride(self, ride: RideCreate) -> Ride:
         ride_id = str(uuid.uuid4())
@@ -51,26 +249,80 @@ class RideRepository:
                 ride.weekday_or_weekend, ride.regular_day_or_holiday,
                 ride.month, ride.year, ride.season
             ))
+            created = from_row(Ride, cur.fetchone())
+            # Событие - в той же транзакции, что и поездка
+            cur.execute(outbox.INSERT_SQL_SYNC, (
+                outbox.RIDE_CREATED_TOPIC, created.id, outbox.event_payload(created)
+            ))
+            self.conn.commit()
+            return created
+    
+    def transition(self, ride_id: str, action: str, changes: dict,
+                   pickup_hint: Optional[datetime] = None) -> Tuple[Optional[Ride], Optional[str]]:
+        """Перевести поездку по действию из RIDE_TRANSITIONS, меняя только колонки из changes.
+        Возвращает (поездка после перехода или None, статус до перехода или None - поездки нет)"""
+        from_statuses, status = RIDE_TRANSITIONS[action]
+        columns = sorted(column for column in changes if column in TRANSITION_COLUMNS)
+        window = pickup_window(pickup_hint)
+        params = {
+            "ride_id": ride_id, "status": status, "from_statuses": list(from_statuses),
+            "topic": outbox.STATUS_TOPICS[status], **{column: changes[column] for column in columns},
+        }
+        if window is not None:
+            params["window_from"], params["window_to"] = window
+        with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            cur.execute(transition_sql(columns, lambda name: f"%({name})s", window is not None), params)
             row = cur.fetchone()
             self.conn.commit()
-            return Ride(**row)
+        if row is None:
+            return None, None
+        if row["id"] is None:
+            return None, row["current_status"]
+        return from_row(Ride, row), row["current_status"]
+    
+    def import_rides(self, rows: List[Tuple[int, RideImport]]) -> Tuple[List[tuple], List[tuple]]:
+        """Влить пачку (номер строки, поездка) одной транзакцией.
+        Возвращает (вставленные (id, user_id, driver_id), отклонённые (line_no, id, причина))"""
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        for line_no, ride in rows:
+            # None -> пустое поле без кавычек -> NULL в COPY ... (FORMAT csv)
+            writer.writerow([line_no] + [getattr(ride, column) for column in IMPORT_COLUMNS])
+        buffer.seek(0)
+        with self.conn.cursor() as cur:
+            cur.execute(IMPORT_STAGING_SQL)
+            cur.copy_expert(
+                f"COPY rides_import ({', '.join(IMPORT_COPY_COLUMNS)}) FROM STDIN WITH (FORMAT csv)", buffer
+            )
+            cur.execute(IMPORT_REJECTS_SQL)
+            rejected = cur.fetchall()
+            cur.execute(IMPORT_MERGE_SQL)
+            inserted = cur.fetchall()
+        self.conn.commit()
+        return inserted, rejected
     
     def update_ride(self, ride_id: str, ride: RideUpdate) -> Optional[Ride]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
+            # prev блокирует строку и отдаёт статус до обновления - по нему решаем, нужно ли событие
             cur.execute("""
-                UPDATE rides SET
+                UPDATE rides AS r SET
                     driver_id = %s, status = %s, dropoff_datetime = %s,
                     dropoff_latitude = %s, dropoff_longitude = %s,
                     distance_km = %s, total_fare = %s
-                WHERE id = %s
-                RETURNING *
+                FROM (SELECT id, pickup_datetime, status FROM rides WHERE id = %s FOR UPDATE) AS prev
+                WHERE r.id = prev.id AND r.pickup_datetime = prev.pickup_datetime
+                RETURNING r.*, prev.status AS previous_status
             """, (
                 ride.driver_id, ride.status, ride.dropoff_datetime,
                 ride.dropoff_latitude, ride.dropoff_longitude,
                 ride.distance_km, ride.total_fare, ride_id
             ))
             row = cur.fetchone()
-            if row:
-                self.conn.commit()
-                return Ride(**row)
-            return None
+            if not row:
+                return None
+            updated = from_row(Ride, row)
+            topic = outbox.status_topic(row["previous_status"], updated.status)
+            if topic:
+                cur.execute(outbox.INSERT_SQL_SYNC, (topic, updated.id, outbox.event_payload(updated)))
+            self.conn.commit()
+            return updated
@@ -0,0 +1,47 @@
+# services/ride-service/routers/history.py
+from uuid import UUID
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
+from models.ride import RideSummary
+from services.ride_service import RideService
+from repositories.pagination import decode_cursor, encode_cursor
+from serialization import ORJSONListResponse
+from routers.rides import get_history_service
+
+# История поездок живёт в ride-service (таблица rides), пути - от владельца
+router = APIRouter(prefix="/api/v1", tags=["ride history"])
+
+
+async def _history(owner: str, owner_id: UUID, limit: int,
+                   cursor: Optional[str], service: RideService) -> ORJSONListResponse:
+    # cursor из заголовка X-Next-Cursor прошлой страницы
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rides = await service.get_history(owner, str(owner_id), limit, after)
+    headers = {}
+    if len(rides) == limit:
+        last = rides[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.pickup_datetime, last.id)
+    return ORJSONListResponse(rides, headers=headers)
+
+
+@router.get("/users/{user_id}/rides", response_model=List[RideSummary])
+async def read_user_rides(
+    user_id: UUID,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    service: RideService = Depends(get_history_service)
+):
+    return await _history("user", user_id, limit, cursor, service)
+
+
+@router.get("/drivers/{driver_id}/rides", response_model=List[RideSummary])
+async def read_driver_rides(
+    driver_id: UUID,
+    limit: int = Query(20, ge=1, le=100),
+    cursor: Optional[str] = None,
+    service: RideService = Depends(get_history_service)
+):
+    return await _history("driver", driver_id, limit, cursor, service)
@@ -1,94 +1,157 @@
 # services/ride-service/routers/rides.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
-from models.ride import Ride, RideCreate, RideUpdate
-from services.ride_service import RideService
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from typing import List, Optional
+from models.ride import Ride, RideAssign, RideComplete, RideCreate, RideImportResult, RideUpdate
+from services.ride_service import RideService, RideTransitionError
+from services.ride_export import export_rides_ndjson
+from services.quotes import QuoteError, QuoteUnavailableError, apply_quote
+from services.ride_import import RideImporter
+from fastapi.responses import StreamingResponse
 from config import settings
-import psycopg2
-from psycopg2.extras import RealDictCursor
+from db import db, get_connection, get_read_connection
+from idempotency import IdempotencyStore, IdempotentRequest
 from repositories.ride_repository import RideRepository
-from kafka import KafkaProducer  # ← Есть?
-import json
-import os
+from repositories.pagination import decode_cursor, encode_cursor
+from serialization import ORJSONListResponse
+from repositories.async_ride_repository import AsyncRideRepository
+from cache import ride_history_cache
 from datetime import datetime
 
-def json_serializer(obj):
-   if isinstance(obj, datetime):
-       return obj.isoformat()  # или obj.strftime('%Y-%m-%dT%H:%M:%SZ')
-   raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+router = APIRouter(prefix="/api/v1/rides", tags=["rides"])
 
-producer = KafkaProducer(
-   bootstrap_servers=[os.getenv('KAFKA_BOOTSTRAP_SERVERS', 'kafka:29092')],
-   value_serializer=lambda v: json.dumps(v, default=json_serializer).encode('utf-8')
+# Повтор POST /rides/ с тем же Idempotency-Key не создаёт вторую поездку, а отдаёт первую
+ride_idempotency = IdempotencyStore(
+    "rides.create",
+    lambda: db.redis,
+    settings.IDEMPOTENCY_TTL,
+    settings.IDEMPOTENCY_LOCK_TTL,
+    settings.IDEMPOTENCY_WAIT_TIMEOUT,
 )
 
-
-
-router = APIRouter(prefix="/api/v1/rides", tags=["rides"])
-
-def get_db_connection():
-    return psycopg2.connect(
-        host=settings.POSTGRES_HOST,
-        port=settings.POSTGRES_PORT,
-        database=settings.POSTGRES_DB,
-        user=settings.POSTGRES_USER,
-        password=settings.POSTGRES_PASSWORD
-    )
-
-def get_ride_service():
-    conn = get_db_connection()
+async def get_ride_service(conn=Depends(get_connection)):
+    cache = ride_history_cache if settings.CACHE_ENABLED else None
+    if settings.DB_BACKEND == "async":
+        return RideService(AsyncRideRepository(conn), cache)
     ride_repo = RideRepository(conn)
-    return RideService(ride_repo)
+    return RideService(ride_repo, cache)
 
-@router.post("/", response_model=Ride, status_code=201)
-def create_ride(ride: RideCreate, service: RideService = Depends(get_ride_service)):
-   # Создаём поездку
-   created_ride = service.create_ride(ride)
-   # Отправляем событие в Kafka
-   producer.send('rides.created', created_ride.dict())
-   producer.flush()
-   return created_ride
+async def get_ride_read_service(conn=Depends(get_read_connection)):
+    # Соединение с реплики (или с primary, если годной нет) - только для GET
+    if settings.DB_BACKEND == "async":
+        return RideService(AsyncRideRepository(conn))
+    return RideService(RideRepository(conn))
 
+# Первая страница истории кэшируется: отстающая реплика положила бы в кэш страницу
+# без только что созданной поездки, поэтому при включённом кэше история читает с primary
+get_history_service = get_ride_service if settings.CACHE_ENABLED else get_ride_read_service
 
+@router.post("/", response_model=Ride, status_code=201)
+async def create_ride(
+    ride: RideCreate,
+    # До get_ride_service: дубликат ждёт первый запрос, не занимая соединение из пула
+    idempotency: Optional[IdempotentRequest] = Depends(ride_idempotency.dependency()),
+    service: RideService = Depends(get_ride_service)
+):
+    if ride.quote_id:
+        try:
+            ride = await apply_quote(ride)
+        except QuoteError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        except QuoteUnavailableError as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    # rides.created пишется в ride_outbox в той же транзакции, в Kafka его отправит outbox_relay
+    created = await service.create_ride(ride)
+    if idempotency:
+        idempotency.complete(created, status_code=201)
+    return created
 
 
 @router.get("/", response_model=List[Ride])
-def read_rides(skip: int = 0, limit: int = 100, service: RideService = Depends(get_ride_service)):
-    rides = service.get_rides(skip=skip, limit=limit)
-    return rides
+async def read_rides(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    service: RideService = Depends(get_ride_read_service)
+):
+    # cursor из заголовка X-Next-Cursor прошлой страницы; skip оставлен для старых клиентов
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    rides = await service.get_rides(skip=skip, limit=limit, after=after)
+    headers = {}
+    if len(rides) == limit:
+        last = rides[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.pickup_datetime, last.id)
+    # Строки уже собраны из базы - сериализуем без повторной валидации response_model
+    return ORJSONListResponse(rides, headers=headers)
+
+@router.get("/export")
+async def export_rides(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    # Объявлен до /{ride_id}, иначе "export" попадёт в ride_id
+    return StreamingResponse(export_rides_ndjson(since, until), media_type="application/x-ndjson")
+
+@router.post("/import", response_model=RideImportResult)
+async def import_rides(request: Request, format: Optional[str] = Query(None, pattern="^(ndjson|csv)$")):
+    # Формат - из ?format= или Content-Type (text/csv), по умолчанию NDJSON
+    if format is None:
+        format = "csv" if "csv" in request.headers.get("content-type", "") else "ndjson"
+    importer = RideImporter(ride_history_cache if settings.CACHE_ENABLED else None)
+    if format == "csv":
+        return await importer.import_csv(request.stream())
+    return await importer.import_ndjson(request.stream())
+
+# pickup_datetime в запросах по одной поездке - необязательная подсказка: с ней PostgreSQL
+# ищет только в секциях rides вокруг этого времени, а не во всех
+PICKUP_HINT = Query(None, alias="pickup_datetime", description="pickup_datetime поездки, если известно")
 
 @router.get("/{ride_id}", response_model=Ride)
-def read_ride(ride_id: str, service: RideService = Depends(get_ride_service)):
-    ride = service.get_ride(ride_id)
+async def read_ride(ride_id: str, pickup_hint: Optional[datetime] = PICKUP_HINT,
+                    service: RideService = Depends(get_ride_read_service)):
+    ride = await service.get_ride(ride_id, pickup_hint)
     if not ride:
         raise HTTPException(status_code=404, detail="Ride not found")
     return ride
 
-@router.post("/", response_model=Ride, status_code=201)
-def create_ride(ride: RideCreate, service: RideService = Depends(get_ride_service)):
-    return service.create_ride(ride)
-
 @router.put("/{ride_id}", response_model=Ride)
-def update_ride(ride_id: str, ride: RideUpdate, service: RideService = Depends(get_ride_service)):
-    updated_ride = service.update_ride(ride_id, ride)
+async def update_ride(ride_id: str, ride: RideUpdate, service: RideService = Depends(get_ride_service)):
+    updated_ride = await service.update_ride(ride_id, ride)
     if not updated_ride:
         raise HTTPException(status_code=404, detail="Ride not found")
     return updated_ride
 
-@router.post("/", response_model=Ride, status_code=201)
-def create_ride(ride: RideCreate, service: RideService = Depends(get_ride_service)):
-   # Создаём поездку
-   created_ride = service.create_ride(ride)
-
-   # Лог для отладки
-   print(f"Публикуем поездку: {created_ride.id}")
-
-   # Отправляем событие в Kafka
-   try:
-       producer.send('rides.created', created_ride.dict())
-       producer.flush()
-       print("Сообщение отправлено в Kafka")
-   except Exception as e:
-       print(f"Ошибка отправки в Kafka: {e}")
-   return created_ride
 
+# Переходы статуса: меняют только свои колонки и только из допустимого статуса (иначе 409),
+# поэтому не нужно читать поездку перед изменением и параллельные запросы не затирают друг друга
+
+async def _transition(call, *args) -> Ride:
+    try:
+        ride = await call(*args)
+    except RideTransitionError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if not ride:
+        raise HTTPException(status_code=404, detail="Ride not found")
+    return ride
+
+@router.post("/{ride_id}/assign", response_model=Ride)
+async def assign_ride(ride_id: str, body: RideAssign, pickup_hint: Optional[datetime] = PICKUP_HINT,
+                      service: RideService = Depends(get_ride_service)):
+    return await _transition(service.assign_ride, ride_id, str(body.driver_id), pickup_hint)
+
+@router.post("/{ride_id}/start", response_model=Ride)
+async def start_ride(ride_id: str, pickup_hint: Optional[datetime] = PICKUP_HINT,
+                     service: RideService = Depends(get_ride_service)):
+    return await _transition(service.start_ride, ride_id, pickup_hint)
+
+@router.post("/{ride_id}/complete", response_model=Ride)
+async def complete_ride(ride_id: str, body: Optional[RideComplete] = None,
+                        pickup_hint: Optional[datetime] = PICKUP_HINT,
+                        service: RideService = Depends(get_ride_service)):
+    return await _transition(service.complete_ride, ride_id, body or RideComplete(), pickup_hint)
+
+@router.post("/{ride_id}/cancel", response_model=Ride)
+async def cancel_ride(ride_id: str, pickup_hint: Optional[datetime] = PICKUP_HINT,
+                      service: RideService = Depends(get_ride_service)):
+    return await _transition(service.cancel_ride, ride_id, pickup_hint)
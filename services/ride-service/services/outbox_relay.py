@@ -0,0 +1,181 @@
+# services/ride-service/services/outbox_relay.py
+"""
+Доставка событий из ride_outbox в Kafka.
+
+Раз в OUTBOX_POLL_INTERVAL секунд (или сразу, если прошлая пачка была полной)
+берётся до OUTBOX_BATCH_SIZE самых старых событий, отправляется через общий
+продюсер, и из таблицы удаляется подряд идущий префикс, подтверждённый Kafka.
+Неподтверждённые остаются и уйдут в следующий раз (at-least-once: потребители
+отличают повторы по заголовку event_id).
+
+Работает один relay на кластер: на время пачки берётся pg_try_advisory_xact_lock,
+остальные реплики пропускают ход. Поэтому события одной поездки не обгоняют друг друга.
+"""
+import asyncio
+import concurrent.futures
+import json
+import logging
+import threading
+import time
+from typing import List, Tuple
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+from producer.kafka_producer import get_producer
+
+logger = logging.getLogger(__name__)
+
+# Произвольная константа - ключ advisory lock для relay
+OUTBOX_LOCK_KEY = 7_310_001
+
+SELECT_SQL_SYNC = "SELECT id, topic, ride_id, payload FROM ride_outbox ORDER BY id LIMIT %s"
+SELECT_SQL_ASYNC = "SELECT id, topic, ride_id, payload FROM ride_outbox ORDER BY id LIMIT $1"
+DELETE_SQL_SYNC = "DELETE FROM ride_outbox WHERE id = ANY(%s)"
+DELETE_SQL_ASYNC = "DELETE FROM ride_outbox WHERE id = ANY($1::bigint[])"
+
+
+class OutboxRelay:
+    def __init__(self, poll_interval: float, batch_size: int, delivery_timeout: float):
+        self.poll_interval = poll_interval
+        self.batch_size = batch_size
+        self.delivery_timeout = delivery_timeout
+        self._task = None
+        self._lock = threading.Lock()
+        self.relayed_total = 0
+        self.last_relay_at = None
+
+    def _publish(self, rows) -> List[Tuple[int, concurrent.futures.Future]]:
+        producer = get_producer()
+        pending = []
+        for event_id, topic, ride_id, payload in rows:
+            future = concurrent.futures.Future()
+
+            def on_delivery(exc, future=future):
+                if exc is None:
+                    future.set_result(True)
+                else:
+                    future.set_exception(exc)
+
+            if isinstance(payload, str):
+                # asyncpg отдаёт jsonb строкой
+                payload = json.loads(payload)
+            queued = producer.publish(
+                topic, payload, key=ride_id,
+                headers=[("event_id", str(event_id).encode())],
+                on_delivery=on_delivery
+            )
+            if not queued:
+                # Буфер продюсера полон - остаток пачки подождёт
+                break
+            pending.append((event_id, future))
+        return pending
+
+    @staticmethod
+    def _delivered_prefix(pending) -> List[int]:
+        # Удаляем только подряд идущие подтверждённые события, чтобы не нарушить порядок
+        delivered = []
+        for event_id, future in pending:
+            if not future.done() or future.exception() is not None:
+                break
+            delivered.append(event_id)
+        return delivered
+
+    def _relay_sync(self) -> Tuple[int, int]:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute("SELECT pg_try_advisory_xact_lock(%s)", (OUTBOX_LOCK_KEY,))
+                if not cur.fetchone()[0]:
+                    conn.rollback()
+                    return 0, 0
+                cur.execute(SELECT_SQL_SYNC, (self.batch_size,))
+                rows = cur.fetchall()
+                pending = self._publish(rows)
+                concurrent.futures.wait([f for _, f in pending], timeout=self.delivery_timeout)
+                delivered = self._delivered_prefix(pending)
+                if delivered:
+                    cur.execute(DELETE_SQL_SYNC, (delivered,))
+            conn.commit()
+        return len(rows), len(delivered)
+
+    async def _relay_async(self) -> Tuple[int, int]:
+        async with db.async_connection() as conn:
+            async with conn.transaction():
+                if not await conn.fetchval("SELECT pg_try_advisory_xact_lock($1)", OUTBOX_LOCK_KEY):
+                    return 0, 0
+                rows = [tuple(row) for row in await conn.fetch(SELECT_SQL_ASYNC, self.batch_size)]
+                pending = self._publish(rows)
+                if pending:
+                    await asyncio.wait(
+                        [asyncio.wrap_future(f) for _, f in pending], timeout=self.delivery_timeout
+                    )
+                delivered = self._delivered_prefix(pending)
+                if delivered:
+                    await conn.execute(DELETE_SQL_ASYNC, delivered)
+        return len(rows), len(delivered)
+
+    async def relay_once(self) -> Tuple[int, int]:
+        """Одна пачка. Возвращает (прочитано, доставлено)"""
+        if settings.DB_BACKEND == "async":
+            fetched, delivered = await self._relay_async()
+        else:
+            fetched, delivered = await run_in_threadpool(self._relay_sync)
+        if delivered:
+            with self._lock:
+                self.relayed_total += delivered
+                self.last_relay_at = time.time()
+        return fetched, delivered
+
+    async def stats(self) -> dict:
+        sql = "SELECT count(*), EXTRACT(EPOCH FROM NOW() - min(created_at)) FROM ride_outbox"
+        if settings.DB_BACKEND == "async":
+            async with db.async_connection() as conn:
+                pending, oldest_age = await conn.fetchrow(sql)
+        else:
+            pending, oldest_age = await run_in_threadpool(self._stats_sync, sql)
+        with self._lock:
+            return {
+                "pending": pending,
+                "oldest_age_seconds": float(oldest_age) if oldest_age is not None else None,
+                "relayed_total": self.relayed_total,
+                "last_relay_at": self.last_relay_at,
+            }
+
+    def _stats_sync(self, sql):
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(sql)
+                row = cur.fetchone()
+            conn.commit()
+        return row
+
+    async def _run(self):
+        while True:
+            try:
+                fetched, delivered = await self.relay_once()
+            except Exception as e:
+                logger.error(f"Outbox relay failed: {e}")
+                fetched = delivered = 0
+            # Полная и целиком доставленная пачка - скорее всего есть ещё, не ждём
+            if not (fetched == self.batch_size and delivered == fetched):
+                await asyncio.sleep(self.poll_interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+outbox_relay = OutboxRelay(
+    settings.OUTBOX_POLL_INTERVAL,
+    settings.OUTBOX_BATCH_SIZE,
+    settings.OUTBOX_DELIVERY_TIMEOUT,
+)
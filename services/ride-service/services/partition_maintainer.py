@@ -0,0 +1,80 @@
+# services/ride-service/services/partition_maintainer.py
+"""
+Заблаговременное создание месячных секций rides.
+
+При старте и затем раз в RIDES_PARTITION_CHECK_INTERVAL секунд вызывается
+ensure_rides_partitions() (infrastructure/postgres/init.sql) на текущий месяц и
+RIDES_PARTITIONS_AHEAD месяцев вперёд. Функция идемпотентна и сама берёт advisory
+lock, поэтому несколько реплик ride-service не мешают друг другу. Если секция так и
+не была создана, новые поездки попадают в rides_default и переносятся при её создании.
+"""
+import asyncio
+import logging
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+
+logger = logging.getLogger(__name__)
+
+ENSURE_SQL_SYNC = """
+    SELECT ensure_rides_partitions(
+        (CURRENT_DATE - INTERVAL '1 month')::date, (CURRENT_DATE + make_interval(months => %s))::date
+    )
+"""
+ENSURE_SQL_ASYNC = """
+    SELECT ensure_rides_partitions(
+        (CURRENT_DATE - INTERVAL '1 month')::date, (CURRENT_DATE + make_interval(months => $1))::date
+    )
+"""
+
+
+class PartitionMaintainer:
+    def __init__(self, interval: float, months_ahead: int):
+        self.interval = interval
+        self.months_ahead = months_ahead
+        self._task = None
+
+    def _ensure_sync(self) -> int:
+        with db.connection() as conn:
+            with conn.cursor() as cur:
+                cur.execute(ENSURE_SQL_SYNC, (self.months_ahead,))
+                created = cur.fetchone()[0]
+            conn.commit()
+        return created
+
+    async def ensure(self) -> int:
+        """Сколько секций создано"""
+        if settings.DB_BACKEND == "async":
+            async with db.async_connection() as conn:
+                return await conn.fetchval(ENSURE_SQL_ASYNC, self.months_ahead)
+        return await run_in_threadpool(self._ensure_sync)
+
+    async def _run(self):
+        while True:
+            try:
+                created = await self.ensure()
+                if created:
+                    logger.info(f"Created {created} rides partitions")
+            except Exception as e:
+                logger.error(f"Failed to ensure rides partitions: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+
+partition_maintainer = PartitionMaintainer(
+    settings.RIDES_PARTITION_CHECK_INTERVAL,
+    settings.RIDES_PARTITIONS_AHEAD,
+)
@@ -0,0 +1,92 @@
+# services/ride-service/services/quotes.py
+"""
+Стоимость поездки по quote_id из pricing-service (POST /api/v1/pricing/quote).
+
+pricing-service кладёт расчёт в Redis под quote:{quote_id} на QUOTE_TTL секунд.
+Поездка, созданная с quote_id, получает total_fare (и distance_km, если он не
+передан) из расчёта - цена не пересчитывается и совпадает с показанной клиенту.
+Поездка должна иметь все четыре координаты, и они должны совпадать с расчётом
+с точностью до шага округления, с которым он сделан (coord_tolerance), а время
+подачи - попадать в интервал времени расчёта (time_bucket секунд от pickup_datetime).
+"""
+import json
+import logging
+from datetime import datetime, timedelta, timezone
+from typing import Optional
+
+from fastapi.concurrency import run_in_threadpool
+
+from config import settings
+from db import db
+from models.ride import RideCreate
+
+logger = logging.getLogger(__name__)
+
+QUOTE_KEY_PREFIX = "quote:"
+# Запас на ошибку округления float при сравнении координат
+COORD_EPSILON = 1e-9
+
+
+class QuoteError(Exception):
+    """Расчёт не найден, истёк или сделан для другого маршрута"""
+
+
+class QuoteUnavailableError(Exception):
+    """Redis недоступен - проверить расчёт нельзя"""
+
+
+async def _get(key: str):
+    if settings.DB_BACKEND == "async":
+        return await db.redis.get(key)
+    return await run_in_threadpool(db.redis.get, key)
+
+
+def _near(value: Optional[float], quoted: float, tolerance: float) -> bool:
+    # Без координаты совпадения нет: иначе расчёт короткой поездки подошёл бы к любой
+    return value is not None and abs(value - quoted) <= tolerance + COORD_EPSILON
+
+
+def _utc(value: datetime) -> datetime:
+    # naive datetime в ride-service - UTC (как в колонках rides)
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _in_time_bucket(pickup_datetime: datetime, quote: dict) -> bool:
+    """Время подачи в интервале расчёта [pickup_datetime, pickup_datetime + time_bucket)"""
+    bucket = quote.get("time_bucket")
+    if bucket is None:
+        # Расчёты, выданные до появления поля, живут не дольше QUOTE_TTL
+        return True
+    start = _utc(datetime.fromisoformat(quote["pickup_datetime"]))
+    return start <= _utc(pickup_datetime) < start + timedelta(seconds=bucket)
+
+
+async def apply_quote(ride: RideCreate) -> RideCreate:
+    """Поездка с ценой из расчёта ride.quote_id"""
+    try:
+        raw = await _get(QUOTE_KEY_PREFIX + ride.quote_id)
+    except Exception as e:
+        logger.warning(f"Quote lookup failed for {ride.quote_id}: {e}")
+        raise QuoteUnavailableError("Quote storage is unavailable, retry later")
+    if raw is None:
+        raise QuoteError(f"Quote {ride.quote_id} not found or expired")
+
+    quote = json.loads(raw)
+    tolerance = quote["coord_tolerance"]
+    route_matches = (
+        _near(ride.pickup_latitude, quote["pickup_latitude"], tolerance)
+        and _near(ride.pickup_longitude, quote["pickup_longitude"], tolerance)
+        and _near(ride.dropoff_latitude, quote["dropoff_latitude"], tolerance)
+        and _near(ride.dropoff_longitude, quote["dropoff_longitude"], tolerance)
+    )
+    if not route_matches:
+        raise QuoteError(f"Quote {ride.quote_id} was issued for a different route")
+    if not _in_time_bucket(ride.pickup_datetime, quote):
+        raise QuoteError(f"Quote {ride.quote_id} was issued for a different pickup time")
+
+    return ride.model_copy(update={
+        "total_fare": quote["total_amount"],
+        "distance_km": ride.distance_km if ride.distance_km is not None else quote["distance_km"],
+    })
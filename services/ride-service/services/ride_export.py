@@ -0,0 +1,51 @@
+# services/ride-service/services/ride_export.py
+"""
+Выгрузка поездок в NDJSON (одна поездка - одна строка JSON).
+
+Строки читаются серверным курсором и сразу уходят клиенту, поэтому память
+не зависит от размера выгрузки. Соединение берётся из пула внутри генератора:
+оно нужно всё время, пока идёт ответ, а не только на время обработчика.
+Выгрузка только читает, поэтому идёт на реплику, если она настроена.
+"""
+import json
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Optional
+
+from config import settings
+from db import db
+from repositories.async_ride_repository import AsyncRideRepository
+from repositories.ride_repository import RideRepository
+
+
+def _json_default(obj):
+    if isinstance(obj, (datetime, date)):
+        return obj.isoformat()
+    if isinstance(obj, Decimal):
+        return float(obj)
+    raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+
+
+def _to_line(row) -> bytes:
+    return (json.dumps(dict(row), default=_json_default) + "\n").encode("utf-8")
+
+
+def _export_sync(since: Optional[datetime], until: Optional[datetime]):
+    with db.read_connection() as conn:
+        repo = RideRepository(conn)
+        for row in repo.iter_rides(since, until, settings.EXPORT_CHUNK_SIZE):
+            yield _to_line(row)
+
+
+async def _export_async(since: Optional[datetime], until: Optional[datetime]):
+    async with db.async_read_connection() as conn:
+        repo = AsyncRideRepository(conn)
+        async for row in repo.iter_rides(since, until, settings.EXPORT_CHUNK_SIZE):
+            yield _to_line(row)
+
+
+def export_rides_ndjson(since: Optional[datetime] = None, until: Optional[datetime] = None):
+    """Итератор строк NDJSON для StreamingResponse (sync или async - по DB_BACKEND)"""
+    if settings.DB_BACKEND == "async":
+        return _export_async(since, until)
+    return _export_sync(since, until)
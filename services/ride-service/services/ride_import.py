@@ -0,0 +1,176 @@
+# services/ride-service/services/ride_import.py
+"""
+Массовая загрузка поездок из NDJSON или CSV (POST /api/v1/rides/import).
+
+Тело читается потоком: строки валидируются по одной и копятся в пачки по
+IMPORT_CHUNK_SIZE. Пачка - одна транзакция: COPY во временную таблицу, затем
+INSERT ... SELECT в rides, пропуская id, которые уже есть в rides (при любом
+pickup_datetime) или повторяются в пачке, и rides.created для всех вставленных
+строк одним INSERT в ride_outbox. Соединение берётся на время пачки,
+а не на всю загрузку. Плохие строки не прерывают загрузку, а попадают в отчёт.
+"""
+import csv
+import json
+import logging
+import uuid
+from datetime import datetime, timezone
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+
+import asyncpg
+import psycopg2
+from fastapi.concurrency import run_in_threadpool
+from pydantic import ValidationError
+
+from cache import RideHistoryCache
+from config import settings
+from db import db
+from models.ride import RideImport, RideImportError, RideImportResult
+from repositories.async_ride_repository import AsyncRideRepository
+from repositories.ride_repository import RideRepository
+
+logger = logging.getLogger(__name__)
+
+
+def _utc_naive(value: Optional[datetime]) -> Optional[datetime]:
+    # COPY в TIMESTAMP молча отбрасывает смещение - приводим к UTC заранее, как делает psycopg2
+    if value is None or value.tzinfo is None:
+        return value
+    return value.astimezone(timezone.utc).replace(tzinfo=None)
+
+
+def _describe(exc: ValidationError) -> str:
+    return "; ".join(f"{'.'.join(str(part) for part in e['loc']) or 'row'}: {e['msg']}" for e in exc.errors())
+
+
+async def _iter_lines(body: AsyncIterator[bytes]) -> AsyncIterator[Tuple[int, str]]:
+    """(номер строки с 1, текст) по мере прихода тела запроса"""
+    line_no = 0
+    tail = b""
+    async for chunk in body:
+        tail += chunk
+        *lines, tail = tail.split(b"\n")
+        for line in lines:
+            line_no += 1
+            yield line_no, line.decode("utf-8", errors="replace").rstrip("\r")
+    if tail:
+        yield line_no + 1, tail.decode("utf-8", errors="replace").rstrip("\r")
+
+
+class RideImporter:
+    def __init__(self, cache: Optional[RideHistoryCache] = None):
+        self.cache = cache
+        self.result = RideImportResult()
+        self._chunk: List[Tuple[int, RideImport]] = []
+
+    def _error(self, line_no: int, ride_id: Optional[str], error: str):
+        if len(self.result.errors) < settings.IMPORT_MAX_ERRORS:
+            self.result.errors.append(RideImportError(line=line_no, id=ride_id, error=error))
+        else:
+            self.result.errors_truncated = True
+
+    def _add(self, line_no: int, data: dict):
+        self.result.received += 1
+        try:
+            ride = RideImport.model_validate(data)
+        except ValidationError as e:
+            self.result.failed += 1
+            raw_id = data.get("id")
+            self._error(line_no, str(raw_id) if raw_id is not None else None, _describe(e))
+            return
+        if ride.id is None:
+            ride.id = str(uuid.uuid4())
+        ride.pickup_datetime = _utc_naive(ride.pickup_datetime)
+        ride.dropoff_datetime = _utc_naive(ride.dropoff_datetime)
+        self._chunk.append((line_no, ride))
+
+    def _load_sync(self, rows):
+        with db.connection() as conn:
+            return RideRepository(conn).import_rides(rows)
+
+    async def _load(self, rows):
+        if settings.DB_BACKEND == "async":
+            async with db.async_connection() as conn:
+                return await AsyncRideRepository(conn).import_rides(rows)
+        return await run_in_threadpool(self._load_sync, rows)
+
+    async def _flush(self):
+        rows, self._chunk = self._chunk, []
+        if not rows:
+            return
+        try:
+            inserted, rejected = await self._load(rows)
+        except (psycopg2.Error, asyncpg.PostgresError) as e:
+            # Пачка откатилась целиком - отмечаем все её строки
+            logger.error(f"Ride import chunk of {len(rows)} rows failed: {e}")
+            self.result.failed += len(rows)
+            for line_no, ride in rows:
+                self._error(line_no, ride.id, f"chunk failed: {e}")
+            return
+
+        rejected_lines = set()
+        for line_no, ride_id, error in rejected:
+            rejected_lines.add(line_no)
+            self.result.failed += 1
+            self._error(line_no, ride_id, error)
+
+        # Из строк с одинаковым id вливается первая годная (DISTINCT ON ... ORDER BY line_no),
+        # id во вставленных уникальны
+        new_ids = {ride_id for ride_id, _, _ in inserted}
+        for line_no, ride in rows:
+            if line_no in rejected_lines:
+                continue
+            if ride.id in new_ids:
+                new_ids.discard(ride.id)
+                self.result.inserted += 1
+            else:
+                self.result.duplicates += 1
+                self._error(line_no, ride.id, "duplicate id")
+
+        if self.cache and inserted:
+            owners = [("user", user_id) for _, user_id, _ in inserted]
+            owners += [("driver", driver_id) for _, _, driver_id in inserted]
+            await self.cache.invalidate(owners)
+
+    async def _add_and_flush(self, line_no: int, data: dict):
+        self._add(line_no, data)
+        if len(self._chunk) >= settings.IMPORT_CHUNK_SIZE:
+            await self._flush()
+
+    async def import_ndjson(self, body: AsyncIterator[bytes]) -> RideImportResult:
+        async for line_no, line in _iter_lines(body):
+            if not line.strip():
+                continue
+            try:
+                data = json.loads(line)
+                if not isinstance(data, dict):
+                    raise ValueError("expected a JSON object")
+            except ValueError as e:
+                self.result.received += 1
+                self.result.failed += 1
+                self._error(line_no, None, f"invalid JSON: {e}")
+                continue
+            await self._add_and_flush(line_no, data)
+        await self._flush()
+        return self.result
+
+    async def import_csv(self, body: AsyncIterator[bytes]) -> RideImportResult:
+        """Первая строка - заголовок с именами полей; одна поездка - одна строка, пустое поле - NULL"""
+        header: Optional[List[str]] = None
+        async for line_no, line in _iter_lines(body):
+            if not line.strip():
+                continue
+            values = next(csv.reader([line]))
+            if header is None:
+                header = [name.strip() for name in values]
+                continue
+            if len(values) != len(header):
+                self.result.received += 1
+                self.result.failed += 1
+                self._error(line_no, None, f"expected {len(header)} fields, got {len(values)}")
+                continue
+            data: Dict[str, Optional[str]] = {
+                name: (value if value != "" else None) for name, value in zip(header, values)
+            }
+            await self._add_and_flush(line_no, data)
+        await self._flush()
+        return self.result
@@ -1,20 +1,105 @@
 # services/ride-service/services/ride_service.py
-from typing import List, Optional
-from repositories.ride_repository import RideRepository
-from models.ride import Ride, RideCreate, RideUpdate
+import inspect
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+import asyncpg
+from psycopg2 import errors as pg_errors
+from fastapi.concurrency import run_in_threadpool
+from repositories.ride_repository import RIDE_TRANSITIONS, RideRepository
+from models.ride import Ride, RideComplete, RideCreate, RideSummary, RideUpdate
+from cache import RideHistoryCache
+
+
+class RideTransitionError(Exception):
+    """Переход недопустим из текущего статуса поездки"""
+
+    def __init__(self, action: str, current_status: str):
+        self.action = action
+        self.current_status = current_status
+        allowed = ", ".join(RIDE_TRANSITIONS[action][0])
+        super().__init__(f"Cannot {action} ride in status '{current_status}' (allowed from: {allowed})")
+
 
 class RideService:
-    def __init__(self, ride_repository: RideRepository):
+    def __init__(self, ride_repository: RideRepository, cache: Optional[RideHistoryCache] = None):
+        # RideRepository (psycopg2) или AsyncRideRepository (asyncpg) - см. DB_BACKEND
         self.ride_repository = ride_repository
+        # None - история читается напрямую из PostgreSQL (CACHE_ENABLED=false)
+        self.cache = cache
+    
+    async def _run(self, method, *args):
+        # Синхронный репозиторий блокирует поток, поэтому уводим его в threadpool
+        if inspect.iscoroutinefunction(method):
+            return await method(*args)
+        return await run_in_threadpool(method, *args)
+    
+    async def get_ride(self, ride_id: str, pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        return await self._run(self.ride_repository.get_ride, ride_id, pickup_hint)
+    
+    async def get_rides(self, skip: int = 0, limit: int = 100,
+                        after: Optional[Tuple[datetime, str]] = None) -> List[Ride]:
+        return await self._run(self.ride_repository.get_rides, skip, limit, after)
+    
+    async def get_history(self, owner: str, owner_id: str, limit: int,
+                          after: Optional[Tuple[datetime, str]] = None) -> List[RideSummary]:
+        # Кэшируется только первая страница - дальше курсор и так идёт по индексу
+        if self.cache is None or after is not None or limit > self.cache.cached_rows:
+            return await self._run(self.ride_repository.get_history, owner, owner_id, limit, after)
+        rides, version = await self.cache.get(owner, owner_id)
+        if rides is None:
+            rides = await self._run(
+                self.ride_repository.get_history, owner, owner_id, self.cache.cached_rows, None
+            )
+            await self.cache.set(owner, owner_id, rides, version)
+        return rides[:limit]
+    
+    async def create_ride(self, ride: RideCreate) -> Ride:
+        created_ride = await self._run(self.ride_repository.create_ride, ride)
+        if self.cache:
+            await self.cache.invalidate([("user", created_ride.user_id), ("driver", created_ride.driver_id)])
+        return created_ride
+    
+    async def update_ride(self, ride_id: str, ride: RideUpdate) -> Optional[Ride]:
+        # Прежний водитель нужен, чтобы сбросить и его историю, если поездку переназначили
+        previous = await self.get_ride(ride_id) if self.cache else None
+        updated_ride = await self._run(self.ride_repository.update_ride, ride_id, ride)
+        if updated_ride and self.cache:
+            await self.cache.invalidate([
+                ("user", updated_ride.user_id),
+                ("driver", updated_ride.driver_id),
+                ("driver", previous.driver_id if previous else None),
+            ])
+        return updated_ride
+    
+    async def _transition(self, ride_id: str, action: str, changes: Optional[dict] = None,
+                          pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        """None - поездки нет; RideTransitionError - статус не позволяет переход"""
+        ride, current_status = await self._run(
+            self.ride_repository.transition, ride_id, action, changes or {}, pickup_hint
+        )
+        if ride is None:
+            if current_status is None:
+                return None
+            raise RideTransitionError(action, current_status)
+        if self.cache:
+            await self.cache.invalidate([("user", ride.user_id), ("driver", ride.driver_id)])
+        return ride
     
-    def get_ride(self, ride_id: str) -> Optional[Ride]:
-        return self.ride_repository.get_ride(ride_id)
+    async def assign_ride(self, ride_id: str, driver_id: str,
+                          pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        try:
+            return await self._transition(ride_id, "assign", {"driver_id": driver_id}, pickup_hint)
+        except (pg_errors.ForeignKeyViolation, asyncpg.ForeignKeyViolationError):
+            raise ValueError(f"Driver {driver_id} not found")
     
-    def get_rides(self, skip: int = 0, limit: int = 100) -> List[Ride]:
-        return self.ride_repository.get_rides(skip, limit)
+    async def start_ride(self, ride_id: str, pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        return await self._transition(ride_id, "start", None, pickup_hint)
     
-    def create_ride(self, ride: RideCreate) -> Ride:
-        return self.ride_repository.create_ride(ride)
+    async def complete_ride(self, ride_id: str, details: RideComplete,
+                            pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        changes = details.model_dump(exclude_none=True)
+        changes.setdefault("dropoff_datetime", datetime.now(timezone.utc))
+        return await self._transition(ride_id, "complete", changes, pickup_hint)
     
-    def update_ride(self, ride_id: str, ride: RideUpdate) -> Optional[Ride]:
-        return self.ride_repository.update_ride(ride_id, ride)
+    async def cancel_ride(self, ride_id: str, pickup_hint: Optional[datetime] = None) -> Optional[Ride]:
+        return await self._transition(ride_id, "cancel", None, pickup_hint)
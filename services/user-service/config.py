@@ -10,6 +10,33 @@ class Settings(BaseSettings):
     POSTGRES_USER: str = os.getenv("POSTGRES_USER", "uber")
     POSTGRES_PASSWORD: str = os.getenv("POSTGRES_PASSWORD", "uber_secret_password")
     
+    # Пул соединений PostgreSQL
+    DB_POOL_MIN_SIZE: int = int(os.getenv("DB_POOL_MIN_SIZE", 2))
+    DB_POOL_MAX_SIZE: int = int(os.getenv("DB_POOL_MAX_SIZE", 20))
+    DB_POOL_TIMEOUT: float = float(os.getenv("DB_POOL_TIMEOUT", 5))
+    DB_CONNECT_TIMEOUT: int = int(os.getenv("DB_CONNECT_TIMEOUT", 5))
+    # sync - psycopg2 в threadpool, async - asyncpg в event loop
+    DB_BACKEND: str = os.getenv("DB_BACKEND", "sync")
+    DB_STATEMENT_CACHE_SIZE: int = int(os.getenv("DB_STATEMENT_CACHE_SIZE", 100))
+    # Реплики для чтения: DSN через запятую, пусто - все запросы на primary
+    POSTGRES_REPLICA_DSNS: str = os.getenv("POSTGRES_REPLICA_DSNS", "")
+    # Реплика, отставшая больше чем на столько секунд, пропускается
+    DB_REPLICA_MAX_LAG: float = float(os.getenv("DB_REPLICA_MAX_LAG", 5))
+    DB_REPLICA_LAG_CHECK_INTERVAL: float = float(os.getenv("DB_REPLICA_LAG_CHECK_INTERVAL", 2))
+    # Столько секунд после записи клиент читает с primary (read-your-writes)
+    DB_READ_YOUR_WRITES_TTL: float = float(os.getenv("DB_READ_YOUR_WRITES_TTL", 5))
+    
+    # Redis
+    REDIS_HOST: str = os.getenv("REDIS_HOST", "redis")
+    REDIS_PORT: int = int(os.getenv("REDIS_PORT", 6379))
+    REDIS_POOL_MAX_SIZE: int = int(os.getenv("REDIS_POOL_MAX_SIZE", 50))
+    
+    # Кэш профилей (локальный LRU + Redis)
+    CACHE_ENABLED: bool = os.getenv("CACHE_ENABLED", "true").lower() == "true"
+    CACHE_LOCAL_MAX_SIZE: int = int(os.getenv("CACHE_LOCAL_MAX_SIZE", 10000))
+    CACHE_LOCAL_TTL: float = float(os.getenv("CACHE_LOCAL_TTL", 30))
+    CACHE_REDIS_TTL: int = int(os.getenv("CACHE_REDIS_TTL", 300))
+    
     # Сервис
     USER_SERVICE_PORT: int = int(os.getenv("USER_SERVICE_PORT", 8001))
     
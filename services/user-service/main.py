@@ -1,13 +1,29 @@
 # services/user-service/main.py
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware  # Добавь эту строку
 from routers import users
 from config import settings
+from db import PoolExhaustedError, open_pools, close_pools, pools_health, read_your_writes
+from cache import user_cache
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Пулы соединений открываются один раз на процесс
+    await open_pools()
+    if settings.CACHE_ENABLED:
+        user_cache.start_listener()
+    yield
+    user_cache.stop_listener()
+    await close_pools()
 
 app = FastAPI(
     title="User Service",
     description="Микросервис управления пользователями",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # Добавь CORS middleware
@@ -17,14 +33,30 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],  # Разрешенные методы
     allow_headers=["*"],  # Разрешенные заголовки
+    expose_headers=["X-Next-Cursor", "X-Read-Primary-Until"],  # Курсор следующей страницы, read-your-writes
 )
 
+# Read-your-writes: после записи клиент какое-то время читает с primary, а не с реплики
+app.middleware("http")(read_your_writes)
+
 app.include_router(users.router)
 
 @app.get("/health")
 async def health_check():
     return {"status": "healthy", "service": "user-service"}
 
+@app.get("/health/db")
+async def db_health_check():
+    return await pools_health()
+
+@app.get("/health/cache")
+async def cache_health_check():
+    return {"enabled": settings.CACHE_ENABLED, "users": user_cache.stats.snapshot()}
+
+@app.exception_handler(PoolExhaustedError)
+async def pool_exhausted_handler(request: Request, exc: PoolExhaustedError):
+    return JSONResponse(status_code=503, content={"detail": str(exc)})
+
 @app.get("/")
 async def root():
     return {"message": "User Service - Uber Clone", "version": "1.0.0"}
@@ -0,0 +1,69 @@
+# services/user-service/repositories/async_user_repository.py
+import uuid
+from datetime import datetime
+from typing import List, Optional, Tuple
+from models.user import User, UserCreate, UserUpdate
+from serialization import from_row, from_rows
+
+
+class AsyncUserRepository:
+    """Те же запросы, что в UserRepository, но через asyncpg (DB_BACKEND=async)"""
+
+    def __init__(self, connection):
+        self.conn = connection
+
+    async def get_user(self, user_id: str) -> Optional[User]:
+        row = await self.conn.fetchrow("SELECT * FROM users WHERE id = $1", user_id)
+        return from_row(User, row)
+
+    async def get_user_by_phone(self, phone: str) -> Optional[User]:
+        row = await self.conn.fetchrow("SELECT * FROM users WHERE phone = $1", phone)
+        return from_row(User, row)
+
+    async def get_users(self, skip: int = 0, limit: int = 100,
+                        after: Optional[Tuple[datetime, str]] = None) -> List[User]:
+        if after is not None:
+            rows = await self.conn.fetch(
+                """
+                SELECT * FROM users
+                WHERE (created_at, id) < ($1::timestamp, $2::uuid)
+                ORDER BY created_at DESC, id DESC
+                LIMIT $3
+                """,
+                after[0], after[1], limit
+            )
+        else:
+            rows = await self.conn.fetch(
+                "SELECT * FROM users ORDER BY created_at DESC, id DESC LIMIT $1 OFFSET $2",
+                limit, skip
+            )
+        return from_rows(User, rows)
+
+    async def create_user(self, user: UserCreate) -> User:
+        user_id = str(uuid.uuid4())
+        row = await self.conn.fetchrow(
+            """
+            INSERT INTO users (id, phone, name, email, rating, total_rides, created_at)
+            VALUES ($1, $2, $3, $4, $5, $6, NOW())
+            RETURNING *
+            """,
+            user_id, user.phone, user.name, user.email, user.rating, 0
+        )
+        return from_row(User, row)
+
+    async def update_user(self, user_id: str, user: UserUpdate) -> Optional[User]:
+        row = await self.conn.fetchrow(
+            """
+            UPDATE users
+            SET name = $1, email = $2, rating = $3
+            WHERE id = $4
+            RETURNING *
+            """,
+            user.name, user.email, user.rating, user_id
+        )
+        return from_row(User, row)
+
+    async def delete_user(self, user_id: str) -> bool:
+        status = await self.conn.execute("DELETE FROM users WHERE id = $1", user_id)
+        # asyncpg возвращает тег команды, например "DELETE 1"
+        return status.split()[-1] != "0"
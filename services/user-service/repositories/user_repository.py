@@ -2,8 +2,10 @@
 import uuid
 import psycopg2
 from psycopg2.extras import RealDictCursor
-from typing import List, Optional
+from datetime import datetime
+from typing import List, Optional, Tuple
 from models.user import User, UserCreate, UserUpdate
+from serialization import from_row, from_rows
 
 class UserRepository:
     def __init__(self, connection):
@@ -17,7 +19,7 @@ class UserRepository:
             )
             row = cur.fetchone()
             if row:
-                return User(**row)
+                return from_row(User, row)
         return None
     
     def get_user_by_phone(self, phone: str) -> Optional[User]:
@@ -28,17 +30,30 @@ class UserRepository:
             )
             row = cur.fetchone()
             if row:
-                return User(**row)
+                return from_row(User, row)
         return None
     
-    def get_users(self, skip: int = 0, limit: int = 100) -> List[User]:
+    def get_users(self, skip: int = 0, limit: int = 100,
+                  after: Optional[Tuple[datetime, str]] = None) -> List[User]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
-            cur.execute(
-                "SELECT * FROM users ORDER BY created_at DESC LIMIT %s OFFSET %s",
-                (limit, skip)
-            )
+            if after is not None:
+                # Keyset: продолжаем после последней строки прошлой страницы, без OFFSET
+                cur.execute(
+                    """
+                    SELECT * FROM users
+                    WHERE (created_at, id) < (%s, %s)
+                    ORDER BY created_at DESC, id DESC
+                    LIMIT %s
+                    """,
+                    (after[0], after[1], limit)
+                )
+            else:
+                cur.execute(
+                    "SELECT * FROM users ORDER BY created_at DESC, id DESC LIMIT %s OFFSET %s",
+                    (limit, skip)
+                )
             rows = cur.fetchall()
-            return [User(**row) for row in rows]
+            return from_rows(User, rows)
     
     def create_user(self, user: UserCreate) -> User:
         user_id = str(uuid.uuid4())
@@ -53,7 +68,7 @@ class UserRepository:
             )
             row = cur.fetchone()
             self.conn.commit()
-            return User(**row)
+            return from_row(User, row)
     
     def update_user(self, user_id: str, user: UserUpdate) -> Optional[User]:
         with self.conn.cursor(cursor_factory=RealDictCursor) as cur:
@@ -69,7 +84,7 @@ class UserRepository:
             row = cur.fetchone()
             if row:
                 self.conn.commit()
-                return User(**row)
+                return from_row(User, row)
             return None
     
     def delete_user(self, user_id: str) -> bool:
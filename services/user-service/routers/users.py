@@ -1,64 +1,86 @@
 # services/user-service/routers/users.py
-from fastapi import APIRouter, Depends, HTTPException
-from typing import List
+from fastapi import APIRouter, Depends, HTTPException, Query
+from typing import List, Optional
 from models.user import User, UserCreate, UserUpdate
 from services.user_service import UserService
 from config import settings
-import psycopg2
+from db import get_connection, get_read_connection
+from cache import user_cache
 from repositories.user_repository import UserRepository
+from repositories.pagination import decode_cursor, encode_cursor
+from serialization import ORJSONListResponse
+from repositories.async_user_repository import AsyncUserRepository
 
 router = APIRouter(prefix="/api/v1/users", tags=["users"])
 
-def get_db_connection():
-    return psycopg2.connect(
-        host=settings.POSTGRES_HOST,
-        port=settings.POSTGRES_PORT,
-        database=settings.POSTGRES_DB,
-        user=settings.POSTGRES_USER,
-        password=settings.POSTGRES_PASSWORD
-    )
-
-def get_user_service():
-    conn = get_db_connection()
+async def get_user_service(conn=Depends(get_connection)):
+    cache = user_cache if settings.CACHE_ENABLED else None
+    if settings.DB_BACKEND == "async":
+        return UserService(AsyncUserRepository(conn), cache)
     user_repo = UserRepository(conn)
-    return UserService(user_repo)
+    return UserService(user_repo, cache)
+
+async def get_user_read_service(conn=Depends(get_read_connection)):
+    # Соединение с реплики (или с primary, если годной нет) - только для GET
+    if settings.DB_BACKEND == "async":
+        return UserService(AsyncUserRepository(conn))
+    return UserService(UserRepository(conn))
+
+# Поиск по id и телефону заполняет кэш профилей: отстающая реплика положила бы туда
+# старую версию уже после инвалидации, поэтому при включённом кэше он читает с primary
+get_user_lookup_service = get_user_service if settings.CACHE_ENABLED else get_user_read_service
 
 @router.get("/", response_model=List[User])
-def read_users(skip: int = 0, limit: int = 100, service: UserService = Depends(get_user_service)):
-    users = service.get_users(skip=skip, limit=limit)
-    return users
+async def read_users(
+    skip: int = 0,
+    limit: int = Query(100, ge=1, le=1000),
+    cursor: Optional[str] = None,
+    service: UserService = Depends(get_user_read_service)
+):
+    # cursor из заголовка X-Next-Cursor прошлой страницы; skip оставлен для старых клиентов
+    try:
+        after = decode_cursor(cursor) if cursor else None
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    users = await service.get_users(skip=skip, limit=limit, after=after)
+    headers = {}
+    if len(users) == limit:
+        last = users[-1]
+        headers["X-Next-Cursor"] = encode_cursor(last.created_at, last.id)
+    # Строки уже собраны из базы - сериализуем без повторной валидации response_model
+    return ORJSONListResponse(users, headers=headers)
 
 @router.get("/me", response_model=User)
-def read_current_user(phone: str, service: UserService = Depends(get_user_service)):
-    user = service.get_user_by_phone(phone)
+async def read_current_user(phone: str, service: UserService = Depends(get_user_lookup_service)):
+    user = await service.get_user_by_phone(phone)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.get("/{user_id}", response_model=User)
-def read_user(user_id: str, service: UserService = Depends(get_user_service)):
-    user = service.get_user(user_id)
+async def read_user(user_id: str, service: UserService = Depends(get_user_lookup_service)):
+    user = await service.get_user(user_id)
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
 @router.post("/", response_model=User, status_code=201)
-def create_user(user: UserCreate, service: UserService = Depends(get_user_service)):
+async def create_user(user: UserCreate, service: UserService = Depends(get_user_service)):
     try:
-        return service.create_user(user)
+        return await service.create_user(user)
     except ValueError as e:
         raise HTTPException(status_code=400, detail=str(e))
 
 @router.put("/{user_id}", response_model=User)
-def update_user(user_id: str, user: UserUpdate, service: UserService = Depends(get_user_service)):
-    updated_user = service.update_user(user_id, user)
+async def update_user(user_id: str, user: UserUpdate, service: UserService = Depends(get_user_service)):
+    updated_user = await service.update_user(user_id, user)
     if not updated_user:
         raise HTTPException(status_code=404, detail="User not found")
     return updated_user
 
 @router.delete("/{user_id}")
-def delete_user(user_id: str, service: UserService = Depends(get_user_service)):
-    success = service.delete_user(user_id)
+async def delete_user(user_id: str, service: UserService = Depends(get_user_service)):
+    success = await service.delete_user(user_id)
     if not success:
         raise HTTPException(status_code=404, detail="User not found")
     return {"message": "User deleted successfully"}
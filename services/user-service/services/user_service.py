@@ -1,31 +1,65 @@
 # services/user-service/services/user_service.py
-from typing import List, Optional
+import inspect
+from datetime import datetime
+from typing import List, Optional, Tuple
+from fastapi.concurrency import run_in_threadpool
 from repositories.user_repository import UserRepository
 from models.user import User, UserCreate, UserUpdate
+from cache import ProfileCache
 
 class UserService:
-    def __init__(self, user_repository: UserRepository):
+    def __init__(self, user_repository: UserRepository, cache: Optional[ProfileCache] = None):
+        # UserRepository (psycopg2) или AsyncUserRepository (asyncpg) - см. DB_BACKEND
         self.user_repository = user_repository
+        # None - читаем напрямую из PostgreSQL (CACHE_ENABLED=false)
+        self.cache = cache
     
-    def get_user(self, user_id: str) -> Optional[User]:
-        return self.user_repository.get_user(user_id)
+    async def _run(self, method, *args):
+        # Синхронный репозиторий блокирует поток, поэтому уводим его в threadpool
+        if inspect.iscoroutinefunction(method):
+            return await method(*args)
+        return await run_in_threadpool(method, *args)
     
-    def get_user_by_phone(self, phone: str) -> Optional[User]:
-        return self.user_repository.get_user_by_phone(phone)
+    async def _cached(self, field: str, value: str, loader) -> Optional[User]:
+        if self.cache is None:
+            return await self._run(loader, value)
+        user = await self.cache.get(field, value)
+        if user is not None:
+            return user
+        generation = self.cache.generation
+        user = await self._run(loader, value)
+        if user is not None:
+            await self.cache.set(user, generation)
+        return user
     
-    def get_users(self, skip: int = 0, limit: int = 100) -> List[User]:
-        return self.user_repository.get_users(skip, limit)
+    async def get_user(self, user_id: str) -> Optional[User]:
+        return await self._cached("id", user_id, self.user_repository.get_user)
     
-    def create_user(self, user: UserCreate) -> User:
+    async def get_user_by_phone(self, phone: str) -> Optional[User]:
+        return await self._cached("phone", phone, self.user_repository.get_user_by_phone)
+    
+    async def get_users(self, skip: int = 0, limit: int = 100,
+                        after: Optional[Tuple[datetime, str]] = None) -> List[User]:
+        return await self._run(self.user_repository.get_users, skip, limit, after)
+    
+    async def create_user(self, user: UserCreate) -> User:
         # Проверяем, существует ли пользователь с таким телефоном
-        existing_user = self.user_repository.get_user_by_phone(user.phone)
+        existing_user = await self._run(self.user_repository.get_user_by_phone, user.phone)
         if existing_user:
             raise ValueError(f"User with phone {user.phone} already exists")
         
-        return self.user_repository.create_user(user)
+        return await self._run(self.user_repository.create_user, user)
     
-    def update_user(self, user_id: str, user: UserUpdate) -> Optional[User]:
-        return self.user_repository.update_user(user_id, user)
+    async def update_user(self, user_id: str, user: UserUpdate) -> Optional[User]:
+        updated_user = await self._run(self.user_repository.update_user, user_id, user)
+        if updated_user and self.cache:
+            await self.cache.invalidate(updated_user)
+        return updated_user
     
-    def delete_user(self, user_id: str) -> bool:
-        return self.user_repository.delete_user(user_id)
+    async def delete_user(self, user_id: str) -> bool:
+        # Телефон нужен, чтобы сбросить и второй ключ кэша
+        existing_user = await self._run(self.user_repository.get_user, user_id)
+        deleted = await self._run(self.user_repository.delete_user, user_id)
+        if existing_user and self.cache:
+            await self.cache.invalidate(existing_user)
+        return deleted